@@ -0,0 +1,209 @@
+import math
+import asyncio
+import statistics
+from typing import Dict, List, Optional
+
+# ---------------------- کنترل تطبیقی همزمانی و timeoutها ----------------------
+# Adaptive (AIMD) concurrency and per-stage timeout control for scans
+
+# timeout پیش‌فرض و حداقل هر مرحله (ثانیه)
+# Default and minimum timeout of every probe stage (seconds)
+STAGE_TIMEOUTS: Dict[str, float] = {"tcp": 3, "tls": 3, "http": 5, "ping": 1}
+STAGE_TIMEOUT_FLOORS: Dict[str, float] = {"tcp": 0.5, "tls": 1, "http": 1.5, "ping": 0.3}
+
+# مراحلی که نتیجه‌شان نشانه ازدحام است (پینگ اغلب فیلتر می‌شود و حساب نمی‌شود)
+# Stages whose outcomes signal congestion; ICMP is often filtered, so ping
+# only adapts its timeout and never moves the concurrency limit
+CONGESTION_STAGES = ("tcp", "tls", "http")
+
+# حداقل تعداد نتیجه در هر پنجره تصمیم‌گیری
+# Minimum number of outcomes per decision window
+MIN_WINDOW = 32
+
+# افزایش نرخ timeout یا تورم RTT که ازدحام حساب می‌شود
+# Timeout-rate increase over the baseline, or RTT inflation over the
+# minimum observed RTT, that counts as congestion
+TIMEOUT_MARGIN = 0.1
+RTT_INFLATION = 2.0
+
+# ضریب کاهش ضربی
+# Multiplicative decrease factor
+DECREASE_FACTOR = 0.7
+
+
+class StageTimeout:
+    """
+    تخمین timeout یک مرحله از RTTهای موفق (مشابه RTO در TCP)
+    Timeout estimator for one stage, RFC 6298 style: srtt + 4 * rttvar over
+    successful round trips, clamped between a floor and twice the default.
+    """
+
+    def __init__(self, initial: float, floor: float):
+        self.initial = initial
+        self.floor = floor
+        self.value = initial
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+
+    def observe(self, rtt: float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.value = min(self.initial * 2, max(self.floor, self.srtt + 4 * self.rttvar))
+
+
+class AdaptiveController:
+    """
+    کنترل‌کننده AIMD برای تعداد بررسی‌های همزمان و timeout هر مرحله
+    AIMD controller for in-flight checks and per-stage timeouts. Starts in
+    slow start (doubling per window), then grows additively; when the
+    timeout rate rises above its baseline or RTTs inflate, the limit is cut
+    multiplicatively. Used as an async context manager around each check.
+    With adaptive=False it keeps the initial limit and default timeouts.
+    """
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 4,
+        max_limit: int = 256,
+        adaptive: bool = True,
+        ceiling: Optional[int] = None,
+    ):
+        self.adaptive = adaptive
+        # سقف بیرونی (سهم از بودجه مشترک)؛ حد اعمال‌شده از آن بیشتر نمی‌شود
+        # External cap, e.g. the job's share of the shared budget; the
+        # enforced and reported limit never exceeds it
+        self.ceiling = ceiling
+        self.min_limit = min(min_limit, initial)
+        self.max_limit = max(max_limit, initial) if adaptive else initial
+        self.limit = initial
+        self.in_flight = 0
+        self.slow_start = True
+        self.decision = "start"
+        self.timers = {
+            stage: StageTimeout(initial_timeout, STAGE_TIMEOUT_FLOORS[stage])
+            for stage, initial_timeout in STAGE_TIMEOUTS.items()
+        }
+        self.timeout_rate = 0.0
+        self._baseline_rate: Optional[float] = None
+        self._min_rtt: Optional[float] = None
+        self._outcomes = 0
+        self._timeouts = 0
+        self._rtts: List[float] = []
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def cond(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def __aenter__(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.effective_limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    @property
+    def effective_limit(self) -> int:
+        """
+        حد اعمال‌شده: حد AIMD محدود به سقف بیرونی
+        The enforced limit: the AIMD limit clamped to the ceiling
+        """
+        if self.ceiling is None:
+            return self.limit
+        return max(1, min(self.limit, self.ceiling))
+
+    def timeout(self, stage: str) -> float:
+        """
+        timeout فعلی یک مرحله (ثانیه)
+        Current timeout of a stage, in seconds
+        """
+        return self.timers[stage].value
+
+    def record(self, stage: str, rtt_ms: Optional[float] = None, timed_out: bool = False):
+        """
+        ثبت نتیجه یک مرحله: RTT موفق یا timeout
+        Record one stage outcome: a successful RTT, a timeout, or neither
+        (a fast failure such as a refused connection)
+        """
+        if not self.adaptive:
+            return
+        if rtt_ms is not None:
+            self.timers[stage].observe(rtt_ms / 1000)
+        if stage not in CONGESTION_STAGES:
+            return
+        self._outcomes += 1
+        if timed_out:
+            self._timeouts += 1
+        if rtt_ms is not None:
+            self._rtts.append(rtt_ms)
+        if self._outcomes >= max(MIN_WINDOW, self.limit // 2):
+            self._adjust()
+
+    def _adjust(self):
+        # حد بالاتر از سقف کاهش را بی‌اثر می‌کند
+        # A limit above the ceiling would make decreases ineffective
+        self.limit = self.effective_limit
+        rate = self._timeouts / self._outcomes
+        window_rtt = statistics.median(self._rtts) if self._rtts else None
+        if window_rtt is not None:
+            self._min_rtt = window_rtt if self._min_rtt is None else min(self._min_rtt, window_rtt)
+        if self._baseline_rate is None:
+            self._baseline_rate = rate
+
+        # خط پایه میانگین نرخ timeout در پنجره‌های بدون ازدحام است
+        # تا میزبان‌های همیشه خاموش ازدحام حساب نشوند
+        # The baseline is the average timeout rate of uncongested windows, so
+        # targets that always time out are not mistaken for congestion; the
+        # margin also covers the sampling noise of a small window
+        base = self._baseline_rate
+        margin = max(TIMEOUT_MARGIN, 3 * math.sqrt(base * (1 - base) / self._outcomes))
+        if rate > base + margin:
+            self._decrease(f"timeouts {rate:.0%}")
+        elif window_rtt is not None and window_rtt > RTT_INFLATION * self._min_rtt:
+            self._decrease(f"rtt {window_rtt:.0f} ms")
+        else:
+            self._baseline_rate = 0.9 * base + 0.1 * rate
+            top = self.max_limit if self.ceiling is None else min(self.max_limit, self.ceiling)
+            if self.limit < top:
+                self.limit = min(top, self.limit * 2 if self.slow_start else self.limit + 1)
+                self.decision = "increase"
+            else:
+                self.decision = "hold"
+
+        self.timeout_rate = rate
+        self._outcomes = self._timeouts = 0
+        self._rtts = []
+
+    def _decrease(self, reason: str):
+        self.limit = max(self.min_limit, int(self.limit * DECREASE_FACTOR))
+        self.slow_start = False
+        self.decision = f"decrease ({reason})"
+
+    def snapshot(self) -> Dict:
+        """
+        وضعیت فعلی کنترل‌کننده برای نمایش در پیشرفت اسکن
+        Current decisions, for the progress output
+        """
+        return {
+            "limit": self.effective_limit,
+            "ceiling": self.ceiling,
+            "in_flight": self.in_flight,
+            "phase": "slow_start" if self.slow_start else "avoidance",
+            "decision": self.decision,
+            "timeout_rate": round(self.timeout_rate, 3),
+            "timeouts": {stage: round(timer.value, 2) for stage, timer in self.timers.items()},
+        }
+
+
+# کنترل‌کننده ثابت برای فراخوانی‌های بدون اسکن (فقط timeoutهای پیش‌فرض)
+# Fixed controller for calls made outside a scan: default timeouts only
+FIXED_CONTROLLER = AdaptiveController(adaptive=False)
@@ -0,0 +1,492 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import ipaddress
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+# ---------------------- بنچمارک اسکنر با سرورهای جایگزین محلی ----------------------
+# Reproducible scanner benchmark against local stand-in TLS/HTTP endpoints
+#
+#   python -m backend.bench --modes ip-tcp,ip-tls,domains --json bench.json
+#
+# سرورها روی پورت 443 آدرس‌های loopback اجرا می‌شوند (نیازمند root یا
+# net.ipv4.ip_unprivileged_port_start=443)
+# Stand-ins listen on port 443 of loopback addresses, which needs root or
+# net.ipv4.ip_unprivileged_port_start=443. Loopback connects are instant,
+# so the simulated RTT is added per server flight (TLS and HTTP); for real
+# wire RTT and loss, pass --range with addresses of a network namespace
+# whose veth carries a `tc qdisc ... netem` delay.
+
+# دامنه نام‌های مصنوعی و رنج پیش‌فرض میزبان‌ها
+# Synthetic name suffix and the default stand-in host range
+BENCH_DOMAIN = "bench.test"
+DEFAULT_RANGE = "127.77.0.0/20"
+
+# پروفایل پیش‌فرض شبکه شبیه‌سازی‌شده
+# Default simulated network profile (fractions are of all range addresses,
+# tls_fail / slow / loss of the live hosts or their connections)
+DEFAULT_PROFILE: Dict = {
+    "range": DEFAULT_RANGE,
+    "live": 0.5,
+    "blackhole": 0.1,
+    "tls_fail": 0.1,
+    "slow": 0.05,
+    "slow_ms": 8000,
+    "rtt_ms": 20,
+    "loss": 0.01,
+    "domains": 400,
+    "seed": 1,
+}
+
+# حالت‌های اسکن قابل اندازه‌گیری
+# Scan modes the harness can measure
+MODES: Dict[str, Dict] = {
+    "ip-tcp": {"kind": "ip", "use_tls_check": False, "sampling": True, "adaptive": True},
+    "ip-tls": {"kind": "ip", "use_tls_check": True, "sampling": True, "adaptive": True},
+    "ip-walk": {"kind": "ip", "use_tls_check": True, "sampling": False, "adaptive": True},
+    "ip-fixed": {"kind": "ip", "use_tls_check": True, "sampling": True, "adaptive": False},
+    "domains": {"kind": "domains", "adaptive": True},
+}
+
+# فاصله نمونه‌برداری تأخیر حلقه رویداد (ثانیه)
+# Event-loop lag sampling interval (seconds)
+LAG_INTERVAL = 0.05
+
+
+class StandInFleet:
+    """
+    سرورهای جایگزین محلی با رفتار قابل تنظیم برای هر میزبان
+    Loopback stand-in servers. Every address of the range gets a role drawn
+    from a seeded RNG: live (TLS + HTTP, optionally failing TLS or answering
+    slowly), blackholed (SYNs are dropped, so connects time out) or absent
+    (connects are refused). Also serves the synthetic range and domain
+    lists over plain HTTP for the source fetchers.
+    """
+
+    def __init__(self, profile: Dict, workdir: str):
+        self.profile = profile
+        self.workdir = workdir
+        self.rng = random.Random(profile["seed"])
+        self.roles: Dict[str, str] = {}
+        self.domains: Dict[str, List[str]] = {}
+        self.ssl_context = None
+        self.ca_path: Optional[str] = None
+        self.sources_url = ""
+        self._servers: List[asyncio.AbstractServer] = []
+        self._tasks: set = set()
+        self._sockets: List[socket.socket] = []
+        self._files: Dict[str, bytes] = {}
+        self._plan()
+
+    def _plan(self):
+        network = ipaddress.ip_network(self.profile["range"])
+        for address in network.hosts():
+            draw = self.rng.random()
+            if draw < self.profile["live"]:
+                role = "live"
+                if self.rng.random() < self.profile["tls_fail"]:
+                    role = "tls_fail"
+                elif self.rng.random() < self.profile["slow"]:
+                    role = "slow"
+            elif draw < self.profile["live"] + self.profile["blackhole"]:
+                role = "blackhole"
+            else:
+                continue
+            self.roles[str(address)] = role
+        hosts = [str(address) for address in network.hosts()]
+        for i in range(self.profile["domains"]):
+            # یک‌چهارم نام‌ها resolve نمی‌شوند
+            # A quarter of the names don't resolve
+            addresses = [] if self.rng.random() < 0.25 else [self.rng.choice(hosts)]
+            self.domains[f"d{i}.{BENCH_DOMAIN}"] = addresses
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for role in self.roles.values():
+            counts[role] = counts.get(role, 0) + 1
+        return counts
+
+    def _make_certificate(self) -> bool:
+        # گواهی خودامضا برای همه نام‌های SNI که اسکنر استفاده می‌کند
+        # Self-signed certificate for every SNI the scanner uses; the scan
+        # processes trust it explicitly
+        from .utils import CLOUDFLARE_DOMAINS, FASTLY_DOMAINS
+
+        names = [f"DNS:*.{BENCH_DOMAIN}"] + [
+            f"IP:{name}" if _is_ip(name) else f"DNS:{name}"
+            for name in dict.fromkeys(FASTLY_DOMAINS + CLOUDFLARE_DOMAINS)
+        ]
+        cert = os.path.join(self.workdir, "standin.pem")
+        key = os.path.join(self.workdir, "standin.key")
+        try:
+            subprocess.run(
+                [
+                    "openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                    "-nodes", "-days", "2", "-subj", "/CN=scanner bench",
+                    "-addext", "subjectAltName=" + ",".join(names),
+                    "-addext", "keyUsage=critical,digitalSignature,keyCertSign",
+                    "-addext", "extendedKeyUsage=serverAuth",
+                    "-keyout", key, "-out", cert,
+                ],
+                check=True,
+                capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"[!] openssl not usable, TLS stand-ins disabled: {e}")
+            return False
+        import ssl
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        context.set_alpn_protocols(["http/1.1"])
+        self.ssl_context = context
+        self.ca_path = cert
+        return True
+
+    async def start(self):
+        self._make_certificate()
+        network = ipaddress.ip_network(self.profile["range"])
+        cidrs = [str(net) for net in network.subnets(new_prefix=max(network.prefixlen, 24))]
+        self._files["/ranges.txt"] = "\n".join(cidrs).encode()
+        self._files["/domains.txt"] = "\n".join(self.domains).encode()
+        source = await asyncio.start_server(self._serve_file, "127.0.0.1", 0)
+        self._servers.append(source)
+        port = source.sockets[0].getsockname()[1]
+        self.sources_url = f"http://127.0.0.1:{port}"
+
+        for host, role in self.roles.items():
+            listener = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((host, 443))
+            self._sockets.append(listener)
+            if role == "blackhole":
+                # صف accept پر می‌ماند، پس SYNهای بعدی دور ریخته می‌شوند
+                # A listener with a full accept queue: later SYNs are dropped
+                listener.listen(0)
+                self._sockets.append(socket.create_connection((host, 443), timeout=1))
+            else:
+                listener.listen(512)
+                listener.setblocking(False)
+                self._spawn(self._accept(listener, role))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _accept(self, listener: socket.socket, role: str):
+        # پذیرش دستی تا TLS پس از تأخیر RTT روی سوکت آغاز شود
+        # Accept by hand, so TLS starts on the raw socket after the RTT delay
+        loop = asyncio.get_running_loop()
+        while True:
+            conn, _ = await loop.sock_accept(listener)
+            self._spawn(self._serve_host(conn, role))
+
+    async def _serve_file(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ")[1].decode()
+            body = self._files.get(path)
+            status = "200 OK" if body is not None else "404 Not Found"
+            body = body or b""
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_host(self, conn: socket.socket, role: str):
+        loop = asyncio.get_running_loop()
+        rtt = self.profile["rtt_ms"] / 1000
+        writer = None
+        try:
+            if role == "tls_fail" or self.ssl_context is None:
+                return
+            if self.rng.random() < self.profile["loss"]:
+                # اتصال گم‌شده: هیچ پاسخی ارسال نمی‌شود
+                # A lost connection: nothing is ever answered
+                while await loop.sock_recv(conn, 4096):
+                    pass
+                return
+            await asyncio.sleep(rtt)
+            reader = asyncio.StreamReader()
+            protocol = asyncio.StreamReaderProtocol(reader)
+            transport, _ = await loop.connect_accepted_socket(
+                lambda: protocol, conn, ssl=self.ssl_context
+            )
+            writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+            await reader.readuntil(b"\r\n\r\n")
+            delay = rtt + (self.profile["slow_ms"] / 1000 if role == "slow" else 0)
+            await asyncio.sleep(delay)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            if writer is not None:
+                writer.close()
+            else:
+                conn.close()
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for server in self._servers:
+            server.close()
+        for sock in self._sockets:
+            sock.close()
+        await asyncio.gather(*(server.wait_closed() for server in self._servers), return_exceptions=True)
+
+    def setup(self) -> Dict:
+        """
+        تنظیمات لازم برای پردازه اسکن (مسیرها، منابع، نام‌ها)
+        Everything a scan process needs: work dir, CA, sources and names
+        """
+        return {
+            "workdir": self.workdir,
+            "range": self.profile["range"],
+            "ca_path": self.ca_path,
+            "ranges_url": self.sources_url + "/ranges.txt",
+            "domains_url": self.sources_url + "/domains.txt",
+            "domains": self.domains,
+        }
+
+
+def _is_ip(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _isolate(setup: Dict, mode: str):
+    # پردازه اسکن فقط فایل‌ها و منابع مصنوعی را می‌بیند
+    # Point the scan process at the synthetic files, sources and a scratch
+    # verdict store, and trust the stand-in certificate
+    from . import sources, source_cache, store
+    from .probes import REALITY_CONTEXT, TLS_CONTEXT
+    from .resolver import get_resolver
+
+    workdir = setup["workdir"]
+    ranges_file = os.path.join(workdir, "bench_ranges.json")
+    ip_sources = os.path.join(workdir, "ip_sources.json")
+    domain_sources = os.path.join(workdir, "domain_sources.json")
+    with open(ranges_file, "w", encoding="utf-8") as f:
+        json.dump([setup["range"]], f)
+    with open(ip_sources, "w", encoding="utf-8") as f:
+        json.dump([{"url": setup["ranges_url"], "provider": "fastly", "format": "cidr"}], f)
+    with open(domain_sources, "w", encoding="utf-8") as f:
+        json.dump([{"url": setup["domains_url"], "format": "text"}], f)
+    sources.IP_RANGE_FILES = {"fastly": ranges_file}
+    sources.IP_DATA_FILE = ip_sources
+    sources.DOMAIN_DATA_FILE = domain_sources
+    source_cache.CACHE_DIR = os.path.join(workdir, f"cache-{mode}")
+    os.makedirs(source_cache.CACHE_DIR, exist_ok=True)
+    store._store = store.VerdictStore(os.path.join(workdir, f"verdicts-{mode}.sqlite3"))
+    if setup["ca_path"]:
+        TLS_CONTEXT.load_verify_locations(setup["ca_path"])
+        REALITY_CONTEXT.load_verify_locations(setup["ca_path"])
+    resolver = get_resolver()
+    for name, addresses in setup["domains"].items():
+        resolver.pin(name, addresses)
+
+
+async def _measure(mode: str, setup: Dict, concurrency: int, required_count: int) -> Dict:
+    from .sources import get_active_domain_source_entries
+    from .utils import DomainScanner, get_clean_ips_with_lowest_ping
+
+    options = MODES[mode]
+    progress: Dict = {"timings": []}
+    lags: List[float] = []
+    loop = asyncio.get_running_loop()
+
+    async def watch_lag():
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            lags.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+    watcher = asyncio.create_task(watch_lag())
+    start = time.perf_counter()
+    try:
+        if options["kind"] == "ip":
+            found = await get_clean_ips_with_lowest_ping(
+                "fastly",
+                required_count=required_count,
+                progress=progress,
+                concurrency=concurrency,
+                use_tls_check=options["use_tls_check"],
+                verdict_ttl=0,
+                adaptive=options["adaptive"],
+                sampling=options["sampling"],
+            )
+        else:
+            scanner = DomainScanner(concurrency, verdict_ttl=0, adaptive=options["adaptive"])
+            domains = await scanner.fetch_all_from_sources(get_active_domain_source_entries(), progress=progress)
+            found = await scanner.scan_items(list(domains), progress=progress)
+    finally:
+        watcher.cancel()
+    elapsed = time.perf_counter() - start
+    timings = progress["timings"]
+    controller = progress.get("controller")
+    return {
+        "mode": mode,
+        "targets": progress.get("done", 0),
+        "found": len(found),
+        "seconds": round(elapsed, 2),
+        "targets_per_s": round(progress.get("done", 0) / elapsed, 1) if elapsed else None,
+        "verdict_p50_ms": _ms(_percentile(timings, 0.5)),
+        "verdict_p99_ms": _ms(_percentile(timings, 0.99)),
+        "peak_rss_mb": _peak_rss_mb(),
+        "loop_lag_p99_ms": _ms(_percentile(lags, 0.99)),
+        "loop_lag_max_ms": _ms(max(lags) if lags else None),
+        "final_limit": controller.limit if controller is not None else None,
+    }
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss از پردازه والد به ارث می‌رسد؛ VmHWM پس از exec از صفر شروع می‌شود
+    # ru_maxrss survives fork + exec (it would report the parent's peak);
+    # VmHWM belongs to the process's own address space
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _run_mode(mode: str, setup: Dict, concurrency: int, required_count: int, verbose: bool) -> Dict:
+    # هر حالت در پردازه جدا اجرا می‌شود تا RSS و کش‌ها مستقل باشند
+    # Each mode runs in a fresh process, so peak RSS and caches are its own
+    from .logs import setup_logging
+
+    _isolate(setup, mode)
+    # بدون --verbose فقط هشدارها؛ پردازه‌های shard سطح را از محیط می‌گیرند
+    # Without --verbose only warnings are logged; shard processes pick the
+    # level up from the environment
+    if not verbose:
+        os.environ["SCANNER_LOG_LEVEL"] = "WARNING"
+    setup_logging()
+    return asyncio.run(_measure(mode, setup, concurrency, required_count))
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run_benchmark(
+    modes: List[str],
+    profile: Dict,
+    concurrency: int = 50,
+    required_count: Optional[int] = None,
+    verbose: bool = False,
+) -> Dict:
+    """
+    اجرای حالت‌های اسکن روی سرورهای جایگزین و گزارش معیارها
+    Start the stand-ins, run every mode in its own process and collect
+    targets/s, p50/p99 time per verdict, peak RSS and event-loop lag.
+    required_count defaults to every live host, so scans run to the end.
+    """
+    _raise_fd_limit()
+    workdir = tempfile.mkdtemp(prefix="scanner-bench-")
+    fleet = StandInFleet(profile, workdir)
+    try:
+        await fleet.start()
+    except PermissionError:
+        await fleet.stop()
+        sys.exit("[!] Binding port 443 needs root or net.ipv4.ip_unprivileged_port_start=443")
+    print(f"[+] Stand-ins on {profile['range']}: {fleet.counts()}")
+    required_count = required_count or len(fleet.roles) + 1
+    loop = asyncio.get_running_loop()
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        for mode in modes:
+            if fleet.ca_path is None and (MODES[mode]["kind"] == "domains" or MODES[mode].get("use_tls_check")):
+                print(f"[!] Skipping {mode}: needs TLS stand-ins")
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = await loop.run_in_executor(
+                    pool, _run_mode, mode, fleet.setup(), concurrency, required_count, verbose
+                )
+            print(_format(result))
+            results.append(result)
+    finally:
+        await fleet.stop()
+    return {
+        "profile": profile,
+        "concurrency": concurrency,
+        "hosts": fleet.counts(),
+        "created_at": time.time(),
+        "results": results,
+    }
+
+
+def _format(result: Dict) -> str:
+    return (
+        f"[✓] {result['mode']:<9} {result['targets']:>6} targets in {result['seconds']:>7}s  "
+        f"{result['targets_per_s']:>8}/s  verdict p50 {result['verdict_p50_ms']} ms  "
+        f"p99 {result['verdict_p99_ms']} ms  rss {result['peak_rss_mb']} MB  "
+        f"lag p99 {result['loop_lag_p99_ms']} ms  max {result['loop_lag_max_ms']} ms  "
+        f"found {result['found']}"
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Scanner benchmark against local stand-in endpoints")
+    parser.add_argument("--modes", default="ip-tcp,ip-tls,domains", help=f"comma list of {', '.join(MODES)}")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--required-count", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the scanners' per-target output")
+    for key, value in DEFAULT_PROFILE.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+    profile = {key: getattr(args, key) for key in DEFAULT_PROFILE}
+    report = asyncio.run(
+        run_benchmark(modes, profile, args.concurrency, args.required_count, args.verbose)
+    )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Report written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .progress import ProgressSignal, notify
+from .metrics import BUDGET_IN_FLIGHT, JOBS_RUNNING
+from .logs import get_logger
+
+log = get_logger("jobs")
+
+# ---------------------- مدیریت چند اسکن همزمان ----------------------
+# Scan job manager: job IDs, per-job state and a shared concurrency budget
+
+# سقف کل بررسی‌های همزمان بین همه اسکن‌ها (متغیر محیطی SCANNER_SCAN_BUDGET)
+# Upper bound on in-flight checks across all running scans; set with
+# SCANNER_SCAN_BUDGET. The default admits one job at the API's maximum
+# concurrency (500).
+DEFAULT_SCAN_BUDGET = int(os.environ.get("SCANNER_SCAN_BUDGET", 512))
+
+# تعداد اسکن‌های پایان‌یافته که برای دریافت نتیجه نگه داشته می‌شوند
+# Finished jobs kept around for status and result retrieval
+KEEP_FINISHED = 50
+
+
+class ConcurrencyBudget:
+    """
+    بودجه مشترک همزمانی با تقسیم منصفانه بین اسکن‌های فعال
+    Global in-flight budget shared by every running job. Each job may hold
+    at most an equal share (total // active jobs) so a large scan cannot
+    starve a small one; a job running alone gets the whole budget.
+    """
+
+    def __init__(self, total: int = DEFAULT_SCAN_BUDGET):
+        self.total = total
+        self.in_flight = 0
+        self._jobs: Dict[str, int] = {}
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def cond(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def share(self) -> int:
+        return max(1, self.total // max(1, len(self._jobs)))
+
+    def register(self, job_id: str):
+        self._jobs.setdefault(job_id, 0)
+
+    async def unregister(self, job_id: str):
+        self._jobs.pop(job_id, None)
+        async with self.cond:
+            self.cond.notify_all()
+
+    async def acquire(self, job_id: str):
+        async with self.cond:
+            await self.cond.wait_for(
+                lambda: self.in_flight < self.total and self._jobs.get(job_id, 0) < self.share()
+            )
+            self.in_flight += 1
+            self._jobs[job_id] = self._jobs.get(job_id, 0) + 1
+            BUDGET_IN_FLIGHT.set(self.in_flight)
+
+    async def release(self, job_id: str):
+        async with self.cond:
+            self.in_flight -= 1
+            BUDGET_IN_FLIGHT.set(self.in_flight)
+            if job_id in self._jobs:
+                self._jobs[job_id] -= 1
+            self.cond.notify_all()
+
+    def limiter(self, job_id: str) -> "JobLimiter":
+        return JobLimiter(self, job_id)
+
+
+class JobLimiter:
+    """
+    محدودکننده یک اسکن روی بودجه مشترک (async context manager)
+    One job's view of the budget; run_worker_pool holds it around each check
+    """
+
+    def __init__(self, budget: ConcurrencyBudget, job_id: str):
+        self.budget = budget
+        self.job_id = job_id
+
+    def share(self) -> int:
+        """
+        سهم فعلی این اسکن از بودجه
+        The job's current share of the budget: the most checks it may run
+        """
+        return self.budget.share()
+
+    async def __aenter__(self):
+        await self.budget.acquire(self.job_id)
+
+    async def __aexit__(self, *exc):
+        await self.budget.release(self.job_id)
+
+
+class ScanJob:
+    """
+    یک اسکن با شناسه، پارامترها و وضعیت مستقل
+    One scan with its own ID, parameters and progress state
+    """
+
+    def __init__(self, job_type: str, params: Dict, limiter: JobLimiter):
+        self.id = limiter.job_id
+        self.type = job_type
+        self.params = params
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.state: Dict = {
+            "total": 0,
+            "done": 0,
+            "results": [],
+            "skipped": 0,
+            "ranked": None,
+            "cancel": False,
+            "running": True,
+            "signal": ProgressSignal(),
+            "limiter": limiter,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self.state["running"]
+
+    @property
+    def results(self) -> List[str]:
+        ranked = self.state.get("ranked")
+        return ranked if ranked is not None else self.state["results"]
+
+    def summary(self) -> Dict:
+        controller = self.state.get("controller")
+        sampler = self.state.get("sampler")
+        shards = self.state.get("shards")
+        pipeline = self.state.get("pipeline")
+        return {
+            "job_id": self.id,
+            "type": self.type,
+            "params": self.params,
+            "running": self.running,
+            "cancel": self.state["cancel"],
+            "total": self.state["total"],
+            "done": self.state["done"],
+            "skipped": self.state.get("skipped", 0),
+            "results_count": len(self.results),
+            "adaptive": controller.snapshot() if controller is not None else None,
+            "sampling": sampler.snapshot() if sampler is not None else None,
+            "shards": shards.snapshot() if shards is not None else None,
+            "pipeline": pipeline.snapshot() if pipeline is not None else None,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    اجرای چند اسکن همزمان زیر یک بودجه مشترک همزمانی
+    Runs scans as asyncio tasks under a shared ConcurrencyBudget and keeps
+    them addressable by job ID for status, results and cancellation.
+    """
+
+    def __init__(self, budget: Optional[ConcurrencyBudget] = None, keep_finished: int = KEEP_FINISHED):
+        self.budget = budget or ConcurrencyBudget()
+        self.keep_finished = keep_finished
+        self.jobs: "OrderedDict[str, ScanJob]" = OrderedDict()
+
+    def start(self, job_type: str, runner: Callable[[Dict], Awaitable], params: Dict) -> ScanJob:
+        """
+        شروع یک اسکن جدید؛ runner وضعیت پیشرفت اسکن را دریافت می‌کند
+        Start a new job; runner receives the job's progress state
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job = ScanJob(job_type, params, self.budget.limiter(job_id))
+        self.jobs[job_id] = job
+        self.budget.register(job_id)
+        job.task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    async def _run(self, job: ScanJob, runner: Callable[[Dict], Awaitable]):
+        log.info("Job %s started: %s %s", job.id, job.type, job.params, extra={"job": job.id})
+        JOBS_RUNNING.inc(job.type)
+        try:
+            await runner(job.state)
+        except asyncio.CancelledError:
+            job.state["cancel"] = True
+        except Exception as e:
+            job.error = str(e)
+            log.error("Job %s failed: %s", job.id, e, exc_info=True, extra={"job": job.id})
+        finally:
+            job.state["running"] = False
+            job.finished_at = time.time()
+            JOBS_RUNNING.dec(job.type)
+            notify(job.state)
+            await self.budget.unregister(job.id)
+            log.info("Job %s finished, results: %d", job.id, len(job.results), extra={"job": job.id})
+            self._prune()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if not job.running]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        return self.jobs.get(job_id)
+
+    def latest(self, job_type: str) -> Optional[ScanJob]:
+        """
+        آخرین اسکن از یک نوع (برای سازگاری با API قبلی)
+        Most recently started job of a type, for the type-based endpoints
+        """
+        for job in reversed(self.jobs.values()):
+            if job.type == job_type:
+                return job
+        return None
+
+    def list_jobs(self) -> List[ScanJob]:
+        return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        درخواست لغو یک اسکن (توقف پس از بررسی‌های در حال اجرا)
+        Ask a job to stop; in-flight checks finish, no new ones start
+        """
+        job = self.jobs.get(job_id)
+        if job is None or not job.running:
+            return False
+        job.state["cancel"] = True
+        notify(job.state)
+        return True
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """
+    نمونه مشترک مدیر اسکن‌ها
+    Shared job manager instance
+    """
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Dict, Optional, Tuple
+
+# ---------------------- لاگ ساخت‌یافته و غیرمسدودکننده ----------------------
+# Structured, non-blocking logging for the scan pipeline
+#
+# رکوردها در حلقه رویداد فقط در صف قرار می‌گیرند و یک thread جدا آن‌ها را می‌نویسد
+# Records are only enqueued on the event loop; a listener thread formats
+# and writes them. Configured by setup_logging() or the environment:
+#   SCANNER_LOG_LEVEL=INFO             base level
+#   SCANNER_LOG_LEVELS=tls=DEBUG,ip=WARNING   per-stage levels
+#   SCANNER_LOG_JSON=1                 one JSON object per line
+#   SCANNER_LOG_SUMMARY=5              failure summary interval (s, 0 = off)
+
+ROOT = "scanner"
+
+# رنگ‌ها برای خروجی ترمینال
+# Terminal color codes
+GREEN = "\033[92m"
+RED = "\033[91m"
+YELLOW = "\033[93m"
+CYAN = "\033[96m"
+PURPLE = "\033[95m"
+GRAY = "\033[90m"
+RESET = "\033[0m"
+
+LEVEL_COLORS = {logging.DEBUG: GRAY, logging.WARNING: YELLOW, logging.ERROR: RED, logging.CRITICAL: RED}
+EVENT_COLORS = {"clean": PURPLE, "alive": GREEN, "reachable": CYAN}
+
+# رویدادهای شکست تکراری که در بازه‌های زمانی خلاصه می‌شوند
+# Repetitive per-target failures that are counted and reported as a
+# periodic summary instead of one line each
+AGGREGATED_EVENTS = frozenset({
+    "unreachable", "rejected", "tls_failed", "tls_deadline", "unresolved", "blocked",
+})
+
+# فیلدهای اضافه‌ای که در خروجی JSON آورده می‌شوند
+# Extra record fields carried into JSON output
+JSON_FIELDS = ("event", "target", "reason", "sni", "count", "job")
+
+DEFAULT_SUMMARY_INTERVAL = 5.0
+
+
+def get_logger(stage: str) -> logging.Logger:
+    """
+    لاگر یک مرحله (سطح آن جداگانه قابل تنظیم است)
+    Logger of one pipeline stage ("ip", "tls", "domain", ...); every stage
+    can be given its own level
+    """
+    return logging.getLogger(f"{ROOT}.{stage}")
+
+
+class FailureAggregator(logging.Filter):
+    """
+    خلاصه‌سازی شکست‌های تکراری: شمارش و گزارش دوره‌ای
+    Drops records of AGGREGATED_EVENTS and counts them per (logger, event,
+    reason); every `interval` seconds one "N <event> in the last Ns"
+    record per key is emitted instead. Runs on the logging caller before
+    enqueueing, so dropped records cost only a dict update.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SUMMARY_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._counts: Dict[Tuple[str, str, str], int] = {}
+        self._since = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event not in AGGREGATED_EVENTS or getattr(record, "summary", False):
+            return True
+        key = (record.name, event, getattr(record, "reason", "") or "")
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            due = time.monotonic() - self._since >= self.interval
+        if due:
+            self.flush()
+        return False
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            elapsed = time.monotonic() - self._since
+            self._since = time.monotonic()
+        for (name, event, reason), count in counts.items():
+            suffix = f" ({reason})" if reason else ""
+            logging.getLogger(name).info(
+                "%d %s%s in the last %.0fs", count, event.replace("_", " "), suffix, elapsed,
+                extra={"event": event, "reason": reason, "count": count, "summary": True},
+            )
+
+
+class ColorFormatter(logging.Formatter):
+    """
+    خروجی خوانا با رنگ بر اساس سطح و نوع رویداد
+    Human-readable lines, colored by level and event when writing to a TTY
+    """
+
+    def __init__(self, color: bool = True):
+        super().__init__("%(asctime)s %(levelname).1s %(name)s: %(message)s", "%H:%M:%S")
+        self.color = color
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        if not self.color:
+            return line
+        color = EVENT_COLORS.get(getattr(record, "event", None)) or LEVEL_COLORS.get(record.levelno)
+        return f"{color}{line}{RESET}" if color else line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    یک شیء JSON در هر خط
+    One JSON object per line, with the structured fields of the record
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in JSON_FIELDS:
+            value = getattr(record, field, None)
+            if value not in (None, ""):
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_aggregator: Optional[FailureAggregator] = None
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        stage, _, level = item.partition("=")
+        if stage.strip() and level.strip():
+            levels[stage.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    json_output: Optional[bool] = None,
+    stage_levels: Optional[Dict[str, str]] = None,
+    summary_interval: Optional[float] = None,
+    stream=None,
+):
+    """
+    پیکربندی لاگ اسکنر (قابل فراخوانی مکرر)
+    Configure the scanner loggers: a QueueHandler on the "scanner" logger,
+    a listener thread writing text or JSON lines, per-stage levels and the
+    failure aggregator. Arguments left as None come from the environment.
+    Calling it again replaces the previous setup.
+    """
+    global _listener, _aggregator
+    stop_logging()
+    level = level or os.environ.get("SCANNER_LOG_LEVEL", "INFO")
+    if json_output is None:
+        json_output = os.environ.get("SCANNER_LOG_JSON", "") not in ("", "0", "false")
+    if stage_levels is None:
+        stage_levels = _parse_levels(os.environ.get("SCANNER_LOG_LEVELS", ""))
+    if summary_interval is None:
+        summary_interval = float(os.environ.get("SCANNER_LOG_SUMMARY", DEFAULT_SUMMARY_INTERVAL))
+    stream = stream or sys.stdout
+
+    output = logging.StreamHandler(stream)
+    if json_output:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(ColorFormatter(color=hasattr(stream, "isatty") and stream.isatty()))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    if summary_interval > 0:
+        _aggregator = FailureAggregator(summary_interval)
+        handler.addFilter(_aggregator)
+
+    root = logging.getLogger(ROOT)
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    root.propagate = False
+    for stage, stage_level in stage_levels.items():
+        get_logger(stage).setLevel(stage_level)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+def flush_summaries():
+    """
+    ارسال فوری خلاصه شکست‌های شمارش‌شده (مثلاً در پایان اسکن)
+    Emit the pending failure summaries now, e.g. when a scan ends
+    """
+    if _aggregator is not None:
+        _aggregator.flush()
+
+
+def stop_logging():
+    """
+    ارسال خلاصه‌ها و توقف thread نویسنده
+    Flush the summaries and stop the listener thread
+    """
+    global _listener, _aggregator
+    flush_summaries()
+    if _listener is not None:
+        _listener.stop()
+    _listener = None
+    _aggregator = None
+
+
+atexit.register(stop_logging)
@@ -1,6 +1,7 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Body, Query
+import asyncio
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Literal, Optional
 
@@ -10,9 +11,16 @@ from .utils import (
     scan_manual_domains,
     scan_manual_ips,
     get_clean_ips_with_lowest_ping,
+    fetch_ip_ranges,
     DomainScanner,
 )
-from .sources import get_active_sources
+from .shards import default_shard_count, scan_domains_sharded, scan_ips_sharded
+from .sources import get_active_domain_source_entries
+from .store import DEFAULT_VERDICT_TTL, get_verdict_store
+from .progress import progress_delta, stream_progress
+from .jobs import get_job_manager
+from .metrics import monitor_loop_lag, render_metrics
+from .logs import setup_logging, stop_logging
 
 # ساخت اپلیکیشن FastAPI
 # Create FastAPI application
@@ -37,13 +45,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# وضعیت هر نوع اسکن (برای پیگیری پیشرفت)
-# Scan progress states for different types
-progress_states = {
-    "reality": {"total": 0, "done": 0, "results": [], "cancel": False, "running": False},
-    "fastly": {"total": 0, "done": 0, "results": [], "cancel": False, "running": False},
-    "cloudflare": {"total": 0, "done": 0, "results": [], "cancel": False, "running": False},
-}
+# مدیر اسکن‌ها: هر اسکن شناسه و وضعیت مستقل دارد
+# Job manager: every scan has its own ID and progress state
+jobs = get_job_manager()
+
+ScanType = Literal["reality", "fastly", "cloudflare"]
+PingMode = Literal["required", "info", "off"]
+
+# تسک پس‌زمینه اندازه‌گیری تأخیر حلقه رویداد
+# Background task sampling event-loop lag for /metrics
+_lag_monitor: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_lag_monitor():
+    global _lag_monitor
+    setup_logging()
+    _lag_monitor = asyncio.create_task(monitor_loop_lag())
+
+
+@app.on_event("shutdown")
+async def flush_logs():
+    stop_logging()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    متریک‌های اسکن با فرمت Prometheus
+    Scan metrics in the Prometheus text format: per-stage outcome counters
+    and latency histograms, source fetch durations, in-flight gauges and
+    event-loop lag
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _job_state(type: str, job_id: Optional[str] = None) -> dict:
+    """
+    وضعیت یک اسکن بر اساس شناسه، یا آخرین اسکن از آن نوع
+    Progress state of a job by ID, or of the latest job of a type
+    """
+    job = jobs.get(job_id) if job_id else jobs.latest(type)
+    if job is None:
+        if job_id:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+        return {"total": 0, "done": 0, "results": [], "cancel": False, "running": False}
+    return job.state
 
 
 class ManualScanRequest(BaseModel):
@@ -57,110 +104,262 @@ class ManualScanRequest(BaseModel):
 
 @app.get("/clean-items/auto/start")
 async def start_auto_scan(
-    background_tasks: BackgroundTasks,
-    type: Literal["reality", "fastly", "cloudflare"] = "reality",
+    type: ScanType = "reality",
     required_count: int = Query(2, ge=1, le=100),
     use_tls_check: bool = Query(True),
+    concurrency: int = Query(20, ge=1, le=500),
+    adaptive: bool = Query(True),
+    sampling: bool = Query(True),
+    include_ipv6: bool = Query(False),
+    shards: int = Query(1, ge=0, le=64),
+    ping_mode: PingMode = Query("required"),
+    verdict_ttl: int = Query(DEFAULT_VERDICT_TTL, ge=0),
 ):
     """
     شروع اسکن خودکار بر اساس نوع داده (Reality, Fastly, Cloudflare)
-    Start auto scanning process for domains or IPs
-    """
-    state = progress_states[type]
-    if state["running"]:
-        return {"status": "already_running"}
-
-    # ریست وضعیت اسکن
-    # Reset scan state
-    state.update({
-        "running": True,
-        "done": 0,
-        "total": 0,
-        "results": [],
-        "cancel": False,
-    })
-
-    async def run_scan(scan_type: str, state_: dict, required_count_: int, use_tls_check_: bool):
+    Start an auto scan job for domains or IPs. Several jobs may run at once;
+    together they stay within the global concurrency budget. With adaptive,
+    `concurrency` is only the starting point of the AIMD controller.
+    With shards > 1 the targets are split across that many worker
+    processes, each scanning with its own event loop and `concurrency`
+    (0 means one process per CPU core). ping_mode makes the IP ping check
+    required, informational (latency only) or skipped. Targets checked
+    within verdict_ttl seconds are answered from the verdict store; 0
+    checks everything again and stores nothing.
+    """
+    shards = shards or default_shard_count()
+    async def run_scan(state_: dict):
         # تابع داخلی برای اجرای اسکن پس‌زمینه
         # Internal function to run the scan as background task
-        print(f"[+] Scan started for {scan_type} with required_count={required_count_}, tls_check={use_tls_check_}")
-        try:
-            if scan_type == "reality":
-                scanner = DomainScanner()
-                sources = get_active_sources()
-                domains = await scanner.fetch_all_from_sources(sources, progress=state_)
-                await scanner.scan_items(domains, progress=state_)
+        if type == "reality":
+            scanner = DomainScanner(concurrency, verdict_ttl=verdict_ttl, adaptive=adaptive)
+            sources = get_active_domain_source_entries()
+            domains = await scanner.fetch_all_from_sources(sources, progress=state_)
+            if shards > 1:
+                state_["ranked"] = await scan_domains_sharded(
+                    domains, shards, state_, concurrency=concurrency, adaptive=adaptive, verdict_ttl=verdict_ttl
+                )
             else:
-                results = await get_clean_ips_with_lowest_ping(
-                    provider=scan_type,
-                    required_count=required_count_,
-                    progress=state_,
-                    use_tls_check=use_tls_check_,
+                state_["ranked"] = await scanner.scan_items(domains, progress=state_)
+        elif shards > 1:
+            ranges = await fetch_ip_ranges(type, progress=state_, concurrency=concurrency)
+            if ranges is not None:
+                state_["ranked"] = await scan_ips_sharded(
+                    type,
+                    ranges,
+                    shards,
+                    state_,
+                    required_count=required_count,
+                    concurrency=concurrency,
+                    use_tls_check=use_tls_check,
+                    adaptive=adaptive,
+                    sampling=sampling,
+                    include_ipv6=include_ipv6,
+                    ping_mode=ping_mode,
+                    verdict_ttl=verdict_ttl,
                 )
-                state_["results"] = results
-                state_["done"] = len(results)
-                state_["total"] = int(required_count_ * 2.5)  # تخمین تعداد کل بررسی‌شده / estimated
-        finally:
-            state_["running"] = False
-            print(f"[✓] Scan finished for {scan_type}, results: {len(state_['results'])}")
+        else:
+            results = await get_clean_ips_with_lowest_ping(
+                provider=type,
+                required_count=required_count,
+                progress=state_,
+                concurrency=concurrency,
+                use_tls_check=use_tls_check,
+                adaptive=adaptive,
+                sampling=sampling,
+                include_ipv6=include_ipv6,
+                ping_mode=ping_mode,
+                verdict_ttl=verdict_ttl,
+            )
+            state_["ranked"] = results
+
+    params = {
+        "required_count": required_count,
+        "use_tls_check": use_tls_check,
+        "concurrency": concurrency,
+        "adaptive": adaptive,
+        "sampling": sampling,
+        "include_ipv6": include_ipv6,
+        "shards": shards,
+        "ping_mode": ping_mode,
+        "verdict_ttl": verdict_ttl,
+    }
+    job = jobs.start(type, run_scan, params)
+    return {"status": "started", "job_id": job.id, "type": type, "requested": required_count}
 
-    # افزودن اسکن به تسک‌های پس‌زمینه
-    # Add scan to background tasks
-    background_tasks.add_task(run_scan, type, state, required_count, use_tls_check)
 
-    return {"status": "started", "type": type, "requested": required_count}
+@app.get("/jobs")
+async def list_jobs():
+    """
+    لیست اسکن‌های در حال اجرا و اخیراً پایان‌یافته
+    List running and recently finished scan jobs
+    """
+    return {
+        "budget": jobs.budget.total,
+        "in_flight": jobs.budget.in_flight,
+        "jobs": [job.summary() for job in jobs.list_jobs()],
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    وضعیت یک اسکن
+    Status of one scan job
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, details: bool = Query(False)):
+    """
+    نتایج یک اسکن (در صورت پایان، لیست رتبه‌بندی‌شده)
+    Results of one scan job; the ranked list once an IP scan has finished
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    response = {"job_id": job.id, "type": job.type, "running": job.running, "results": job.results}
+    if details:
+        all_details = job.state.get("details", {})
+        response["details"] = {item: all_details.get(item) for item in job.results}
+    return response
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    لغو یک اسکن
+    Cancel one scan job
+    """
+    if jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if not jobs.cancel(job_id):
+        return {"status": "not_running", "job_id": job_id}
+    return {"status": "canceled", "job_id": job_id}
 
 
 @app.get("/clean-items/auto/progress")
-async def get_progress(type: Literal["reality", "fastly", "cloudflare"] = "reality"):
+async def get_progress(
+    type: ScanType = "reality",
+    job_id: Optional[str] = None,
+    since: Optional[int] = Query(None, ge=0),
+):
     """
     دریافت وضعیت فعلی اسکن (مقدار پیشرفت، نتایج موقت و غیره)
-    Get current scan progress (done, total, partial results, etc.)
+    Get current scan progress (done, total, partial results, etc.).
+    With `since`, only results after that cursor are returned, together
+    with the next cursor to pass on the following call.
     """
-    state = progress_states[type]
+    state = _job_state(type, job_id)
+    if since is not None:
+        delta = progress_delta(state, since)
+        if not state["running"] and state.get("ranked") is not None:
+            delta["ranked"] = state["ranked"]
+        delta["type"] = type
+        return delta
+    results = state["ranked"] if state.get("ranked") is not None else state["results"]
     return {
         "total": state["total"],
         "done": state["done"],
-        "results_count": len(state["results"]),
-        "results": state["results"],
+        "results_count": len(results),
+        "results": results,
+        "skipped": state.get("skipped", 0),
+        "adaptive": state["controller"].snapshot() if state.get("controller") else None,
+        "sampling": state["sampler"].snapshot() if state.get("sampler") else None,
+        "shards": state["shards"].snapshot() if state.get("shards") else None,
+        "pipeline": state["pipeline"].snapshot() if state.get("pipeline") else None,
         "cancel": state["cancel"],
         "running": state["running"],
         "type": type,
     }
 
 
+@app.get("/clean-items/auto/stream")
+async def stream_scan_progress(
+    request: Request,
+    type: ScanType = "reality",
+    job_id: Optional[str] = None,
+    since: int = Query(0, ge=0),
+):
+    """
+    جریان رویداد (SSE) پیشرفت اسکن: فقط نتایج جدید و تغییرات شمارنده‌ها
+    Server-Sent Events feed of scan progress with only new results and
+    changed counters; a reconnect resumes from the Last-Event-ID cursor
+    """
+    last_id = request.headers.get("last-event-id")
+    if last_id and last_id.isdigit():
+        since = int(last_id)
+    return StreamingResponse(
+        stream_progress(_job_state(type, job_id), since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/clean-items/known")
+async def known_clean_items(
+    type: Literal["reality", "fastly", "cloudflare"] = "reality",
+    max_age: int = Query(DEFAULT_VERDICT_TTL, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    دریافت موارد پاکی که اخیراً بررسی شده‌اند (بدون اسکن جدید)
+    Return items found clean within max_age seconds, without scanning
+    """
+    items = get_verdict_store().known_clean(type, ttl=max_age, limit=limit)
+    return {"type": type, "max_age": max_age, "results": items}
+
+
 @app.post("/clean-items/auto/cancel")
-async def cancel_scan(type: Literal["reality", "fastly", "cloudflare"] = "reality"):
+async def cancel_scan(type: ScanType = "reality", job_id: Optional[str] = None):
     """
-    لغو اسکن خودکار در حال اجرا
-    Cancel an ongoing auto scan
+    لغو اسکن خودکار در حال اجرا (بر اساس شناسه یا آخرین اسکن از آن نوع)
+    Cancel an ongoing auto scan, by job ID or the latest job of the type
     """
-    state = progress_states[type]
-    if not state["running"]:
+    job = jobs.get(job_id) if job_id else jobs.latest(type)
+    if job is None or not jobs.cancel(job.id):
         return {"status": "not_running", "type": type}
-    state["cancel"] = True
-    return {"status": "canceled", "type": type}
+    return {"status": "canceled", "type": type, "job_id": job.id}
 
 
 @app.post("/clean-items/manual/check")
 async def manual_check(
     type: Literal["reality", "fastly", "cloudflare"] = Query("reality"),
     req: ManualScanRequest = Body(...),
+    ping_mode: PingMode = Query("required"),
+    verdict_ttl: int = Query(DEFAULT_VERDICT_TTL, ge=0),
 ):
     """
     اسکن دستی دامنه یا IP به تعداد دلخواه کاربر
-    Manually scan a list of domains or IPs based on selected type
+    Manually scan a list of domains or IPs based on selected type. IP
+    items past the manual address limit are not scanned and come back
+    under "rejected". verdict_ttl works as for auto scans (0 bypasses the
+    verdict store).
     """
     if not req.items:
         raise HTTPException(status_code=400, detail="List is empty")
 
     use_tls_check = req.use_tls_check if req.use_tls_check is not None else True
 
+    rejected: List[str] = []
     if type == "reality":
-        results = await scan_manual_domains(req.items)
+        results = await scan_manual_domains(req.items, verdict_ttl=verdict_ttl)
     elif type in ("fastly", "cloudflare"):
-        results = await scan_manual_ips(req.items, provider=type, use_tls_check=use_tls_check)
+        results = await scan_manual_ips(
+            req.items,
+            provider=type,
+            use_tls_check=use_tls_check,
+            ping_mode=ping_mode,
+            verdict_ttl=verdict_ttl,
+            rejected=rejected,
+        )
     else:
         raise HTTPException(status_code=400, detail=f"نوع نامعتبر: {type} / Invalid type")
 
-    return {"type": type, "results": results}
+    # آیتم‌هایی که به دلیل اندازه بررسی نشدند
+    # Items skipped for being over the manual scan limit
+    return {"type": type, "results": results, "rejected": rejected}
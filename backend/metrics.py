@@ -0,0 +1,197 @@
+import time
+import bisect
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# ---------------------- متریک‌های اسکن با فرمت Prometheus ----------------------
+# In-process scan metrics, rendered in the Prometheus text format
+
+# مرزهای هیستوگرام تأخیر مراحل (ثانیه)
+# Latency histogram buckets of the probe stages (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# فاصله اندازه‌گیری تأخیر حلقه رویداد (ثانیه)
+# Event-loop lag sampling interval (seconds)
+LAG_INTERVAL = 0.5
+
+Labels = Tuple[str, ...]
+
+_registry: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    پایه متریک‌ها: نام، توضیح و برچسب‌ها
+    Base of every metric: name, help text and label names. Recording is a
+    dict update keyed by the label values, cheap enough to stay always on.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # شمارش هر بازه (غیرتجمعی)، مجموع و تعداد به ازای هر برچسب
+        # Per label set: non-cumulative bucket counts, sum and count
+        self._values: Dict[Labels, List] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+# ---------------------- متریک‌های اسکنر ----------------------
+# Scanner metrics
+
+STAGE_TOTAL = Counter(
+    "scanner_stage_total",
+    "Probe stage outcomes (pass, fail, timeout) per scan type and stage",
+    ("scan", "stage", "outcome"),
+)
+STAGE_SECONDS = Histogram(
+    "scanner_stage_duration_seconds",
+    "Probe stage duration per scan type, stage and outcome",
+    ("scan", "stage", "outcome"),
+)
+SOURCE_FETCH_SECONDS = Histogram(
+    "scanner_source_fetch_duration_seconds",
+    "Source list fetch duration per source and outcome",
+    ("source", "outcome"),
+    buckets=FETCH_BUCKETS,
+)
+CHECKS_IN_FLIGHT = Gauge("scanner_checks_in_flight", "Target checks currently running")
+BUDGET_IN_FLIGHT = Gauge("scanner_budget_in_flight", "Checks holding a slot of the shared job budget")
+JOBS_RUNNING = Gauge("scanner_jobs_running", "Running scan jobs per type", ("type",))
+LOOP_LAG_SECONDS = Histogram(
+    "scanner_event_loop_lag_seconds",
+    "Event-loop scheduling lag",
+    buckets=LAG_BUCKETS,
+)
+
+
+def outcome(ok: bool, timed_out: bool = False) -> str:
+    return "pass" if ok else "timeout" if timed_out else "fail"
+
+
+def observe_stage(scan: str, stage: str, result: str, start: float):
+    """
+    ثبت نتیجه و مدت یک مرحله (start از time.perf_counter)
+    Record the outcome and duration of one stage; start is the
+    time.perf_counter() value taken when the stage began
+    """
+    STAGE_TOTAL.inc(scan, stage, result)
+    STAGE_SECONDS.observe(time.perf_counter() - start, scan, stage, result)
+
+
+async def monitor_loop_lag(interval: float = LAG_INTERVAL):
+    """
+    اندازه‌گیری پیوسته تأخیر حلقه رویداد
+    Measure event-loop lag forever: how late a sleep of `interval` wakes up
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+def render_metrics(metrics: Optional[List[Metric]] = None) -> str:
+    """
+    همه متریک‌ها با فرمت متنی Prometheus
+    Every registered metric in the Prometheus text exposition format
+    """
+    return "".join(metric.render() for metric in (metrics if metrics is not None else _registry))
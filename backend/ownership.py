@@ -0,0 +1,143 @@
+import asyncio
+import ipaddress
+from typing import Dict, Iterable, Optional
+from ipwhois import IPWhois
+
+from .sources import IP_RANGE_FILES, get_static_ip_ranges
+
+# ---------------------- ایندکس مالکیت پیشوندهای IP ----------------------
+# Offline prefix-ownership index (longest-prefix match)
+
+
+class PrefixIndex:
+    """
+    ایندکس longest-prefix-match برای IPv4 و IPv6
+    Longest-prefix-match index: one hash table per prefix length, probed
+    from the longest present length down, so a lookup costs at most a few
+    dict lookups regardless of how many prefixes are stored.
+    """
+
+    def __init__(self):
+        self._tables: Dict[int, Dict[int, Dict[int, str]]] = {4: {}, 6: {}}
+        self._lengths: Dict[int, list] = {4: [], 6: []}
+
+    def __len__(self) -> int:
+        return sum(len(t) for tables in self._tables.values() for t in tables.values())
+
+    def add(self, network, value: str):
+        """
+        افزودن یک پیشوند با مقدار مشخص
+        Add a prefix (CIDR string or network object) with its value
+        """
+        net = ipaddress.ip_network(network, strict=False)
+        tables = self._tables[net.version]
+        if net.prefixlen not in tables:
+            tables[net.prefixlen] = {}
+            self._lengths[net.version] = sorted(tables, reverse=True)
+        tables[net.prefixlen][int(net.network_address)] = value
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """
+        یافتن مقدار طولانی‌ترین پیشوند شامل IP
+        Return the value of the longest prefix containing ip, or None
+        """
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        bits = addr.max_prefixlen
+        value = int(addr)
+        tables = self._tables[addr.version]
+        for length in self._lengths[addr.version]:
+            mask = ((1 << length) - 1) << (bits - length)
+            found = tables[length].get(value & mask)
+            if found is not None:
+                return found
+        return None
+
+
+_index: Optional[PrefixIndex] = None
+
+# کش RDAP به ازای هر شبکه (هر شبکه حداکثر یک بار استعلام می‌شود)
+# Per-prefix RDAP cache: each network is looked up at most once
+_rdap_cache = PrefixIndex()
+
+
+def _add_ranges(index: PrefixIndex, provider: str, networks: Iterable):
+    for net in networks:
+        try:
+            index.add(net, provider.lower())
+        except ValueError:
+            continue
+
+
+def get_ownership_index() -> PrefixIndex:
+    """
+    ساخت (یک‌باره) ایندکس از فایل‌های رنج استاتیک
+    Build the index from the static provider range files on first use
+    """
+    global _index
+    if _index is None:
+        index = PrefixIndex()
+        for provider in IP_RANGE_FILES:
+            _add_ranges(index, provider, get_static_ip_ranges(provider))
+        _index = index
+    return _index
+
+
+def register_networks(provider: str, networks: Iterable):
+    """
+    افزودن رنج‌های یک provider (مثلاً از منابع آنلاین) به ایندکس
+    Add a provider's ranges (e.g. fetched ip_sources lists) to the index
+    """
+    _add_ranges(get_ownership_index(), provider, networks)
+
+
+def _rdap_lookup(ip: str) -> Optional[str]:
+    """
+    استعلام RDAP و ذخیره نتیجه برای کل شبکه
+    Blocking RDAP lookup; caches the owner text for the whole network
+    """
+    try:
+        res = IPWhois(ip).lookup_rdap()
+    except Exception:
+        return None
+    asn_desc = res.get("asn_description") or ""
+    org_name = (res.get("network") or {}).get("name") or ""
+    owner = f"{asn_desc} {org_name}".lower()
+    cidrs = (res.get("network") or {}).get("cidr") or res.get("asn_cidr") or ""
+    for cidr in cidrs.split(","):
+        try:
+            _rdap_cache.add(cidr.strip(), owner)
+        except ValueError:
+            continue
+    return owner
+
+
+async def check_ownership(ip: str, provider: str, rdap_fallback: bool = True) -> bool:
+    """
+    بررسی مالکیت IP با ایندکس محلی و در صورت نیاز RDAP
+    Check that ip belongs to provider using the local index (microseconds);
+    only IPs outside every known range fall back to a cached RDAP lookup.
+    """
+    provider = provider.lower()
+    owner = get_ownership_index().lookup(ip)
+    if owner is not None:
+        return owner == provider
+    if not rdap_fallback:
+        return False
+    return await check_rdap_ownership(ip, provider)
+
+
+async def check_rdap_ownership(ip: str, provider: str) -> bool:
+    """
+    بررسی مالکیت با RDAP (کش‌شده به ازای شبکه)
+    Check ownership of an IP outside every known range through a cached
+    RDAP lookup; the slow, remote half of check_ownership()
+    """
+    provider = provider.lower()
+    cached = _rdap_cache.lookup(ip)
+    if cached is None:
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, _rdap_lookup, ip)
+    return bool(cached) and provider in cached
@@ -0,0 +1,315 @@
+import os
+import time
+import socket
+import struct
+import asyncio
+import itertools
+import statistics
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .probes import tcp_connect
+
+# ---------------------- موتور پینگ ICMP درون‌برنامه‌ای ----------------------
+# In-process batched ICMP ping engine (one socket for every host)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+# پروتکل، نوع درخواست و نوع پاسخ echo برای هر خانواده آدرس
+# Protocol, echo request type and echo reply type per address family
+ICMP_FAMILIES = {
+    socket.AF_INET: (socket.IPPROTO_ICMP, ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY),
+    socket.AF_INET6: (socket.IPPROTO_ICMPV6, ICMPV6_ECHO_REQUEST, ICMPV6_ECHO_REPLY),
+}
+
+# پیام‌های خطای ICMP (مقصد در دسترس نیست، پایان TTL) و طول هدر IP داخل آن‌ها
+# ICMP error types (destination unreachable, time exceeded) per family;
+# they quote the failed echo, so the probe fails fast instead of timing out.
+# Only raw sockets receive them.
+ICMP_ERRORS = {socket.AF_INET: (3, 11), socket.AF_INET6: (1, 3)}
+
+# فاصله بین echoهای پیاپی یک میزبان (ثانیه)؛ نمونه‌های هم‌زمان jitter را نشان نمی‌دهند
+# Gap between consecutive echoes to a host (seconds); back-to-back
+# probes see the same queue state, so their spread says nothing about jitter
+ECHO_INTERVAL = 0.05
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class PingEngine:
+    """
+    موتور پینگ async: ارسال به میزبان‌های زیاد از یک سوکت و تطبیق پاسخ‌ها
+    Async ping engine. Echo requests to any number of hosts go out over one
+    ICMP socket per address family (unprivileged SOCK_DGRAM on Linux,
+    SOCK_RAW when running as root; ICMPv6 for IPv6 hosts) and replies are
+    matched back by identifier and sequence. For a family whose ICMP socket
+    cannot be opened, RTT is measured with a TCP connect.
+    """
+
+    def __init__(self, fallback_port: int = 443):
+        self.fallback_port = fallback_port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._socks: Dict[int, socket.socket] = {}
+        self._raw: Dict[int, bool] = {}
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = itertools.count(int.from_bytes(os.urandom(2), "big"))
+        self._waiters: Dict[int, Tuple[str, float, asyncio.Future]] = {}
+
+    @property
+    def mode(self) -> str:
+        return self.family_mode(socket.AF_INET)
+
+    def family_mode(self, family: int) -> str:
+        """
+        روش پینگ یک خانواده آدرس (icmp / icmp-raw / tcp)
+        Ping method used for one address family
+        """
+        self._ensure_socket()
+        if family not in self._socks:
+            return "tcp"
+        return "icmp-raw" if self._raw[family] else "icmp"
+
+    def _ensure_socket(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self.close()
+        self._loop = loop
+        for family, (proto, _, _) in ICMP_FAMILIES.items():
+            for sock_type, raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+                try:
+                    sock = socket.socket(family, sock_type, proto)
+                except OSError:
+                    continue
+                sock.setblocking(False)
+                self._socks[family], self._raw[family] = sock, raw
+                loop.add_reader(sock.fileno(), self._on_readable, family)
+                break
+
+    def close(self):
+        """
+        بستن سوکت و لغو انتظارهای باقی‌مانده
+        Close the socket and drop pending waiters
+        """
+        for sock in self._socks.values():
+            try:
+                self._loop.remove_reader(sock.fileno())
+            except Exception:
+                pass
+            sock.close()
+        self._socks.clear()
+        self._raw.clear()
+        for _, _, fut in self._waiters.values():
+            if not fut.done():
+                fut.cancel()
+        self._waiters.clear()
+        self._loop = None
+
+    def _on_readable(self, family: int):
+        sock, raw = self._socks[family], self._raw[family]
+        reply_type = ICMP_FAMILIES[family][2]
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received = time.perf_counter()
+            if raw and family == socket.AF_INET:
+                # سوکت raw در IPv4 هدر IP را هم برمی‌گرداند (ICMPv6 نه)
+                # Raw IPv4 sockets also return the IP header (ICMPv6 ones don't)
+                data = data[(data[0] & 0x0F) * 4:]
+            if raw and len(data) >= 8 and data[0] in ICMP_ERRORS[family]:
+                self._on_error(family, data[8:])
+                continue
+            if len(data) < 10 or data[0] != reply_type:
+                continue
+            ident, seq = struct.unpack("!HH", data[4:8])
+            token = struct.unpack("!H", data[8:10])[0]
+            # در سوکت DGRAM هسته شناسه را بازنویسی می‌کند؛ شناسه در payload هم هست
+            # DGRAM sockets rewrite the header id, so the id is echoed in the payload too
+            if token != self._ident or (raw and ident != self._ident):
+                continue
+            waiter = self._waiters.get(seq)
+            if waiter is None or waiter[0] != addr[0]:
+                continue
+            del self._waiters[seq]
+            _, sent, fut = waiter
+            if not fut.done():
+                fut.set_result((received - sent) * 1000)
+
+    def _on_error(self, family: int, quoted: bytes):
+        # پیام خطا شامل هدر IP و ۸ بایت اول echo ارسالی است
+        # The error quotes the original IP header and the first 8 bytes of
+        # the echo request (type, code, checksum, id, sequence)
+        offset = (quoted[0] & 0x0F) * 4 if family == socket.AF_INET and quoted else 40
+        if len(quoted) < offset + 8:
+            return
+        ident, seq = struct.unpack("!HH", quoted[offset + 4:offset + 8])
+        if ident != self._ident:
+            return
+        waiter = self._waiters.pop(seq, None)
+        if waiter is not None and not waiter[2].done():
+            waiter[2].set_result(None)
+
+    def _send_echo(self, host: str, family: int) -> asyncio.Future:
+        seq = next(self._seq) & 0xFFFF
+        request_type = ICMP_FAMILIES[family][1]
+        payload = struct.pack("!H", self._ident) + b"mapsim-ping"
+        header = struct.pack("!BBHHH", request_type, 0, 0, self._ident, seq)
+        # checksum در ICMPv6 (شامل شبه‌هدر IPv6) توسط هسته محاسبه می‌شود
+        # The kernel fills in the ICMPv6 checksum, which covers the IPv6 pseudo-header
+        checksum = _checksum(header + payload) if family == socket.AF_INET else 0
+        packet = struct.pack("!BBHHH", request_type, 0, checksum, self._ident, seq) + payload
+        fut = self._loop.create_future()
+        self._waiters[seq] = (host, time.perf_counter(), fut)
+        try:
+            self._socks[family].sendto(packet, (host, 0))
+        except OSError:
+            self._waiters.pop(seq, None)
+            fut.cancel()
+        return fut
+
+    async def ping(self, host: str, count: int = 1, timeout: float = 1) -> List[float]:
+        """
+        پینگ یک میزبان و بازگرداندن نمونه‌های RTT (میلی‌ثانیه)
+        Ping one host; returns the RTT samples (ms) of the replies received
+        """
+        return (await self.ping_many([host], count=count, timeout=timeout))[host]
+
+    async def ping_outcome(self, host: str, count: int = 1, timeout: float = 1) -> Tuple[List[float], bool]:
+        """
+        پینگ یک میزبان همراه با اینکه شکست ناشی از timeout بوده یا نه
+        Ping one host; returns its RTT samples (ms) and whether a failure
+        was a timeout, as opposed to an error (unreachable, send refused)
+        """
+        samples, timed_out = await self._ping_many([host], count, timeout)
+        return samples[host], timed_out[host]
+
+    async def ping_many(
+        self,
+        hosts: Iterable[str],
+        count: int = 1,
+        timeout: float = 1,
+    ) -> Dict[str, List[float]]:
+        """
+        پینگ همزمان چند میزبان با یک سوکت
+        Ping many hosts at once over the shared socket; returns RTT samples
+        (ms) per host. Hosts without any reply map to an empty list. The
+        `count` echoes to a host go out ECHO_INTERVAL apart, and each one
+        is given at least `timeout` for its reply.
+        """
+        return (await self._ping_many(hosts, count, timeout))[0]
+
+    async def _ping_many(
+        self,
+        hosts: Iterable[str],
+        count: int,
+        timeout: float,
+    ) -> Tuple[Dict[str, List[float]], Dict[str, bool]]:
+        # نمونه‌ها و وضعیت timeout هر میزبان (بدون پاسخ و با درخواست بی‌جواب تا پایان مهلت)
+        # Samples per host, and per host whether it failed by timing out:
+        # no reply and a request still unanswered when the timeout ran out
+        hosts = list(dict.fromkeys(hosts))
+        self._ensure_socket()
+        icmp_hosts: Dict[str, int] = {}
+        tcp_hosts: List[str] = []
+        for host in hosts:
+            family = socket.AF_INET6 if ":" in host else socket.AF_INET
+            if family in self._socks:
+                icmp_hosts[host] = family
+            else:
+                tcp_hosts.append(host)
+
+        # میزبان‌های بدون سوکت ICMP همزمان با TCP اندازه‌گیری می‌شوند
+        # Hosts without an ICMP socket for their family are timed over TCP meanwhile
+        tcp_task = asyncio.ensure_future(self._tcp_ping_many(tcp_hosts, count, timeout))
+        sent: Dict[str, List[asyncio.Future]] = {host: [] for host in icmp_hosts}
+        for i in range(count if icmp_hosts else 0):
+            if i:
+                await asyncio.sleep(ECHO_INTERVAL)
+            for host, family in icmp_hosts.items():
+                sent[host].append(self._send_echo(host, family))
+        futures = [fut for futs in sent.values() for fut in futs]
+        if futures:
+            await asyncio.wait(futures, timeout=timeout)
+        samples, timed_out = await tcp_task
+        for host, futs in sent.items():
+            results = [f.result() for f in futs if f.done() and not f.cancelled()]
+            samples[host] = [rtt for rtt in results if rtt is not None]
+            timed_out[host] = not samples[host] and any(not f.done() for f in futs)
+            for fut in futs:
+                if not fut.done():
+                    fut.cancel()
+        # پاکسازی انتظارهای منقضی‌شده
+        # Drop waiters whose replies never came
+        for seq in [s for s, (_, _, f) in self._waiters.items() if f.done()]:
+            del self._waiters[seq]
+        return samples, timed_out
+
+    async def _tcp_ping_many(
+        self, hosts: List[str], count: int, timeout: float
+    ) -> Tuple[Dict[str, List[float]], Dict[str, bool]]:
+        async def one(host: str) -> Tuple[List[float], bool]:
+            rtts = []
+            timed_out = False
+            for i in range(count):
+                if i:
+                    await asyncio.sleep(ECHO_INTERVAL)
+                start = time.perf_counter()
+                rtt = await tcp_connect(host, self.fallback_port, timeout)
+                if rtt is not None:
+                    rtts.append(rtt)
+                elif time.perf_counter() - start >= timeout:
+                    timed_out = True
+            return rtts, timed_out and not rtts
+
+        results = await asyncio.gather(*(one(host) for host in hosts))
+        return (
+            {host: rtts for host, (rtts, _) in zip(hosts, results)},
+            {host: timed_out for host, (_, timed_out) in zip(hosts, results)},
+        )
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    """
+    آمار چندنمونه‌ای تأخیر (میانه، کمینه و jitter)
+    Multi-sample latency stats: median, min and jitter (mean absolute
+    difference between consecutive samples, as in RFC 3550)
+    """
+    if not samples:
+        return {"samples": 0, "median_ms": None, "min_ms": None, "jitter_ms": None}
+    jitter = (
+        statistics.fmean(abs(b - a) for a, b in zip(samples, samples[1:]))
+        if len(samples) > 1 else 0.0
+    )
+    return {
+        "samples": len(samples),
+        "median_ms": round(statistics.median(samples), 2),
+        "min_ms": round(min(samples), 2),
+        "jitter_ms": round(jitter, 2),
+    }
+
+
+_engine: Optional[PingEngine] = None
+
+
+def get_ping_engine() -> PingEngine:
+    """
+    نمونه مشترک موتور پینگ
+    Shared ping engine instance
+    """
+    global _engine
+    if _engine is None:
+        _engine = PingEngine()
+    return _engine
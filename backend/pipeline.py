@@ -0,0 +1,156 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+# ---------------------- زنجیره مراحل بررسی با ترتیب بر اساس هزینه ----------------------
+# Declarative check pipeline, ordered by measured cost and selectivity
+
+# حالت‌های یک مرحله: الزامی (شکست = رد)، اطلاعاتی (فقط ثبت)، خاموش
+# Stage modes: "required" rejects the target on failure, "info" only runs
+# for targets that passed every required stage and never rejects, "off"
+# never runs
+STAGE_MODES = ("required", "info", "off")
+
+# وزن برآورد اولیه نرخ قبولی در برابر نتایج اندازه‌گیری‌شده
+# Weight (in observations) of a stage's prior pass rate
+PRIOR_WEIGHT = 8
+
+# ضریب میانگین نمایی هزینه
+# Smoothing factor of the moving average of stage cost
+COST_ALPHA = 0.1
+
+# حداقل نرخ رد برای جلوگیری از تقسیم بر صفر
+# Floor of the reject rate, so a stage that never rejects still ranks
+MIN_REJECT_RATE = 0.01
+
+# نتیجه یک مرحله: True قبول، False رد، None یعنی مرحله برای این هدف لازم نیست
+# Stage result: True passed, False failed, None not applicable to the target
+StageCheck = Callable[[str, Dict], Awaitable[Optional[bool]]]
+
+
+class Stage:
+    """
+    یک مرحله بررسی با هزینه و نرخ قبولی اندازه‌گیری‌شده
+    One check of the pipeline. `cost` (seconds) and `pass_rate` start
+    from the given estimates and follow the measured outcomes; `after`
+    names stages that must run before this one (e.g. RDAP only after the
+    local ownership lookup left the owner unknown).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        check: StageCheck,
+        cost: float,
+        pass_rate: float = 0.5,
+        mode: str = "required",
+        after: Sequence[str] = (),
+    ):
+        if mode not in STAGE_MODES:
+            raise ValueError(f"Invalid stage mode: {mode}")
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.prior = pass_rate
+        self.mode = mode
+        self.after = tuple(after)
+        self.runs = 0
+        self.passes = 0
+
+    @property
+    def pass_rate(self) -> float:
+        return (self.passes + self.prior * PRIOR_WEIGHT) / (self.runs + PRIOR_WEIGHT)
+
+    def rank(self) -> float:
+        # هزینه مورد انتظار به ازای هر رد؛ ترتیب صعودی آن کل هزینه را کمینه می‌کند
+        # Expected cost per rejection; running independent filters in
+        # ascending order of it minimizes the total expected cost
+        return self.cost / max(MIN_REJECT_RATE, 1 - self.pass_rate)
+
+    def record(self, passed: bool, elapsed: float):
+        self.runs += 1
+        self.passes += passed
+        self.cost += COST_ALPHA * (elapsed - self.cost)
+
+    def snapshot(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "runs": self.runs,
+            "pass_rate": round(self.pass_rate, 3),
+            "cost_ms": round(self.cost * 1000, 1),
+        }
+
+
+class CheckPipeline:
+    """
+    اجرای مراحل الزامی از ارزان‌ترین و گزینشی‌ترین، سپس مراحل اطلاعاتی
+    Runs the required stages of a target cheapest-per-rejection first and
+    stops at the first failure; info stages then run together for the
+    targets that passed. One pipeline is shared by a whole scan, so the
+    order adapts to what the scan measures.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+
+    def order(self) -> List[Stage]:
+        """
+        ترتیب فعلی مراحل الزامی با رعایت وابستگی‌ها
+        Current order of the required stages, by rank, with every stage
+        placed after the stages it depends on
+        """
+        pending = sorted((s for s in self.stages if s.mode == "required"), key=Stage.rank)
+        names = {s.name for s in pending}
+        placed: List[Stage] = []
+        done: set = set()
+        while pending:
+            for stage in pending:
+                if all(dep in done or dep not in names for dep in stage.after):
+                    break
+            pending.remove(stage)
+            placed.append(stage)
+            done.add(stage.name)
+        return placed
+
+    async def _run_stage(self, stage: Stage, target: str, context: Dict) -> Optional[bool]:
+        start = time.perf_counter()
+        result = await stage.check(target, context)
+        if result is not None:
+            stage.record(result, time.perf_counter() - start)
+        return result
+
+    async def run(self, target: str, context: Dict) -> Optional[str]:
+        """
+        اجرای مراحل برای یک هدف؛ نام اولین مرحله ردکننده یا None
+        Run the pipeline for one target; returns the name of the stage that
+        rejected it, or None when it passed. `context` is shared by the
+        stages of this target (e.g. the per-target details).
+        """
+        for stage in self.order():
+            if await self._run_stage(stage, target, context) is False:
+                return stage.name
+        info = [s for s in self.stages if s.mode == "info"]
+        if info:
+            await asyncio.gather(*(self._run_stage(s, target, context) for s in info))
+        return None
+
+    def profile(self, implied: Sequence[str] = ()) -> str:
+        """
+        پروفایل بررسی: نام مراحل الزامی (برای کلید نتایج ذخیره‌شده)
+        Check profile: the sorted names of the required stages plus
+        `implied` ones checked outside the pipeline, comma-separated; it
+        keys stored verdicts (see store.profile_covers)
+        """
+        names = {stage.name for stage in self.stages if stage.mode == "required"}
+        return ",".join(sorted(names.union(implied)))
+
+    def snapshot(self) -> Dict:
+        """
+        ترتیب و آمار مراحل برای نمایش در پیشرفت اسکن
+        Stage order and stats, for the progress output
+        """
+        order = [stage.name for stage in self.order()]
+        return {
+            "order": order,
+            "stages": {stage.name: stage.snapshot() for stage in self.stages},
+        }
@@ -0,0 +1,224 @@
+import ssl
+import time
+import socket
+import struct
+import asyncio
+from typing import Dict, Optional
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:  # h2 از طریق httpx[http2] نصب می‌شود / installed with httpx[http2]
+    h2 = None
+
+# ---------------------- پروب‌های شبکه‌ای async ----------------------
+# Non-blocking network probes built directly on the event loop
+
+# کانتکست TLS مشترک (ساخت آن پرهزینه است و نباید برای هر اتصال تکرار شود)
+# Shared TLS context; building one is expensive, so it is created once
+TLS_CONTEXT = ssl.create_default_context()
+TLS_CONTEXT.set_alpn_protocols(["h2", "http/1.1"])
+
+# کانتکست پروب Reality: فقط X25519 پیشنهاد می‌شود، پس handshake موفق یعنی پشتیبانی از آن
+# Reality probe context: X25519 is the only key-exchange group offered, so
+# a completed handshake proves the server supports it
+REALITY_CONTEXT = ssl.create_default_context()
+REALITY_CONTEXT.set_alpn_protocols(["h2", "http/1.1"] if h2 is not None else ["http/1.1"])
+REALITY_CONTEXT.set_ecdh_curve("X25519")
+
+# وزن اجزای امتیاز Reality (مجموع ۱۰۰)
+# Weights of the Reality suitability score (sum to 100)
+REALITY_WEIGHTS = {"tls13": 40, "h2": 20, "http": 10, "speed": 30}
+
+# تأخیر اتصال و handshake که امتیاز سرعت در آن به صفر می‌رسد (میلی‌ثانیه)
+# Connect + handshake time at which the speed part of the score reaches zero (ms)
+SCORE_LATENCY_MS = 1000
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+
+def _new_socket(host: str) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    # بستن با RST تا سوکت‌های TIME_WAIT در اسکن‌های بزرگ انباشته نشوند
+    # Close with RST so large scans don't pile up TIME_WAIT sockets
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    return sock
+
+
+async def tcp_connect(host: str, port: int = 443, timeout: float = 3) -> Optional[float]:
+    """
+    اتصال TCP غیرمسدودکننده و اندازه‌گیری زمان اتصال (میلی‌ثانیه)
+    Non-blocking TCP connect; returns the connect RTT in ms, or None on failure.
+    Uses a raw non-blocking socket so thousands of connects can be in flight
+    without going through the thread-pool executor.
+    """
+    loop = asyncio.get_running_loop()
+    sock = _new_socket(host)
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout)
+        return (time.perf_counter() - start) * 1000
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        sock.close()
+
+
+async def tls_handshake(
+    host: str,
+    server_name: str,
+    port: int = 443,
+    timeout: float = 3,
+) -> Dict:
+    """
+    اتصال و handshake کامل TLS با SNI مشخص، همراه با زمان‌بندی
+    Connect and complete a verified TLS handshake with the given SNI.
+    Returns connect/handshake timings, TLS version and ALPN; raises on failure.
+    """
+    loop = asyncio.get_running_loop()
+    sock = _new_socket(host)
+    writer = None
+    try:
+        start = time.perf_counter()
+        await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout)
+        connected = time.perf_counter()
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(sock=sock, ssl=TLS_CONTEXT, server_hostname=server_name),
+            timeout,
+        )
+        done = time.perf_counter()
+        ssl_object = writer.get_extra_info("ssl_object")
+        return {
+            "sni": server_name,
+            "connect_ms": (connected - start) * 1000,
+            "handshake_ms": (done - connected) * 1000,
+            "tls_version": ssl_object.version(),
+            "alpn": ssl_object.selected_alpn_protocol(),
+        }
+    finally:
+        if writer is not None:
+            writer.close()
+        else:
+            sock.close()
+
+
+async def _http1_request(reader, writer, server_name: str) -> Dict:
+    writer.write(
+        f"GET / HTTP/1.1\r\nHost: {server_name}\r\nUser-Agent: {USER_AGENT}\r\n"
+        "Accept: */*\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    line = await reader.readuntil(b"\r\n")
+    version, status = line.decode("latin-1").split()[:2]
+    return {"status": int(status), "http_version": version}
+
+
+async def _http2_request(reader, writer, server_name: str) -> Dict:
+    conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=True, header_encoding="utf-8"))
+    conn.initiate_connection()
+    conn.send_headers(1, [
+        (":method", "GET"), (":scheme", "https"), (":authority", server_name), (":path", "/"),
+        ("user-agent", USER_AGENT), ("accept", "*/*"),
+    ], end_stream=True)
+    writer.write(conn.data_to_send())
+    await writer.drain()
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            raise ConnectionError("connection closed before response headers")
+        for event in conn.receive_data(data):
+            if isinstance(event, h2.events.ResponseReceived):
+                return {"status": int(dict(event.headers)[":status"]), "http_version": "HTTP/2"}
+            if isinstance(event, (h2.events.StreamReset, h2.events.ConnectionTerminated)):
+                raise ConnectionError(f"stream closed: {type(event).__name__}")
+        writer.write(conn.data_to_send())
+
+
+async def reality_probe(
+    host: str,
+    server_name: str,
+    port: int = 443,
+    timeout: float = 3,
+    http_timeout: Optional[float] = 5,
+) -> Dict:
+    """
+    بررسی مناسب بودن دامنه برای Reality با یک اتصال و یک handshake
+    One connection, one verified handshake offering only X25519: records
+    connect/handshake timings, TLS version, ALPN, cipher and certificate
+    lifetime, then (unless http_timeout is None) sends a minimal GET for
+    "/" over the same connection, as HTTP/2 when h2 was negotiated.
+    Raises on connect or handshake failure; an HTTP failure is reported in
+    "http_error" with the handshake data kept. The result is scored with
+    reality_score().
+    """
+    loop = asyncio.get_running_loop()
+    sock = _new_socket(host)
+    writer = None
+    try:
+        start = time.perf_counter()
+        await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout)
+        connected = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(sock=sock, ssl=REALITY_CONTEXT, server_hostname=server_name),
+            timeout,
+        )
+        done = time.perf_counter()
+        ssl_object = writer.get_extra_info("ssl_object")
+        cert = ssl_object.getpeercert()
+        result = {
+            "sni": server_name,
+            "address": host,
+            "connect_ms": round((connected - start) * 1000, 2),
+            "handshake_ms": round((done - connected) * 1000, 2),
+            "tls_version": ssl_object.version(),
+            "alpn": ssl_object.selected_alpn_protocol(),
+            "cipher": ssl_object.cipher()[0],
+            "group": "X25519",
+            "cert_days_left": round((ssl.cert_time_to_seconds(cert["notAfter"]) - time.time()) / 86400, 1),
+            "http": None,
+        }
+        if http_timeout is not None:
+            request = _http2_request if result["alpn"] == "h2" else _http1_request
+            sent = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(request(reader, writer, server_name), http_timeout)
+                response["ttfb_ms"] = round((time.perf_counter() - sent) * 1000, 2)
+                result["http"] = response
+            except asyncio.TimeoutError:
+                result["http_error"] = "timeout"
+            except Exception as e:
+                result["http_error"] = type(e).__name__
+        result.update(reality_score(result))
+        return result
+    finally:
+        if writer is not None:
+            writer.close()
+        else:
+            sock.close()
+
+
+def reality_score(probe: Dict) -> Dict:
+    """
+    امتیاز مناسب بودن برای Reality (۰ تا ۱۰۰)
+    Suitability score (0-100) of a reality_probe() result: TLS 1.3, h2,
+    an HTTP answer below 400 and connect + handshake speed, weighted by
+    REALITY_WEIGHTS. "suitable" needs TLS 1.3 and, when HTTP was probed,
+    a response below 400; X25519 and a valid chain are implied by the
+    completed handshake.
+    """
+    tls13 = probe["tls_version"] == "TLSv1.3"
+    http = probe.get("http")
+    http_ok = http is not None and http["status"] < 400
+    latency = probe["connect_ms"] + probe["handshake_ms"]
+    speed = max(0.0, 1 - latency / SCORE_LATENCY_MS)
+    score = (
+        REALITY_WEIGHTS["tls13"] * tls13
+        + REALITY_WEIGHTS["h2"] * (probe["alpn"] == "h2")
+        + REALITY_WEIGHTS["http"] * http_ok
+        + REALITY_WEIGHTS["speed"] * speed
+    )
+    probed_http = http is not None or "http_error" in probe
+    return {"score": round(score, 1), "suitable": tls13 and (http_ok or not probed_http)}
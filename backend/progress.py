@@ -0,0 +1,130 @@
+import json
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+# ---------------------- ارسال افزایشی پیشرفت اسکن ----------------------
+# Incremental progress feed: cursor deltas and Server-Sent Events
+
+# شمارنده‌هایی که در هر رویداد فقط در صورت تغییر ارسال می‌شوند
+# Counters sent in an event only when they changed since the last one
+COUNTER_KEYS = ("total", "done", "skipped", "cancel", "running")
+
+# وضعیت اجزای اسکن که به صورت snapshot ارسال می‌شوند (کلید خروجی، کلید وضعیت)
+# Scan components reported as snapshots: (output key, state key)
+SNAPSHOT_KEYS = (
+    ("adaptive", "controller"), ("sampling", "sampler"), ("shards", "shards"), ("pipeline", "pipeline"),
+)
+
+# حداقل فاصله بین دو رویداد (تجمیع تغییرات پشت‌سرهم)
+# Minimum spacing between events, so bursts of updates are coalesced
+MIN_INTERVAL = 0.1
+
+# ارسال پیام keep-alive در نبود تغییرات
+# Keep-alive comment interval when nothing changes
+HEARTBEAT = 15
+
+
+class ProgressSignal:
+    """
+    اعلان تغییر وضعیت به همه شنونده‌ها (broadcast)
+    Broadcast wake-up for every listener of a progress state. Each set()
+    bumps a sequence number, so a listener that was busy while the state
+    changed returns from wait() at once instead of missing the update.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self._future: Optional[asyncio.Future] = None
+
+    def set(self):
+        self.seq += 1
+        if self._future is not None and not self._future.done():
+            self._future.set_result(None)
+        self._future = None
+
+    async def wait(self, seen: int, timeout: Optional[float] = None) -> bool:
+        """
+        انتظار برای تغییری پس از شماره seen
+        Wait for a change after sequence number `seen`; False on timeout
+        """
+        if self.seq != seen:
+            return True
+        if self._future is None:
+            self._future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def notify(progress: Optional[Dict]):
+    """
+    اعلان تغییر یک وضعیت پیشرفت (در صورت داشتن signal)
+    Wake the listeners of a progress state, if it carries a signal
+    """
+    signal = progress.get("signal") if progress is not None else None
+    if signal is not None:
+        signal.set()
+
+
+def progress_delta(state: Dict, since: int = 0, last: Optional[Dict] = None) -> Dict:
+    """
+    تغییرات وضعیت از cursor داده‌شده: نتایج جدید و شمارنده‌های تغییرکرده
+    State changes since a results cursor: the new results, the counters
+    (and component snapshots) that differ from `last` (all counters when last is None, `last` is
+    updated in place) and the next cursor. A cursor past the end of the
+    results makes the client reset its list.
+    """
+    results = state["results"]
+    delta: Dict = {}
+    if since > len(results):
+        delta["reset"] = True
+        since = 0
+    counters = {key: state.get(key, 0) for key in COUNTER_KEYS}
+    for key, source in SNAPSHOT_KEYS:
+        if state.get(source) is not None:
+            counters[key] = state[source].snapshot()
+    for key, value in counters.items():
+        if last is None or last.get(key) != value:
+            delta[key] = value
+    if last is not None:
+        last.update(counters)
+    delta["results"] = results[since:]
+    delta["cursor"] = len(results)
+    return delta
+
+
+def _event(name: str, data: Dict, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_progress(state: Dict, since: int = 0) -> AsyncIterator[str]:
+    """
+    جریان SSE از تغییرات وضعیت تا پایان اسکن
+    Server-Sent Events stream of a progress state. Each "progress" event
+    carries only new results and changed counters, with the results cursor
+    as the event id so a reconnecting EventSource resumes where it left
+    off. A final "end" event carries the ranked results, if any.
+    """
+    signal = state.get("signal")
+    last: Dict = {}
+    cursor = since
+    while True:
+        seen = signal.seq if signal is not None else 0
+        delta = progress_delta(state, cursor, last)
+        if delta["results"] or len(delta) > 2:
+            cursor = delta["cursor"]
+            yield _event("progress", delta, cursor)
+        if not state.get("running"):
+            ranked = state.get("ranked")
+            yield _event("end", {"results": ranked if ranked is not None else state["results"]}, cursor)
+            return
+        if signal is None:
+            await asyncio.sleep(1)
+            continue
+        if not await signal.wait(seen, HEARTBEAT):
+            yield ": keep-alive\n\n"
+            continue
+        await asyncio.sleep(MIN_INTERVAL)
@@ -0,0 +1,134 @@
+import time
+import socket
+import asyncio
+import ipaddress
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# ---------------------- لایه DNS async با کش TTL ----------------------
+# Async DNS resolution with a bounded LRU/TTL cache shared by every stage
+
+# خطاهایی که یعنی نام واقعاً آدرسی ندارد (فقط این‌ها در کش منفی می‌روند)
+# getaddrinfo errors meaning the name really has no address; only these
+# are negative-cached. EAI_AGAIN, EAI_FAIL, timeouts etc. are transient.
+NEGATIVE_ERRORS = frozenset(
+    getattr(socket, name) for name in ("EAI_NONAME", "EAI_NODATA") if hasattr(socket, name)
+)
+
+
+class DNSCache:
+    """
+    کش DNS با حد اندازه (LRU)، TTL و کش منفی برای نام‌های ناموجود
+    Async resolver with a bounded LRU cache, a TTL for answers and a shorter
+    negative TTL for names that do not resolve (NXDOMAIN, no address).
+    Transient resolver errors are not cached.
+    Concurrent lookups of the same name share a single in-flight query.
+    """
+
+    def __init__(self, max_entries: int = 20000, ttl: float = 300, negative_ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pinned: Dict[str, List[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _get(self, host: str) -> Optional[List[str]]:
+        entry = self._cache.get(host)
+        if entry is None:
+            return None
+        expires, addresses = entry
+        if expires < time.monotonic():
+            del self._cache[host]
+            return None
+        self._cache.move_to_end(host)
+        return addresses
+
+    def _put(self, host: str, addresses: List[str]):
+        ttl = self.ttl if addresses else self.negative_ttl
+        self._cache[host] = (time.monotonic() + ttl, addresses)
+        self._cache.move_to_end(host)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def pin(self, host: str, addresses: List[str]):
+        """
+        تعیین ثابت آدرس‌های یک نام (بدون انقضا؛ لیست خالی یعنی نام مرده)
+        Answer host with fixed addresses, bypassing DNS and the TTL; an
+        empty list makes the name dead. Used by the benchmark stand-ins.
+        """
+        self._pinned[host] = list(addresses)
+
+    async def _lookup(self, host: str) -> Optional[List[str]]:
+        # None برای خطاهای گذرا (کش نمی‌شود)، لیست خالی برای نام ناموجود
+        # None on a transient failure (not cached), [] for a dead name
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except UnicodeError:
+            return []
+        except socket.gaierror as e:
+            return [] if e.errno in NEGATIVE_ERRORS else None
+        except OSError:
+            return None
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+    async def resolve(self, host: str) -> List[str]:
+        """
+        تبدیل نام به لیست آدرس‌ها (لیست خالی یعنی نام معتبر نیست)
+        Resolve host to its addresses; an empty list means the name is dead
+        """
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        pinned = self._pinned.get(host)
+        if pinned is not None:
+            return pinned
+        cached = self._get(host)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        task = self._inflight.get(host)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # استعلام در task جدا اجرا می‌شود تا لغو یک فراخوان بقیه را لغو نکند
+            # The query runs in its own task that every caller shields, so a
+            # canceled caller never cancels the lookup the others wait on
+            task = asyncio.ensure_future(self._query(host))
+            self._inflight[host] = task
+        return await asyncio.shield(task)
+
+    async def _query(self, host: str) -> List[str]:
+        try:
+            addresses = await self._lookup(host)
+            if addresses is None:
+                # خطای گذرا: بدون کش، تلاش بعدی دوباره استعلام می‌کند
+                # Transient failure: not cached, the next call asks again
+                self.failures += 1
+                return []
+            self._put(host, addresses)
+            return addresses
+        finally:
+            del self._inflight[host]
+
+
+_resolver: Optional[DNSCache] = None
+
+
+def get_resolver() -> DNSCache:
+    """
+    نمونه مشترک کش DNS
+    Shared DNS cache instance
+    """
+    global _resolver
+    if _resolver is None:
+        _resolver = DNSCache()
+    return _resolver
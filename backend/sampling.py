@@ -0,0 +1,343 @@
+import heapq
+import bisect
+import random
+import asyncio
+import ipaddress
+import statistics
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .targets import Interval, _random_coprime
+
+# ---------------------- نمونه‌برداری سلسله‌مراتبی زیرشبکه‌ها ----------------------
+# Hierarchical subnet sampling: probe a few hosts per block, drill into hits
+
+# اندازه بلوک نمونه‌برداری (فیلترینگ معمولاً در سطح /24 تصمیم می‌گیرد)
+# Sampling block size; filtering is usually decided per /24 (per /48 in IPv6)
+SUBNET_PREFIX = 24
+SUBNET_PREFIX_V6 = 48
+
+# تعداد میزبان نمونه از هر بلوک در مرحله اول
+# Hosts probed per block before it is ranked
+SAMPLES_PER_SUBNET = 2
+
+# تعداد میزبانی که در هر نوبت از یک بلوک امیدوار برداشته می‌شود
+# Hosts taken from a promising block per drill turn
+DRILL_BATCH = 8
+
+# حداقل نرخ موفقیت برای ادامه کاوش در یک بلوک
+# Minimum hit rate for a block to keep being drilled into
+MIN_HIT_RATE = 0.1
+
+
+class Subnet:
+    """
+    آمار و میزبان‌های باقیمانده یک بلوک
+    One sampling block: its address ranges, a cursor over the hosts not yet
+    probed, and hit / latency stats
+    """
+
+    __slots__ = ("block", "ranges", "size", "sampled", "cursor", "probes", "hits", "latencies", "queued")
+
+    def __init__(self, block: int, ranges: List[Interval]):
+        self.block = block
+        self.ranges = ranges
+        self.size = sum(end - start + 1 for start, end in ranges)
+        self.sampled: set = set()
+        self.cursor = 0
+        self.probes = 0
+        self.hits = 0
+        self.latencies: List[float] = []
+        self.queued = False
+
+    def host(self, index: int) -> int:
+        for start, end in self.ranges:
+            if index <= end - start:
+                return start + index
+            index -= end - start + 1
+        raise IndexError(index)
+
+    def next_hosts(self, count: int) -> List[int]:
+        hosts = []
+        while self.cursor < self.size and len(hosts) < count:
+            index = self.cursor
+            self.cursor += 1
+            if index not in self.sampled:
+                hosts.append(self.host(index))
+        return hosts
+
+    @property
+    def exhausted(self) -> bool:
+        return self.cursor >= self.size
+
+    @property
+    def hit_rate(self) -> float:
+        # برآورد لاپلاس تا بلوک‌های با نمونه کم بیش از حد امتیاز نگیرند
+        # Laplace estimate, so blocks with few probes aren't over-ranked
+        return (self.hits + 1) / (self.probes + 2)
+
+    @property
+    def latency(self) -> float:
+        return statistics.median(self.latencies) if self.latencies else float("inf")
+
+    def score(self) -> Tuple[float, float]:
+        return (-self.hit_rate, self.latency)
+
+
+class SubnetSampler:
+    """
+    تولید اهداف به صورت نمونه‌برداری از بلوک‌ها و گسترش روی بلوک‌های موفق
+    Target generator for huge ranges, IPv4 or IPv6. Blocks are visited in
+    a lazy random permutation and every block first gets a few sample
+    hosts; as soon as a block produces a hit it is queued for
+    drilling, and the best blocks (hit rate, then median latency) are
+    walked in batches before any further block is sampled. Blocks ranked
+    best in earlier scans (`priors`) are sampled first and hosts in
+    `exclude` are never yielded. Iterate it with
+    `async for` and report every yielded host back through record().
+    """
+
+    def __init__(
+        self,
+        intervals: List[Interval],
+        version: int = 4,
+        prefix: Optional[int] = None,
+        samples: int = SAMPLES_PER_SUBNET,
+        priors: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        seed: Optional[int] = None,
+    ):
+        self.version = version
+        self.prefix = prefix or (SUBNET_PREFIX if version == 4 else SUBNET_PREFIX_V6)
+        self.samples = samples
+        self._cls = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        self._host_bits = (32 if version == 4 else 128) - self.prefix
+        self._rng = random.Random(seed)
+        self._intervals = intervals
+        self._starts = [start for start, _ in intervals]
+        # بلوک‌ها فقط هنگام نمونه‌برداری ساخته می‌شوند (فضای IPv6 قابل شمارش نیست)
+        # Blocks are only materialized when sampled; IPv6 space can't be enumerated
+        self._spans = [(start >> self._host_bits, end >> self._host_bits) for start, end in intervals]
+        self.block_count = sum(last - first + 1 for first, last in self._spans)
+        self.subnets: Dict[int, Subnet] = {}
+        prior_blocks = [b for b in (self._block_of(p) for p in priors) if b is not None]
+        self._pending = self._iter_blocks(prior_blocks)
+        self._drill: List[Tuple[Tuple[float, float], int]] = []
+        self._exclude = set(exclude)
+        self._outstanding: set = set()
+        self._changed = asyncio.Event()
+        self.sampled_count = 0
+        self.drilled_count = 0
+
+    def _iter_blocks(self, priors: List[int]) -> Iterator[int]:
+        # بلوک‌های قبلی، سپس جایگشت تصادفی تنبل روی همه بلوک‌ها
+        # Prior blocks, then a lazy random permutation over every block
+        yield from priors
+        if not self.block_count:
+            return
+        offsets = []
+        total = 0
+        for first, last in self._spans:
+            offsets.append(total)
+            total += last - first + 1
+        a = _random_coprime(total, self._rng)
+        b = self._rng.randrange(total)
+        for i in range(total):
+            index = (a * i + b) % total
+            pos = bisect.bisect_right(offsets, index) - 1
+            yield self._spans[pos][0] + index - offsets[pos]
+
+    def _subnet(self, block: int) -> Optional[Subnet]:
+        low = block << self._host_bits
+        high = ((block + 1) << self._host_bits) - 1
+        ranges = []
+        pos = max(0, bisect.bisect_right(self._starts, low) - 1)
+        while pos < len(self._intervals) and self._intervals[pos][0] <= high:
+            start, end = self._intervals[pos]
+            if end >= low:
+                ranges.append((max(start, low), min(end, high)))
+            pos += 1
+        return Subnet(block, ranges) if ranges else None
+
+    def _block_of(self, cidr: str) -> Optional[int]:
+        try:
+            net = ipaddress.ip_network(cidr, strict=False)
+        except ValueError:
+            return None
+        if net.version != self.version:
+            return None
+        return int(net.network_address) >> self._host_bits
+
+    def cidr(self, block: int) -> str:
+        return f"{self._cls(block << self._host_bits)}/{self.prefix}"
+
+    def _sample(self, subnet: Subnet) -> List[int]:
+        count = min(self.samples, subnet.size)
+        # در IPv6 سرورها معمولاً شناسه میزبان کوچک دارند (مثل ::1)
+        # IPv6 servers usually sit on low host IDs (prefix::1), so that is
+        # always one of the samples of a v6 block
+        indexes = [1] if self.version == 6 and subnet.size > 1 else []
+        while len(indexes) < count:
+            index = self._rng.randrange(subnet.size)
+            if index not in indexes:
+                indexes.append(index)
+        subnet.sampled.update(indexes)
+        return [subnet.host(i) for i in indexes]
+
+    def _next_hosts(self) -> List[int]:
+        # اول بلوک‌های امیدوار، سپس نمونه از بلوک بعدی
+        # Promising blocks first, then samples of the next unprobed block
+        while self._drill:
+            _, block = heapq.heappop(self._drill)
+            subnet = self.subnets[block]
+            subnet.queued = False
+            hosts = subnet.next_hosts(DRILL_BATCH)
+            self._requeue(subnet)
+            if hosts:
+                self.drilled_count += len(hosts)
+                return hosts
+        for block in self._pending:
+            if block in self.subnets:
+                continue
+            subnet = self._subnet(block)
+            if subnet is None:
+                continue
+            self.subnets[block] = subnet
+            self.sampled_count += 1
+            return self._sample(subnet)
+        return []
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """
+        پیمایش async اهداف؛ در انتها منتظر نتایج در جریان می‌ماند
+        Async target stream. When every block is sampled and nothing is
+        queued for drilling, it waits for the outstanding probes, since a
+        late hit may still open up a block.
+        """
+        while True:
+            ips = self._take()
+            if ips:
+                for ip in ips:
+                    yield ip
+                continue
+            if not self._outstanding:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def _take(self) -> List[str]:
+        # میزبان‌های بعدی به صورت رشته، بدون موارد مستثنی
+        # Next hosts as strings, minus the excluded ones; they stay
+        # outstanding until recorded
+        while True:
+            hosts = self._next_hosts()
+            if not hosts:
+                return []
+            ips = [ip for ip in (str(self._cls(host)) for host in hosts) if ip not in self._exclude]
+            if ips:
+                self._outstanding.update(ips)
+                return ips
+
+    def _requeue(self, subnet: Subnet):
+        if subnet.queued or subnet.exhausted or not subnet.hits:
+            return
+        if subnet.hits / max(1, subnet.probes) < MIN_HIT_RATE:
+            return
+        subnet.queued = True
+        heapq.heappush(self._drill, (subnet.score(), subnet.block))
+
+    def record(self, ip: str, hit: bool, latency_ms: Optional[float] = None):
+        """
+        ثبت نتیجه یک میزبان؛ اولین موفقیت یک بلوک آن را برای کاوش صف می‌کند
+        Record the outcome of one host; a hit queues its block for drilling.
+        Must be called for every yielded host, hit or not.
+        """
+        self._outstanding.discard(ip)
+        self._changed.set()
+        try:
+            value = int(ipaddress.ip_address(ip))
+        except ValueError:
+            return
+        subnet = self.subnets.get(value >> self._host_bits)
+        if subnet is None:
+            return
+        subnet.probes += 1
+        if hit:
+            subnet.hits += 1
+            if latency_ms is not None:
+                subnet.latencies.append(latency_ms)
+            self._requeue(subnet)
+
+    def stats(self) -> List[Dict]:
+        """
+        آمار بلوک‌های بررسی‌شده (برای ذخیره و شروع اسکن‌های بعدی)
+        Stats of every probed block, for persisting and seeding later scans
+        """
+        return [
+            {
+                "subnet": self.cidr(subnet.block),
+                "probes": subnet.probes,
+                "hits": subnet.hits,
+                "best_ms": min(subnet.latencies) if subnet.latencies else None,
+            }
+            for subnet in self.subnets.values()
+            if subnet.probes
+        ]
+
+    def snapshot(self) -> Dict:
+        """
+        وضعیت نمونه‌برداری برای نمایش در پیشرفت اسکن
+        Sampling state, for the progress output
+        """
+        return {
+            "subnets": self.block_count,
+            "sampled": self.sampled_count,
+            "drilling": len(self._drill),
+            "drilled_hosts": self.drilled_count,
+        }
+
+
+class SamplerGroup:
+    """
+    ترکیب نمونه‌بردارهای IPv4 و IPv6 در یک جریان اهداف
+    Interleaves the samplers of several address families into one target
+    stream, taking a batch from each in turn, and routes record() to the
+    sampler of the host's family. Exposes the same interface as
+    SubnetSampler.
+    """
+
+    def __init__(self, samplers: List[SubnetSampler]):
+        self.samplers = {sampler.version: sampler for sampler in samplers}
+        self._changed = asyncio.Event()
+        for sampler in samplers:
+            sampler._changed = self._changed
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        samplers = list(self.samplers.values())
+        turn = 0
+        while True:
+            ips: List[str] = []
+            for offset in range(len(samplers)):
+                ips = samplers[(turn + offset) % len(samplers)]._take()
+                if ips:
+                    break
+            turn += 1
+            if ips:
+                for ip in ips:
+                    yield ip
+                continue
+            if not any(sampler._outstanding for sampler in samplers):
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def record(self, ip: str, hit: bool, latency_ms: Optional[float] = None):
+        sampler = self.samplers.get(6 if ":" in ip else 4)
+        if sampler is not None:
+            sampler.record(ip, hit, latency_ms)
+
+    def stats(self) -> List[Dict]:
+        return [stat for sampler in self.samplers.values() for stat in sampler.stats()]
+
+    def snapshot(self) -> Dict:
+        snapshots = [sampler.snapshot() for sampler in self.samplers.values()]
+        return {key: sum(snap[key] for snap in snapshots) for key in snapshots[0]} if snapshots else {}
@@ -0,0 +1,276 @@
+import os
+import queue
+import asyncio
+import multiprocessing
+from typing import Dict, List, Optional, Union
+
+from .progress import notify
+from .targets import IntervalSet
+from .ownership import register_networks
+from .store import DEFAULT_VERDICT_TTL
+from .utils import DomainScanner, rank_by_score, scan_ip_ranges
+from .logs import get_logger, setup_logging
+
+log = get_logger("shards")
+
+# ---------------------- اسکن چندهسته‌ای با تقسیم اهداف بین پردازه‌ها ----------------------
+# Sharded scanning: the target space split across worker processes
+
+# فاصله ارسال وضعیت هر shard به پردازه اصلی (ثانیه)
+# How often a shard reports progress and new results to the parent (seconds)
+REPORT_INTERVAL = 0.25
+
+# حداکثر زمان انتظار برای خروج پردازه‌ها پس از توقف (ثانیه)
+# Grace period for shard processes to exit after a stop (seconds)
+JOIN_TIMEOUT = 10
+
+
+def default_shard_count() -> int:
+    """
+    تعداد پیش‌فرض shardها (یکی به ازای هر هسته)
+    Default number of shards: one per CPU core
+    """
+    return os.cpu_count() or 1
+
+
+class ShardSet:
+    """
+    وضعیت shardها از دید پردازه اصلی
+    Per-shard progress as seen by the parent job, reported in the progress
+    output as the "shards" snapshot
+    """
+
+    def __init__(self, count: int):
+        self.shards: List[Dict] = [
+            {"total": 0, "done": 0, "skipped": 0, "results": 0, "running": True, "adaptive": None}
+            for _ in range(count)
+        ]
+
+    def update(self, index: int, report: Dict):
+        shard = self.shards[index]
+        for key in ("total", "done", "skipped", "adaptive"):
+            shard[key] = report[key]
+        shard["results"] += len(report["results"])
+
+    def finish(self, index: int):
+        self.shards[index]["running"] = False
+
+    def total(self, key: str) -> int:
+        return sum(shard[key] for shard in self.shards)
+
+    def snapshot(self) -> List[Dict]:
+        return [dict(shard) for shard in self.shards]
+
+
+def _shard_main(index: int, kind: str, targets, params: Dict, events, stop):
+    # نقطه ورود پردازه فرزند: حلقه رویداد مستقل
+    # Child process entry point: every shard runs its own event loop
+    setup_logging()
+    asyncio.run(_run_shard(index, kind, targets, params, events, stop))
+
+
+async def _run_shard(index: int, kind: str, targets, params: Dict, events, stop):
+    state: Dict = {"total": 0, "done": 0, "results": [], "skipped": 0, "cancel": False, "details": {}}
+    sent = 0
+
+    def report():
+        # ارسال نتایج جدید و شمارنده‌ها به پردازه اصلی
+        # Send new results (with their details) and counters to the parent
+        nonlocal sent
+        results = state["results"][sent:]
+        sent += len(results)
+        controller = state.get("controller")
+        events.put(("progress", index, {
+            "total": state["total"],
+            "done": state["done"],
+            "skipped": state.get("skipped", 0),
+            "adaptive": controller.snapshot() if controller is not None else None,
+            "results": [(item, state["details"].get(item)) for item in results],
+        }))
+
+    async def watch():
+        while True:
+            if stop.is_set():
+                state["cancel"] = True
+            report()
+            await asyncio.sleep(REPORT_INTERVAL)
+
+    watcher = asyncio.create_task(watch())
+    error = None
+    try:
+        if kind == "reality":
+            scanner = DomainScanner(
+                params["concurrency"],
+                verdict_ttl=params["verdict_ttl"],
+                adaptive=params["adaptive"],
+                ceiling=params.get("ceiling"),
+            )
+            state["total"] = len(targets)
+            await scanner.scan_items(targets, progress=state)
+        else:
+            # ایندکس مالکیت در پردازه فرزند فقط رنج‌های استاتیک را دارد
+            # The child's ownership index only knows the static ranges, so
+            # the shard's merged ranges are registered as the provider's
+            register_networks(kind, [net for v in (4, 6) for net in targets.networks(v)])
+            await scan_ip_ranges(kind, targets, progress=state, **params)
+    except Exception as e:
+        error = str(e)
+    finally:
+        watcher.cancel()
+        report()
+        events.put(("done", index, error))
+
+
+def _next_event(events):
+    try:
+        return events.get(timeout=REPORT_INTERVAL * 2)
+    except queue.Empty:
+        return None
+
+
+async def run_sharded_scan(
+    kind: str,
+    parts: List[Union[IntervalSet, List[str]]],
+    state: Dict,
+    params: Dict,
+    max_results: Optional[int] = None,
+) -> List[str]:
+    """
+    اجرای یک اسکن روی چند پردازه، هر کدام با بخشی از اهداف
+    Run one scan across worker processes, each with its own event loop
+    and one part of the targets: IP interval sets (scan_ip_ranges) or
+    domain lists (DomainScanner). Results, details and counters stream
+    back into the parent's progress state; once max_results are found in
+    total, or the job is canceled, every shard is told to stop. When the
+    job holds a state["limiter"], every shard's controller is capped at an
+    equal part of the job's share of the budget, so together the shards
+    run no more checks than the job may.
+    """
+    state.setdefault("results", [])
+    state.setdefault("details", {})
+    if not parts:
+        # بدون هدف (مثلاً همه منابع ناموفق) پردازه‌ای ساخته نمی‌شود
+        # No targets (e.g. every source fetch failed): nothing to spawn
+        return []
+    limiter = state.get("limiter")
+    if limiter is not None:
+        # محدودکننده به پردازه‌ها منتقل نمی‌شود؛ سهم به صورت سقف ثابت داده می‌شود
+        # The limiter can't cross into the processes, so each shard gets
+        # its part of the job's share as a fixed controller ceiling
+        params = dict(params, ceiling=max(1, limiter.share() // len(parts)))
+    shards = ShardSet(len(parts))
+    state["shards"] = shards
+    ctx = multiprocessing.get_context("spawn")
+    events = ctx.Queue()
+    stop = ctx.Event()
+    processes = [
+        ctx.Process(target=_shard_main, args=(i, kind, part, params, events, stop), daemon=True)
+        for i, part in enumerate(parts)
+    ]
+    for process in processes:
+        process.start()
+    log.info("Scan sharded across %d processes", len(processes))
+
+    loop = asyncio.get_running_loop()
+    pending = set(range(len(processes)))
+    try:
+        while pending:
+            if state.get("cancel"):
+                stop.set()
+            event = await loop.run_in_executor(None, _next_event, events)
+            if event is None:
+                # پردازه‌ای که بدون پیام پایان خارج شده
+                # A shard that died without its "done" message
+                for i in list(pending):
+                    if not processes[i].is_alive():
+                        log.error("Shard %d exited with code %s", i, processes[i].exitcode)
+                        pending.discard(i)
+                        shards.finish(i)
+                continue
+            name, index, payload = event
+            if name == "done":
+                pending.discard(index)
+                shards.finish(index)
+                if payload:
+                    log.error("Shard %d failed: %s", index, payload)
+            else:
+                shards.update(index, payload)
+                for item, details in payload["results"]:
+                    state["results"].append(item)
+                    if details is not None:
+                        state["details"][item] = details
+                for key in ("total", "done", "skipped"):
+                    state[key] = shards.total(key)
+                if max_results is not None and len(state["results"]) >= max_results and not stop.is_set():
+                    log.info("Enough results found across shards, stopping early")
+                    stop.set()
+            notify(state)
+    finally:
+        stop.set()
+        await loop.run_in_executor(None, _join, processes)
+    return state["results"]
+
+
+def _join(processes: List):
+    for process in processes:
+        process.join(JOIN_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+
+
+def rank_by_latency(state: Dict, count: int) -> List[str]:
+    """
+    بهترین IPها بر اساس میانه تأخیر ثبت‌شده در جزئیات
+    The `count` results with the lowest recorded median latency
+    """
+    def latency(ip: str) -> float:
+        median = state["details"].get(ip, {}).get("latency", {}).get("median_ms")
+        return median if median is not None else float("inf")
+
+    return sorted(state["results"], key=latency)[:count]
+
+
+async def scan_ips_sharded(
+    provider: str,
+    ranges: IntervalSet,
+    shards: int,
+    state: Dict,
+    required_count: int = 2,
+    overfetch_factor: float = 2.5,
+    **params,
+) -> List[str]:
+    """
+    اسکن IP چندپردازه‌ای؛ بازه‌ها در مرز بلوک‌ها تقسیم می‌شوند
+    Sharded IP scan: the ranges are split on block boundaries and every
+    shard runs scan_ip_ranges(); the global early stop and final ranking
+    use the same overfetch target as a single-process scan
+    """
+    params = dict(params, required_count=required_count, overfetch_factor=overfetch_factor)
+    max_needed = int(required_count * overfetch_factor)
+    parts = ranges.split(shards)
+    if not parts:
+        return []
+    await run_sharded_scan(provider, parts, state, params, max_results=max_needed)
+    return rank_by_latency(state, required_count)
+
+
+async def scan_domains_sharded(
+    domains: List[str],
+    shards: int,
+    state: Dict,
+    concurrency: int = 20,
+    adaptive: bool = True,
+    verdict_ttl: float = DEFAULT_VERDICT_TTL,
+) -> List[str]:
+    """
+    اسکن دامنه چندپردازه‌ای با تقسیم نوبتی لیست
+    Sharded domain scan: the list is dealt round-robin across shards;
+    the results are ranked by Reality score
+    """
+    domains = list(domains)
+    parts = [domains[i::shards] for i in range(shards) if domains[i::shards]]
+    if not parts:
+        return []
+    params = {"concurrency": concurrency, "adaptive": adaptive, "verdict_ttl": verdict_ttl}
+    await run_sharded_scan("reality", parts, state, params)
+    return rank_by_score(state["results"], state["details"])
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from .metrics import SOURCE_FETCH_SECONDS
+from .logs import get_logger
+
+log = get_logger("sources")
+
+# ---------------------- کش محلی منابع آنلاین ----------------------
+# On-disk cache of fetched source lists with ETag / Last-Modified revalidation
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "data", "cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# ارجاع به تسک‌های پس‌زمینه تا قبل از اتمام جمع‌آوری نشوند
+# Keep references so background revalidations aren't garbage-collected
+_background: Set[asyncio.Task] = set()
+
+
+def _paths(url: str):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".body"), os.path.join(CACHE_DIR, key + ".json")
+
+
+def cached_path(url: str) -> Optional[str]:
+    """
+    مسیر نسخه کش‌شده یک منبع
+    Return the path of the cached body of a source, or None
+    """
+    body_path, _ = _paths(url)
+    return body_path if os.path.isfile(body_path) else None
+
+
+def _read_meta(url: str) -> Dict:
+    _, meta_path = _paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(url: str, meta: Dict):
+    _, meta_path = _paths(url)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+async def fetch_source(client: httpx.AsyncClient, url: str, timeout: float = 10) -> Optional[str]:
+    """
+    دریافت شرطی یک منبع (ETag / If-Modified-Since) و به‌روزرسانی کش
+    Conditional GET of one source, streamed straight into the cache file.
+    Returns the path of the fresh or revalidated body; falls back to the
+    cached copy when the request fails.
+    """
+    cached = cached_path(url)
+    meta = _read_meta(url) if cached is not None else {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    body_path, _ = _paths(url)
+    tmp = f"{body_path}.{id(asyncio.current_task())}.tmp"
+    start = time.perf_counter()
+    result = "failed"
+    try:
+        async with client.stream(
+            "GET", url, headers=headers, timeout=timeout, follow_redirects=True
+        ) as resp:
+            if resp.status_code == 304 and cached is not None:
+                log.info("Source not modified: %s", url)
+                result = "not_modified"
+                return cached
+            resp.raise_for_status()
+            with open(tmp, "wb") as f:
+                async for chunk in resp.aiter_bytes():
+                    f.write(chunk)
+            os.replace(tmp, body_path)
+            _write_meta(url, {
+                "url": url,
+                "etag": resp.headers.get("etag"),
+                "last_modified": resp.headers.get("last-modified"),
+            })
+        result = "fetched"
+        return body_path
+    except Exception as e:
+        log.warning("Failed to fetch from %s: %s", url, e)
+        return cached
+    finally:
+        SOURCE_FETCH_SECONDS.observe(time.perf_counter() - start, url, result)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+async def _revalidate(urls: List[str]):
+    async with httpx.AsyncClient() as client:
+        await asyncio.gather(*(fetch_source(client, url) for url in urls))
+
+
+async def load_sources(urls: List[str], stale_ok: bool = True) -> Dict[str, str]:
+    """
+    دریافت همزمان منابع؛ نسخه‌های کش‌شده فوراً استفاده و در پس‌زمینه بازبینی می‌شوند
+    Fetch every source in parallel and return the path of each cached body.
+    With stale_ok, sources already in the cache are returned immediately and
+    revalidated in the background, so a scan can start right away; only
+    uncached sources are waited for.
+    """
+    paths: Dict[str, str] = {}
+    missing = []
+    for url in urls:
+        cached = cached_path(url) if stale_ok else None
+        if cached is not None:
+            paths[url] = cached
+        else:
+            missing.append(url)
+
+    stale = [url for url in urls if url in paths]
+    if stale:
+        task = asyncio.create_task(_revalidate(stale))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    if missing:
+        async with httpx.AsyncClient() as client:
+            fetched = await asyncio.gather(*(fetch_source(client, url) for url in missing))
+        for url, path in zip(missing, fetched):
+            if path is not None:
+                paths[url] = path
+    return paths
@@ -0,0 +1,210 @@
+import re
+import ipaddress
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .logs import get_logger
+
+# ---------------------- فرمت‌های منابع (text / cidr / dlc) ----------------------
+# Pluggable source formats: every source entry declares its "format"
+
+CHUNK_SIZE = 64 * 1024
+
+_HOSTNAME_LABEL = re.compile(r"^(?!-)[a-z0-9-]{1,63}(?<!-)$")
+# TLD حرفی یا IDN به صورت punycode (مثل xn--p1ai)
+# A TLD is alphabetic, or an IDN in punycode form (e.g. xn--p1ai)
+_TLD = re.compile(r"^(?:[a-z]+|xn--[a-z0-9-]+)$")
+
+log = get_logger("sources")
+
+
+def is_valid_hostname(name: str) -> bool:
+    """
+    بررسی معتبر بودن نام دامنه (حداقل دو بخش و TLD حرفی یا punycode)
+    Check that name is a syntactically valid multi-label host name whose
+    TLD is alphabetic or a punycode IDN
+    """
+    if not name or len(name) > 253:
+        return False
+    labels = name.lower().rstrip(".").split(".")
+    if len(labels) < 2 or not _TLD.match(labels[-1]):
+        return False
+    return all(_HOSTNAME_LABEL.match(label) for label in labels)
+
+
+# ------------------ متن ساده ------------------
+
+# پیشوندهای قواعد v2fly؛ فقط full و domain نام میزبان واقعی هستند
+# v2fly rule prefixes; only full: and domain: carry a concrete host name
+_SKIPPED_PREFIXES = ("regexp:", "keyword:", "include:")
+_KEPT_PREFIXES = ("full:", "domain:")
+
+
+def _iter_lines(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line
+
+
+def iter_text(path: str, entry: Dict) -> Iterator[str]:
+    """
+    خواندن لیست متنی (هر خط یک آیتم، با پشتیبانی از قواعد v2fly)
+    Plain text list, one item per line; v2fly rule syntax is understood
+    """
+    for line in _iter_lines(path):
+        if line.startswith(_SKIPPED_PREFIXES):
+            continue
+        for prefix in _KEPT_PREFIXES:
+            if line.startswith(prefix):
+                line = line[len(prefix):]
+                break
+        # حذف attributeها مانند "@cn" و پیشوند "+."
+        # Drop attributes such as "@cn" and a leading "+." wildcard
+        line = line.split("@", 1)[0].strip()
+        if line.startswith("+."):
+            line = line[2:]
+        if line:
+            yield line
+
+
+def iter_cidr(path: str, entry: Dict) -> Iterator[str]:
+    """
+    خواندن لیست CIDR/IP (خطوط نامعتبر کنار گذاشته می‌شوند)
+    CIDR / IP list; invalid lines are dropped
+    """
+    for line in _iter_lines(path):
+        try:
+            ipaddress.ip_network(line, strict=False)
+        except ValueError:
+            continue
+        yield line
+
+
+# ------------------ GeoSite (dlc.dat) ------------------
+
+# انواع دامنه در GeoSite: Plain=0 (keyword), Regex=1, Domain=2, Full=3
+# GeoSite domain types: Plain=0 (keyword), Regex=1, Domain=2, Full=3
+GEOSITE_HOST_TYPES = (2, 3)
+
+
+def _read_varint(buf, pos: int) -> Tuple[Optional[int], int]:
+    result = 0
+    shift = 0
+    while pos < len(buf):
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+    return None, pos
+
+
+def _iter_fields(buf) -> Iterator[Tuple[int, int, object]]:
+    # پیمایش فیلدهای یک پیام protobuf کامل
+    # Walk the fields of one complete protobuf message
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        if key is None:
+            return
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 2:
+            length, pos = _read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            return
+        yield field, wire, value
+
+
+class GeoSiteDecoder:
+    """
+    دیکودر جریانی فایل GeoSite (dlc.dat) با فیلتر دسته‌بندی
+    Streaming GeoSiteList decoder. Bytes are fed in chunks; each GeoSite
+    entry is decoded as soon as it is complete, and entries whose category
+    (country_code) is not wanted are skipped without decoding their domains.
+    """
+
+    def __init__(self, categories: Optional[Iterable[str]] = None):
+        self.categories = {c.lower() for c in categories} if categories else None
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """
+        افزودن داده و بازگرداندن دامنه‌های ورودی‌های کامل‌شده
+        Add a chunk and return the host names of every completed entry
+        """
+        self._buf += chunk
+        domains: List[str] = []
+        pos = 0
+        while True:
+            key, p = _read_varint(self._buf, pos)
+            if key is None:
+                break
+            length, p = _read_varint(self._buf, p)
+            if length is None or p + length > len(self._buf):
+                break
+            if key == 0x0A:  # GeoSiteList.entry (field 1, length-delimited)
+                domains.extend(self._decode_site(bytes(self._buf[p:p + length])))
+            pos = p + length
+        del self._buf[:pos]
+        return domains
+
+    def _decode_site(self, site) -> List[str]:
+        domains = []
+        for field, wire, value in _iter_fields(site):
+            if field == 1 and wire == 2:
+                if self.categories is not None and value.decode().lower() not in self.categories:
+                    return []
+            elif field == 2 and wire == 2:
+                domain_type, host = 0, None
+                for f, w, v in _iter_fields(value):
+                    if f == 1 and w == 0:
+                        domain_type = v
+                    elif f == 2 and w == 2:
+                        host = v.decode("utf-8", errors="replace")
+                if host and domain_type in GEOSITE_HOST_TYPES:
+                    domains.append(host)
+        return domains
+
+
+def iter_geosite(path: str, entry: Dict) -> Iterator[str]:
+    """
+    خواندن جریانی dlc.dat با فیلتر دسته‌های مشخص‌شده در منبع
+    Stream host names out of a GeoSite file, filtered by entry["categories"]
+    """
+    decoder = GeoSiteDecoder(entry.get("categories"))
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield from decoder.feed(chunk)
+
+
+SOURCE_FORMATS: Dict[str, Callable[[str, Dict], Iterator[str]]] = {
+    "text": iter_text,
+    "cidr": iter_cidr,
+    "dlc": iter_geosite,
+}
+
+
+def iter_source_items(path: str, entry: Dict) -> Iterator[str]:
+    """
+    خواندن آیتم‌های یک منبع بر اساس فرمت اعلام‌شده
+    Yield the items of a cached source body according to its declared format
+    """
+    fmt = entry.get("format", "text")
+    parser = SOURCE_FORMATS.get(fmt)
+    if parser is None:
+        log.warning("Unknown source format %r for %s", fmt, entry.get("url"))
+        return iter(())
+    return parser(path, entry)
@@ -54,18 +54,26 @@ def get_active_domain_sources() -> List[str]:
     دریافت URL منابع فعال دامنه
     Get URLs of enabled domain sources
     """
-    return [s["url"] for s in load_domain_sources() if s.get("enabled", True)]
+    return [s["url"] for s in get_active_domain_source_entries()]
 
 
-def add_domain_source(url: str):
+def get_active_domain_source_entries() -> List[Dict]:
+    """
+    دریافت منابع فعال دامنه همراه با فرمت و تنظیمات آن‌ها
+    Get enabled domain source entries, including their format settings
+    """
+    return [s for s in load_domain_sources() if s.get("enabled", True)]
+
+
+def add_domain_source(url: str, fmt: str = "text"):
     """
     افزودن یک منبع دامنه جدید
-    Add a new domain source
+    Add a new domain source with its format ("text" or "dlc")
     """
     sources = load_domain_sources()
     if any(s["url"] == url for s in sources):
         raise ValueError("URL already exists")
-    sources.append({"url": url, "enabled": True})
+    sources.append({"url": url, "enabled": True, "format": fmt})
     save_domain_sources(sources)
 
 
@@ -118,8 +126,16 @@ def get_ip_sources(provider: str) -> List[str]:
     دریافت URL منابع IP فعال برای یک provider خاص
     Get list of enabled IP source URLs for a given provider
     """
+    return [s["url"] for s in get_ip_source_entries(provider)]
+
+
+def get_ip_source_entries(provider: str) -> List[Dict]:
+    """
+    دریافت منابع IP فعال یک provider همراه با فرمت آن‌ها
+    Get enabled IP source entries for a given provider
+    """
     return [
-        s["url"]
+        s
         for s in load_ip_sources()
         if s.get("enabled", True) and s.get("provider", "").lower() == provider.lower()
     ]
@@ -133,7 +149,7 @@ def add_ip_source(url: str, provider: str):
     sources = load_ip_sources()
     if any(s["url"] == url for s in sources):
         raise ValueError("URL already exists")
-    sources.append({"url": url, "enabled": True, "provider": provider})
+    sources.append({"url": url, "enabled": True, "provider": provider, "format": "cidr"})
     save_ip_sources(sources)
 
 
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import sqlite3
+from typing import Dict, FrozenSet, List, Optional
+
+# ---------------------- ذخیره‌سازی پایدار نتایج بررسی ----------------------
+# Persistent per-target verdict store (embedded SQLite)
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "data", "verdicts.sqlite3")
+
+# مدت اعتبار پیش‌فرض نتایج (ثانیه)
+# Default time a verdict stays fresh enough to skip re-checking (seconds)
+DEFAULT_VERDICT_TTL = 6 * 3600
+
+# مدت اعتبار نتایج ناموفق (ثانیه)؛ شکست ممکن است گذرا باشد
+# How long a failed verdict is reused (seconds); failures may be transient
+# (resolver errors, timeouts under congestion), so they expire sooner
+FAILED_VERDICT_TTL = 15 * 60
+
+# مدت اعتبار آمار بلوک‌ها برای شروع اسکن‌های بعدی (ثانیه)
+# How long subnet stats keep seeding later scans (seconds)
+DEFAULT_SUBNET_TTL = 7 * 24 * 3600
+
+
+def _stages(profile: str) -> FrozenSet[str]:
+    return frozenset(stage for stage in profile.split(",") if stage)
+
+
+def profile_covers(stricter: str, profile: str) -> bool:
+    """
+    آیا پروفایل اول همه مراحل الزامی پروفایل دوم را دارد
+    Whether check profile `stricter` requires every stage `profile` does.
+    Profiles are comma-separated names of the required check stages.
+    """
+    return _stages(stricter) >= _stages(profile)
+
+
+class VerdictStore:
+    """
+    نگهداری نتیجه، زمان‌بندی مراحل و زمان بررسی هر هدف
+    Keeps the verdict, stage timings and check time of every target, per
+    scan kind ("reality", "fastly", "cloudflare") and check profile (the
+    stages the verdict required), plus accumulated per-block stats of
+    sampling scans. A clean verdict is only reused by a check with an
+    equal or more relaxed profile, a failed one only by an equal or
+    stricter profile. Verdict writes are buffered and flushed in batches
+    so recording stays cheap on the event loop.
+    """
+
+    def __init__(self, path: str = DB_PATH, batch_size: int = 200):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending: List[tuple] = []
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # جدول‌های قدیمی بدون پروفایل فقط کش هستند و دوباره ساخته می‌شوند
+        # Verdicts from before check profiles are only a cache: dropped
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(verdicts)")]
+        if columns and "profile" not in columns:
+            self._db.execute("DROP TABLE verdicts")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS verdicts (
+                kind TEXT NOT NULL,
+                target TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                clean INTEGER NOT NULL,
+                details TEXT,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (kind, target, profile)
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS verdicts_clean ON verdicts (kind, clean, checked_at)"
+        )
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subnets (
+                kind TEXT NOT NULL,
+                subnet TEXT NOT NULL,
+                probes INTEGER NOT NULL,
+                hits INTEGER NOT NULL,
+                best_ms REAL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (kind, subnet)
+            )
+            """
+        )
+        self._db.commit()
+
+    def record(
+        self,
+        kind: str,
+        target: str,
+        clean: bool,
+        details: Optional[Dict] = None,
+        profile: str = "",
+    ):
+        """
+        ثبت نتیجه یک هدف (در بافر، با ذخیره دسته‌ای)
+        Record the verdict of one target under the check profile that
+        produced it; buffered and written in batches
+        """
+        self._pending.append(
+            (kind, target, profile, int(clean), json.dumps(details) if details else None, time.time())
+        )
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        نوشتن نتایج بافرشده در پایگاه داده
+        Write buffered verdicts to the database
+        """
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        self._db.executemany(
+            "INSERT OR REPLACE INTO verdicts (kind, target, profile, clean, details, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._db.commit()
+
+    def get(
+        self,
+        kind: str,
+        target: str,
+        ttl: float = DEFAULT_VERDICT_TTL,
+        profile: str = "",
+        failed_ttl: float = FAILED_VERDICT_TTL,
+    ) -> Optional[Dict]:
+        """
+        نتیجه اخیر یک هدف در صورت تازه بودن و سازگاری پروفایل
+        Return the most recent verdict of target that holds for `profile`:
+        a clean one checked within ttl by an equal or stricter profile, a
+        failed one checked within min(ttl, failed_ttl) by an equal or more
+        relaxed profile
+        """
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT profile, clean, details, checked_at FROM verdicts "
+            "WHERE kind = ? AND target = ? AND checked_at >= ? ORDER BY checked_at DESC",
+            (kind, target, now - ttl),
+        ).fetchall()
+        for stored, clean, details, checked_at in rows:
+            if clean:
+                holds = profile_covers(stored, profile)
+            else:
+                holds = checked_at >= now - failed_ttl and profile_covers(profile, stored)
+            if holds:
+                return {
+                    "clean": bool(clean),
+                    "details": json.loads(details) if details else {},
+                    "checked_at": checked_at,
+                }
+        return None
+
+    def known_clean(
+        self,
+        kind: str,
+        ttl: float = DEFAULT_VERDICT_TTL,
+        limit: Optional[int] = None,
+        profile: str = "",
+    ) -> List[Dict]:
+        """
+        هدف‌های پاکی که در بازه TTL بررسی شده‌اند (جدیدترین اول)
+        Targets found clean within ttl by an equal or stricter profile than
+        `profile`, most recently checked first
+        """
+        self.flush()
+        rows = self._db.execute(
+            "SELECT target, profile, details, checked_at FROM verdicts "
+            "WHERE kind = ? AND clean = 1 AND checked_at >= ? "
+            "ORDER BY checked_at DESC",
+            (kind, time.time() - ttl),
+        )
+        found: Dict[str, Dict] = {}
+        for target, stored, details, checked_at in rows:
+            if limit is not None and len(found) >= limit:
+                break
+            if target in found or not profile_covers(stored, profile):
+                continue
+            found[target] = {
+                "target": target, "details": json.loads(details) if details else {}, "checked_at": checked_at,
+            }
+        return list(found.values())
+
+
+    def record_subnets(self, kind: str, stats: List[Dict]):
+        """
+        افزودن آمار بلوک‌های یک اسکن به آمار تجمعی
+        Add the block stats of one scan to the accumulated subnet stats
+        """
+        now = time.time()
+        self._db.executemany(
+            "INSERT INTO subnets (kind, subnet, probes, hits, best_ms, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (kind, subnet) DO UPDATE SET "
+            "probes = probes + excluded.probes, "
+            "hits = hits + excluded.hits, "
+            "best_ms = MIN(COALESCE(best_ms, excluded.best_ms), COALESCE(excluded.best_ms, best_ms)), "
+            "checked_at = excluded.checked_at",
+            [(kind, s["subnet"], s["probes"], s["hits"], s["best_ms"], now) for s in stats],
+        )
+        self._db.commit()
+
+    def best_subnets(
+        self,
+        kind: str,
+        max_age: float = DEFAULT_SUBNET_TTL,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """
+        بهترین بلوک‌های اسکن‌های قبلی (نرخ موفقیت، سپس کمترین تأخیر)
+        Blocks with hits in earlier scans, best hit rate and latency first
+        """
+        rows = self._db.execute(
+            "SELECT subnet FROM subnets "
+            "WHERE kind = ? AND hits > 0 AND checked_at >= ? "
+            "ORDER BY (hits + 1.0) / (probes + 2) DESC, COALESCE(best_ms, 1e9) ASC LIMIT ?",
+            (kind, time.time() - max_age, -1 if limit is None else limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+_store: Optional[VerdictStore] = None
+
+
+def get_verdict_store() -> VerdictStore:
+    """
+    نمونه مشترک ذخیره‌ساز نتایج
+    Shared verdict store instance
+    """
+    global _store
+    if _store is None:
+        _store = VerdictStore()
+    return _store
@@ -0,0 +1,176 @@
+import math
+import random
+import bisect
+import ipaddress
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# ---------------------- مجموعه بازه‌های آدرس و تولید تنبل اهداف ----------------------
+# Merged address interval sets and lazy target generation
+
+Interval = Tuple[int, int]
+
+
+class IntervalSet:
+    """
+    مجموعه بازه‌های صحیح ادغام‌شده برای IPv4 و IPv6
+    Merged integer interval set covering IPv4 and IPv6. CIDRs, single IPs
+    and overlapping inputs are normalized into sorted, non-overlapping
+    inclusive intervals, so dedup, counting and membership cost O(ranges)
+    memory instead of one entry per address.
+    """
+
+    def __init__(self, items: Iterable = ()):
+        self._intervals: Dict[int, List[Interval]] = {4: [], 6: []}
+        self._dirty = False
+        self.invalid: List[str] = []
+        self.update(items)
+
+    def add(self, item) -> bool:
+        """
+        افزودن یک CIDR یا IP (رشته یا شیء ipaddress)
+        Add a CIDR or single IP; returns False for invalid input
+        """
+        if isinstance(item, str):
+            item = item.strip()
+            if not item or item.startswith("#"):
+                return False
+        try:
+            net = ipaddress.ip_network(item, strict=False)
+        except ValueError:
+            self.invalid.append(str(item))
+            return False
+        start = int(net.network_address)
+        self._intervals[net.version].append((start, start + net.num_addresses - 1))
+        self._dirty = True
+        return True
+
+    def update(self, items: Iterable):
+        for item in items:
+            self.add(item)
+
+    def _normalize(self):
+        if not self._dirty:
+            return
+        for version, intervals in self._intervals.items():
+            merged: List[Interval] = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1] + 1:
+                    if end > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], end)
+                else:
+                    merged.append((start, end))
+            self._intervals[version] = merged
+        self._dirty = False
+
+    def intervals(self, version: int = 4) -> List[Interval]:
+        """
+        بازه‌های ادغام‌شده یک نسخه IP
+        Merged, sorted inclusive intervals of one IP version
+        """
+        self._normalize()
+        return self._intervals[version]
+
+    def count(self, version: Optional[int] = None) -> int:
+        """
+        تعداد دقیق آدرس‌ها (بدون تکرار)
+        Exact number of distinct addresses, optionally for one IP version
+        """
+        versions = (version,) if version else (4, 6)
+        return sum(end - start + 1 for v in versions for start, end in self.intervals(v))
+
+    def networks(self, version: int = 4) -> Iterator:
+        """
+        بازه‌ها به صورت کمینه‌ترین لیست CIDR
+        The intervals as a minimal list of CIDR networks
+        """
+        cls = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        for start, end in self.intervals(version):
+            yield from ipaddress.summarize_address_range(cls(start), cls(end))
+
+    def split(self, parts: int, prefixes: Optional[Dict[int, int]] = None) -> List["IntervalSet"]:
+        """
+        تقسیم به چند بخش با تعداد آدرس تقریباً برابر
+        Split into up to `parts` sets of roughly equal address count. Cuts
+        fall on /24 (IPv4) or /48 (IPv6) boundaries so a sampling block is
+        never shared between two parts; empty parts are dropped.
+        """
+        prefixes = prefixes or {4: 24, 6: 48}
+        shards = [IntervalSet() for _ in range(max(1, parts))]
+        for version, bits in ((4, 32), (6, 128)):
+            intervals = self.intervals(version)
+            quota = -(-sum(end - start + 1 for start, end in intervals) // len(shards))
+            host_bits = bits - prefixes[version]
+            shard, filled = 0, 0
+            for start, end in intervals:
+                while start <= end:
+                    cut = end
+                    if shard < len(shards) - 1 and end - start + 1 > quota - filled:
+                        cut = start + (quota - filled) - 1
+                        cut = min(end, (((cut >> host_bits) + 1) << host_bits) - 1)
+                    shards[shard]._intervals[version].append((start, cut))
+                    filled += cut - start + 1
+                    start = cut + 1
+                    if filled >= quota and shard < len(shards) - 1:
+                        shard, filled = shard + 1, 0
+        return [part for part in shards if part]
+
+    def __contains__(self, ip) -> bool:
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        intervals = self.intervals(addr.version)
+        value = int(addr)
+        pos = bisect.bisect_right(intervals, (value, float("inf"))) - 1
+        return pos >= 0 and intervals[pos][0] <= value <= intervals[pos][1]
+
+    def __bool__(self) -> bool:
+        return any(self.intervals(v) for v in (4, 6))
+
+
+def _random_coprime(n: int, rng: random.Random) -> int:
+    # ضریب تصادفی نسبت به n اول برای ساخت جایگشت کامل
+    # Random multiplier coprime to n, so (a*i + b) % n is a full permutation
+    if n <= 2:
+        return 1
+    while True:
+        a = rng.randrange(1, n)
+        if math.gcd(a, n) == 1:
+            return a
+
+
+def iter_addresses(
+    intervals: List[Interval],
+    version: int = 4,
+    shuffle: bool = True,
+    seed: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    پیمایش تنبل آدرس‌ها، به صورت ترتیبی یا جایگشت تصادفی روی کل فضای آدرس
+    Lazily yield every address of the intervals, either in order or as a
+    random permutation over the combined integer address space so early
+    results are spread across all ranges. Memory use is O(len(intervals)).
+    """
+    if not intervals:
+        return
+    cls = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+
+    if not shuffle:
+        for start, end in intervals:
+            for value in range(start, end + 1):
+                yield str(cls(value))
+        return
+
+    offsets = []
+    total = 0
+    for start, end in intervals:
+        offsets.append(total)
+        total += end - start + 1
+
+    rng = random.Random(seed)
+    a = _random_coprime(total, rng)
+    b = rng.randrange(total)
+    for i in range(total):
+        index = (a * i + b) % total
+        pos = bisect.bisect_right(offsets, index) - 1
+        yield str(cls(intervals[pos][0] + index - offsets[pos]))
@@ -1,212 +1,527 @@
-import socket
-import ssl
+import time
+import heapq
+import itertools
 import asyncio
 import httpx
-import platform
-import subprocess
-import ipaddress
-from typing import List, Optional, Set, Dict
-from ipwhois import IPWhois
-
-from .sources import get_active_sources, get_ip_sources, get_static_ip_ranges
-
-# رنگ‌ها برای چاپ ترمینال
-# Terminal color codes
-GREEN = "\033[92m"
-RED = "\033[91m"
-YELLOW = "\033[93m"
-CYAN = "\033[96m"
-PURPLE = "\033[95m"
-GRAY = "\033[90m"
-RESET = "\033[0m"
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+from .sources import get_active_domain_source_entries, get_ip_source_entries, get_static_ip_ranges
+from .targets import IntervalSet, iter_addresses
+from .probes import reality_probe, tcp_connect, tls_handshake
+from .ownership import check_ownership, check_rdap_ownership, get_ownership_index, register_networks
+from .ping import get_ping_engine, latency_stats
+from .progress import notify
+from .adaptive import FIXED_CONTROLLER, AdaptiveController
+from .resolver import get_resolver
+from .source_cache import fetch_source, load_sources
+from .source_formats import is_valid_hostname, iter_source_items
+from .store import DEFAULT_VERDICT_TTL, get_verdict_store
+from .sampling import SamplerGroup, SubnetSampler
+from .metrics import CHECKS_IN_FLIGHT, STAGE_SECONDS, STAGE_TOTAL, observe_stage, outcome
+from .logs import flush_summaries, get_logger
+from .pipeline import CheckPipeline, Stage
+
+# لاگرهای هر مرحله (سطح هر کدام جداگانه قابل تنظیم است)
+# Per-stage loggers; see logs.py for levels, JSON output and summaries
+scan_log = get_logger("scan")
+source_log = get_logger("sources")
+domain_log = get_logger("domain")
+ip_log = get_logger("ip")
+tcp_log = get_logger("tcp")
+tls_log = get_logger("tls")
 
 # کلاس پایه برای اسکن با قابلیت کنترل همزمانی (concurrency)
 # Base scanner class with async concurrency handling
 class BaseScanner:
-    def __init__(self, concurrency: int = 20):
+    def __init__(self, concurrency: int = 20, controller: Optional[AdaptiveController] = None):
         self.concurrency = concurrency
-        self.semaphore = asyncio.Semaphore(concurrency)
+        # کنترل‌کننده همزمانی و timeoutها (بدون آن: مقادیر ثابت)
+        # Concurrency / timeout controller; fixed values when none is given
+        self.controller = controller or AdaptiveController(concurrency, adaptive=False)
+        self.semaphore = asyncio.Semaphore(self.controller.max_limit)
+
+    def accept_item(self, item: str) -> bool:
+        """
+        فیلتر آیتم‌های منابع (در زیرکلاس‌ها بازنویسی می‌شود)
+        Filter for source items; subclasses narrow it to valid targets
+        """
+        return True
+
+    def read_items(self, path: str, entry: Dict) -> Set[str]:
+        """
+        خواندن آیتم‌های معتبر یک منبع کش‌شده بر اساس فرمت آن
+        Read the accepted items of a cached source according to its format
+        """
+        return {item for item in iter_source_items(path, entry) if self.accept_item(item)}
 
     async def fetch_list_from_url(self, client: httpx.AsyncClient, url: str) -> Set[str]:
         """
         دریافت لیست آیتم‌ها از URL
-        Fetch list of items (domains or IPs) from a given URL
+        Fetch list of items (domains or IPs) from a given plain-text URL
         """
-        try:
-            resp = await client.get(url, timeout=10)
-            resp.raise_for_status()
-            items = {
-                line.strip()
-                for line in resp.text.splitlines()
-                if line.strip() and not line.startswith("#")
-            }
-            print(f"{YELLOW}[+] Fetched {GREEN}{len(items)} items from {GRAY}{url}")
-            return items
-        except Exception as e:
-            print(f"{RED}[!] Failed to fetch from {YELLOW}{url}{RED}: {e}")
+        path = await fetch_source(client, url)
+        if path is None:
+            return set()
+        items = self.read_items(path, {"url": url})
+        source_log.info("Fetched %d items from %s", len(items), url)
+        return items
+
+    async def fetch_items(
+        self,
+        sources: List[Union[str, Dict]],
+        progress: Optional[Dict] = None,
+    ) -> Set[str]:
+        """
+        دریافت همزمان آیتم‌های همه منابع (با استفاده از کش محلی)
+        Fetch items of every source in parallel; cached lists are used right
+        away and revalidated in the background. Sources are URLs or entries
+        from the sources files, whose "format" selects the parser.
+        """
+        if progress and progress.get("cancel"):
+            scan_log.info("Scan canceled before fetching all sources")
             return set()
+        entries = [{"url": s} if isinstance(s, str) else s for s in sources]
+        paths = await load_sources([e["url"] for e in entries])
+        loop = asyncio.get_running_loop()
+        all_items = set()
+        for entry in entries:
+            path = paths.get(entry["url"])
+            if path is None:
+                continue
+            items = await loop.run_in_executor(None, self.read_items, path, entry)
+            source_log.info("Loaded %d items from %s", len(items), entry["url"])
+            all_items.update(items)
+        return all_items
 
-    async def fetch_all_from_sources(self, sources: List[str], progress: Optional[Dict] = None) -> List[str]:
+    async def fetch_all_from_sources(
+        self,
+        sources: List[Union[str, Dict]],
+        progress: Optional[Dict] = None,
+    ) -> List[str]:
         """
         دریافت تمام آیتم‌ها از منابع داده شده
         Fetch all unique items from a list of source URLs
         """
-        async with httpx.AsyncClient(verify=True) as client:
-            all_items = set()
-            for url in sources:
-                if progress and progress.get("cancel"):
-                    print("[!] Scan canceled before fetching all sources.")
+        result = list(await self.fetch_items(sources, progress=progress))
+        if progress is not None:
+            progress["total"] = len(result)
+            progress["done"] = 0
+            progress["results"] = []
+            notify(progress)
+
+        source_log.info("Total unique items fetched: %d", len(result))
+        return result
+
+    async def scan_items(self, items: List[str], progress: Optional[Dict] = None) -> List[str]:
+        raise NotImplementedError("Subclasses must implement scan_items method.")
+
+
+# ---------------------- موتور اسکن با استخر worker ----------------------
+# Bounded worker-pool scan engine
+
+async def _aiter_targets(targets: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(targets, "__aiter__"):
+        async for target in targets:
+            yield target
+    else:
+        for target in targets:
+            yield target
+
+
+async def run_worker_pool(
+    targets: Union[Iterable[str], AsyncIterable[str]],
+    check: Callable[[str], Awaitable[Optional[str]]],
+    concurrency: int = 20,
+    progress: Optional[Dict] = None,
+    max_results: Optional[int] = None,
+    controller: Optional[AdaptiveController] = None,
+) -> List[str]:
+    """
+    اجرای بررسی‌ها با worker‌ها و صف محدود (backpressure)
+    Run `check` over targets (sync or async iterable) with a fixed number
+    of workers fed from a bounded queue. Memory stays flat regardless of
+    the number of targets; the scan stops as soon as `max_results` is
+    reached or cancel is set. An error raised by `targets` ends the scan
+    and is re-raised once the checks in flight finish. A
+    progress["limiter"] (async context manager) is held around every
+    check, so a job can be capped by a budget shared with other scans. With a controller, up to controller.max_limit workers
+    run and a worker only takes a target once the controller's adaptive
+    limit admits it, so targets aren't pulled ahead of the current limit;
+    the limiter's share() is the controller's ceiling, so the adaptive
+    limit never grows past what the budget lets the job run.
+    When progress carries a "timings" list, the duration of every check
+    (seconds) is appended to it.
+    """
+    worker_count = concurrency
+    if controller is not None:
+        worker_count = controller.max_limit
+        if progress is not None:
+            progress["controller"] = controller
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    stop = asyncio.Event()
+    results: List[str] = []
+    limiter = progress.get("limiter") if progress is not None else None
+    timings = progress.get("timings") if progress is not None else None
+
+    def canceled() -> bool:
+        return bool(progress and progress.get("cancel"))
+
+    async def produce():
+        try:
+            async for target in _aiter_targets(targets):
+                if stop.is_set() or canceled():
                     break
-                items = await self.fetch_list_from_url(client, url)
-                all_items.update(items)
+                await queue.put(target)
+        finally:
+            # حتی با خطای منبع اهداف، workerها باید پایان یابند
+            # Even when the targets raise, the workers must be told to end
+            for _ in range(worker_count):
+                await queue.put(None)
 
-            result = list(all_items)
+    async def limited(target: str) -> Optional[str]:
+        if limiter is not None:
+            async with limiter:
+                return await measured(target)
+        return await measured(target)
+
+    async def measured(target: str) -> Optional[str]:
+        CHECKS_IN_FLIGHT.inc()
+        try:
+            return await check(target)
+        finally:
+            CHECKS_IN_FLIGHT.dec()
+
+    async def handle_next() -> bool:
+        target = await queue.get()
+        if target is None or canceled():
+            return False
+        start = time.perf_counter()
+        try:
+            result = await limited(target)
+        except Exception:
+            result = None
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+        if progress is not None:
+            progress["done"] += 1
+        if result and not stop.is_set():
+            results.append(result)
             if progress is not None:
-                progress["total"] = len(result)
-                progress["done"] = 0
-                progress["results"] = []
+                progress["results"].append(result)
+            if max_results is not None and len(results) >= max_results:
+                scan_log.info("Enough results found, stopping early")
+                stop.set()
+        notify(progress)
+        return True
 
-            print(f"[=] Total unique items fetched: {len(result)}")
-            return result
+    async def work():
+        while not stop.is_set():
+            if controller is not None:
+                if limiter is not None:
+                    controller.ceiling = limiter.share()
+                async with controller:
+                    more = await handle_next()
+            else:
+                more = await handle_next()
+            if not more:
+                break
 
-    async def scan_items(self, items: List[str], progress: Optional[Dict] = None) -> List[str]:
-        raise NotImplementedError("Subclasses must implement scan_items method.")
+    async def watch_cancel():
+        while not stop.is_set():
+            if canceled():
+                scan_log.info("Cancel requested, stopping early")
+                stop.set()
+                break
+            await asyncio.sleep(0.2)
+
+    producer = asyncio.create_task(produce())
+    workers = [asyncio.create_task(work()) for _ in range(worker_count)]
+    watcher = asyncio.create_task(watch_cancel())
+    all_done = asyncio.ensure_future(asyncio.gather(*workers))
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait({all_done, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stop.set()
+        for task in (producer, watcher, stopped, *workers):
+            task.cancel()
+        await asyncio.gather(producer, watcher, stopped, all_done, return_exceptions=True)
+        flush_summaries()
+    if not producer.cancelled() and producer.exception() is not None:
+        raise producer.exception()
+    return results
 
 
 # ---------------------- اسکنر دامنه (Reality) ----------------------
+
+# پروفایل بررسی دامنه‌ها (کلید نتایج ذخیره‌شده)
+# Check profile of the domain probe, keying its stored verdicts
+REALITY_PROFILE = "dns,http,tls13,x25519"
+
+
+def _interleave_families(addresses: List[str]) -> List[str]:
+    # ترتیب نوبتی IPv4/IPv6 با حفظ ترتیب DNS (مانند Happy Eyeballs)
+    # Alternate address families, keeping the resolver's order within each
+    # (as Happy Eyeballs does), so one dead family can't hide the other
+    if not addresses:
+        return []
+    v6_first = ":" in addresses[0]
+    first = [a for a in addresses if (":" in a) == v6_first]
+    second = [a for a in addresses if (":" in a) != v6_first]
+    return [a for pair in itertools.zip_longest(first, second) for a in pair if a is not None]
+
+
+def rank_by_score(domains: List[str], details: Dict[str, Dict]) -> List[str]:
+    """
+    مرتب‌سازی دامنه‌ها بر اساس امتیاز Reality در جزئیات
+    Domains ordered by the Reality score recorded in `details`, best first
+    """
+    return sorted(domains, key=lambda domain: -((details.get(domain) or {}).get("score") or 0))
+
+
 class DomainScanner(BaseScanner):
-    def __init__(self, concurrency: int = 20):
-        super().__init__(concurrency)
+    def __init__(
+        self,
+        concurrency: int = 20,
+        verdict_ttl: float = DEFAULT_VERDICT_TTL,
+        adaptive: bool = True,
+        ceiling: Optional[int] = None,
+    ):
+        super().__init__(concurrency, AdaptiveController(concurrency, adaptive=adaptive, ceiling=ceiling))
+        self.verdict_ttl = verdict_ttl
+        self.store = get_verdict_store()
+        self.details: Dict[str, Dict] = {}
 
-    def is_domain_alive(self, domain: str, timeout=3) -> bool:
-        """
-        بررسی روشن بودن دامنه (TLS handshake)
-        Check if domain is alive via TLS handshake
-        """
-        try:
-            context = ssl.create_default_context()
-            with socket.create_connection((domain, 443), timeout=timeout) as sock:
-                with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                    return bool(ssock.getpeercert())
-        except Exception:
-            return False
+    def accept_item(self, item: str) -> bool:
+        # فقط نام‌های میزبان معتبر به پروب TLS می‌رسند
+        # Only valid host names reach the TLS probe
+        return is_valid_hostname(item)
 
-    async def check_domain_not_blocked_from_iran(self, domain: str) -> bool:
+    async def probe_domain(self, domain: str, addresses: List[str]) -> Optional[Dict]:
         """
-        بررسی دسترسی دامنه از ایران (با فرض اجرای این کد از داخل ایران)
-        Check if domain is reachable from Iran (based on local IP access)
+        پروب Reality با یک اتصال (TLS و HTTP روی همان اتصال)
+        Probe a resolved domain with reality_probe(): one connection and
+        handshake, then a minimal GET on the same connection. The resolved
+        addresses are tried in turn, alternating families, until one
+        completes the handshake. Stage timeouts come from the controller,
+        which receives the TLS and HTTP outcomes. Returns the scored probe,
+        or None when connect or handshake failed on every address.
         """
-        try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                r = await client.get(f"https://{domain}", follow_redirects=True)
-                return r.status_code == 200
-        except Exception:
-            return False
+        probe = None
+        for address in _interleave_families(addresses):
+            start = time.perf_counter()
+            try:
+                probe = await reality_probe(
+                    address, domain,
+                    timeout=self.controller.timeout("tls"),
+                    http_timeout=self.controller.timeout("http"),
+                )
+                break
+            except asyncio.TimeoutError:
+                self.controller.record("tls", timed_out=True)
+                observe_stage("domain", "tls", "timeout", start)
+            except Exception as e:
+                self.controller.record("tls")
+                observe_stage("domain", "tls", "fail", start)
+                domain_log.debug(
+                    "Handshake with %s at %s failed: %r", domain, address, e, extra={"target": domain}
+                )
+        if probe is None:
+            return None
+        self.controller.record("tls", probe["connect_ms"] + probe["handshake_ms"])
+        STAGE_TOTAL.inc("domain", "tls", "pass")
+        STAGE_SECONDS.observe((probe["connect_ms"] + probe["handshake_ms"]) / 1000, "domain", "tls", "pass")
+        http = probe["http"]
+        if http is not None:
+            self.controller.record("http", http["ttfb_ms"])
+            result = outcome(http["status"] < 400)
+            STAGE_TOTAL.inc("domain", "http", result)
+            STAGE_SECONDS.observe(http["ttfb_ms"] / 1000, "domain", "http", result)
+        elif "http_error" in probe:
+            timed_out = probe["http_error"] == "timeout"
+            self.controller.record("http", timed_out=timed_out)
+            STAGE_TOTAL.inc("domain", "http", outcome(False, timed_out))
+        return probe
 
     async def check_domain_async(self, domain: str) -> Optional[str]:
         """
         بررسی دامنه به صورت async همراه با بررسی فیلتر نبودن
-        Check domain: TLS & access from Iran
+        Check domain: resolve it, then one Reality probe (TLS 1.3, X25519,
+        h2, certificate, HTTP access from Iran on the same connection).
+        Only suitable domains pass; their scored probe goes to `details`.
         """
         async with self.semaphore:
-            loop = asyncio.get_running_loop()
-            alive = await loop.run_in_executor(None, self.is_domain_alive, domain)
-            if alive:
-                iran_access = await self.check_domain_not_blocked_from_iran(domain)
-                if iran_access:
-                    print(f"{GREEN}[+] Domain {PURPLE}{domain} {GREEN}is alive and accessible from IR")
+            # نام‌های ناموجود قبل از هر اتصالی کنار گذاشته می‌شوند
+            # Dead names are dropped before any connection is attempted
+            start = time.perf_counter()
+            addresses = await get_resolver().resolve(domain)
+            observe_stage("domain", "dns", outcome(bool(addresses)), start)
+            if not addresses:
+                domain_log.info(
+                    "Domain %s does not resolve", domain, extra={"event": "unresolved", "target": domain}
+                )
+                return None
+            probe = await self.probe_domain(domain, addresses)
+            if probe is None:
+                domain_log.info(
+                    "Domain %s is not reachable", domain, extra={"event": "unreachable", "target": domain}
+                )
+                return None
+            if probe["tls_version"] != "TLSv1.3":
+                domain_log.info(
+                    "Domain %s does not support TLS 1.3", domain,
+                    extra={"event": "rejected", "target": domain, "reason": "tls_version"},
+                )
+                return None
+            if not probe["suitable"]:
+                domain_log.info(
+                    "Domain %s is blocked from Iran", domain,
+                    extra={"event": "blocked", "target": domain, "reason": probe.get("http_error", "status")},
+                )
+                return None
+            self.details[domain] = probe
+            domain_log.info(
+                "Domain %s is alive and accessible from IR (score %.0f)", domain, probe["score"],
+                extra={"event": "alive", "target": domain},
+            )
+            return domain
+
+    def rank(self, domains: List[str]) -> List[str]:
+        """
+        مرتب‌سازی دامنه‌ها بر اساس امتیاز Reality
+        Domains ordered by their Reality score, best first
+        """
+        return rank_by_score(domains, self.details)
+
+    async def check_domain_cached(self, domain: str) -> Optional[str]:
+        """
+        استفاده از نتیجه ذخیره‌شده در صورت تازه بودن، وگرنه بررسی و ثبت نتیجه
+        Reuse the stored verdict when it is younger than verdict_ttl;
+        otherwise check the domain and record the new verdict. A zero
+        verdict_ttl bypasses the store entirely.
+        """
+        if self.verdict_ttl:
+            known = self.store.get("reality", domain, self.verdict_ttl, profile=REALITY_PROFILE)
+            if known is not None:
+                if known["clean"]:
+                    self.details[domain] = known["details"]
                     return domain
-                else:
-                    print(f"{RED}[-] Domain {YELLOW}{domain} {RED}is blocked from Iran")
-                    return None
-            else:
-                print(f"{GRAY}[-] Domain {YELLOW}{domain} {GRAY}is not reachable")
                 return None
+        result = await self.check_domain_async(domain)
+        if self.verdict_ttl:
+            self.store.record(
+                "reality", domain, result is not None, self.details.get(domain), profile=REALITY_PROFILE
+            )
+        return result
 
     async def scan_items(self, domains: List[str], progress: Optional[Dict] = None) -> List[str]:
         """
         اجرای اسکن برای لیست دامنه‌ها
-        Scan list of domains and return valid/clean ones
+        Scan list of domains concurrently and return valid/clean ones,
+        ranked by Reality score. Domains checked within verdict_ttl are
+        answered from the store.
         """
-        clean = []
-        for domain in domains:
-            if progress and progress.get("cancel"):
-                print(f"{PURPLE}[!] Scan canceled by user.")
-                break
-            result = await self.check_domain_async(domain)
-            if result:
-                clean.append(result)
-                if progress is not None:
-                    progress["results"].append(result)
-            if progress is not None:
-                progress["done"] += 1
-        return clean
+        if progress is not None:
+            progress["details"] = self.details
+        try:
+            clean = await run_worker_pool(
+                domains,
+                self.check_domain_cached,
+                concurrency=self.concurrency,
+                progress=progress,
+                controller=self.controller,
+            )
+        finally:
+            self.store.flush()
+        if progress and progress.get("cancel"):
+            scan_log.info("Scan canceled by user")
+        return self.rank(clean)
 
 
 # تابع کمک برای اسکن دستی دامنه‌ها
-async def scan_manual_domains(domains: List[str], concurrency: int = 20) -> List[str]:
-    scanner = DomainScanner(concurrency)
+async def scan_manual_domains(
+    domains: List[str], concurrency: int = 20, verdict_ttl: float = DEFAULT_VERDICT_TTL
+) -> List[str]:
+    scanner = DomainScanner(concurrency, verdict_ttl=verdict_ttl)
     return await scanner.scan_items(domains)
 
 
 # تابع کمک برای اسکن خودکار دامنه‌های Reality
 async def get_reality_domains(progress: Optional[Dict] = None, concurrency: int = 20) -> List[str]:
     scanner = DomainScanner(concurrency)
-    sources = get_active_sources()
+    sources = get_active_domain_source_entries()
     domains = await scanner.fetch_all_from_sources(sources, progress=progress)
     return await scanner.scan_items(domains, progress=progress)
 
 # ---------------------- اسکنر IP (Fastly / Cloudflare) ----------------------
 
+# حداکثر تعداد آدرس یک اسکن دستی (درخواست همزمان پاسخ می‌دهد)
+# Most addresses a manual scan expands its items into; the request is
+# answered synchronously, so larger prefixes are rejected, not walked
+MANUAL_MAX_ADDRESSES = 4096
+
 class IPCleanScanner(BaseScanner):
-    def __init__(self, concurrency: int = 20, test_port: int = 443, timeout: int = 3):
-        super().__init__(concurrency)
+    def __init__(
+        self,
+        concurrency: int = 20,
+        test_port: int = 443,
+        controller: Optional[AdaptiveController] = None,
+    ):
+        super().__init__(concurrency, controller)
         self.test_port = test_port
-        self.timeout = timeout
 
-    def is_ip_alive(self, ip: str) -> bool:
+    async def connect(self, ip: str) -> Optional[float]:
         """
-        بررسی باز بودن پورت 443 (به صورت sync)
-        Check if IP is reachable on port 443
+        اتصال به پورت تست با timeout فعلی و ثبت نتیجه در کنترل‌کننده
+        Connect to the test port with the current TCP timeout and report the
+        outcome to the controller; returns the connect RTT in ms or None
         """
-        try:
-            with socket.create_connection((ip, self.test_port), timeout=self.timeout):
-                return True
-        except Exception:
-            return False
+        timeout = self.controller.timeout("tcp")
+        start = time.perf_counter()
+        rtt = await tcp_connect(ip, self.test_port, timeout)
+        timed_out = rtt is None and time.perf_counter() - start >= timeout
+        self.controller.record("tcp", rtt, timed_out=timed_out)
+        observe_stage("ip", "tcp", outcome(rtt is not None, timed_out), start)
+        return rtt
+
+    async def is_ip_alive(self, ip: str) -> bool:
+        """
+        بررسی باز بودن پورت 443 (اتصال غیرمسدودکننده)
+        Check if IP is reachable on the test port via a non-blocking connect
+        """
+        return await self.connect(ip) is not None
 
-    async def check_ip_async(self, ip: str) -> Optional[str]:
+    async def check_ip_async(self, ip: str, details: Optional[Dict] = None) -> Optional[str]:
         """
         بررسی async برای IP
-        Async check if IP is alive
+        Async check if IP is alive; the connect RTT is recorded in `details`
         """
         async with self.semaphore:
-            loop = asyncio.get_running_loop()
-            alive = await loop.run_in_executor(None, self.is_ip_alive, ip)
+            rtt = await self.connect(ip)
+            alive = rtt is not None
+            if details is not None and alive:
+                details["tcp_ms"] = rtt
             if alive:
-                print(f"{CYAN}[+] IP {ip} is reachable")
+                tcp_log.debug("IP %s is reachable", ip, extra={"event": "reachable", "target": ip})
                 return ip
             else:
-                print(f"{GRAY}[-] IP {ip} is NOT reachable")
+                tcp_log.info("IP %s is not reachable", ip, extra={"event": "unreachable", "target": ip})
                 return None
 
     async def scan_items(self, ips: List[str], progress: Optional[Dict] = None) -> List[str]:
         """
         اسکن مجموعه‌ای از IPها
-        Scan a list of IPs and return those reachable
+        Scan a list of IPs concurrently and return those reachable
         """
-        clean = []
-        for ip in ips:
-            if progress and progress.get("cancel"):
-                print("[!] Scan canceled by user.")
-                break
-            result = await self.check_ip_async(ip)
-            if result:
-                clean.append(result)
-                if progress is not None:
-                    progress["results"].append(result)
-            if progress is not None:
-                progress["done"] += 1
+        clean = await run_worker_pool(
+            ips,
+            self.check_ip_async,
+            concurrency=self.concurrency,
+            progress=progress,
+            controller=self.controller,
+        )
+        if progress and progress.get("cancel"):
+            scan_log.info("Scan canceled by user")
         return clean
 
 
@@ -235,135 +550,237 @@ CLOUDFLARE_DOMAINS = [
 async def ping_ip(ip: str, count: int = 1, timeout: int = 1) -> bool:
     """
     پینگ IP و بررسی پاسخ
-    Ping an IP and check response
+    Ping an IP through the shared in-process ping engine and check response
     """
-    system = platform.system().lower()
-    ping_cmd = (
-        ["ping", "-c", str(count), "-t", str(timeout), ip] if system == "darwin"
-        else ["ping", "-c", str(count), "-W", str(timeout), ip]
-    )
-
-    loop = asyncio.get_running_loop()
-    try:
-        output = await loop.run_in_executor(
-            None,
-            lambda: subprocess.check_output(ping_cmd, stderr=subprocess.DEVNULL).decode()
-        )
-        return "bytes from" in output or "icmp_seq" in output
-    except Exception as e:
-        print(f"[!] ping failed for {ip}: {e}")
-        return False
+    return bool(await get_ping_engine().ping(ip, count=count, timeout=timeout))
 
 
-def check_whois(ip: str, provider_name: str) -> bool:
+async def check_whois(ip: str, provider_name: str, rdap_fallback: bool = True) -> bool:
     """
-    بررسی مالکیت IP با WHOIS
-    Check IP ownership via WHOIS for provider match
+    بررسی مالکیت IP (ایندکس محلی رنج‌ها، با RDAP به عنوان پشتیبان)
+    Check IP ownership against the local prefix index; RDAP is only used,
+    once per network, for IPs outside every known provider range
     """
-    try:
-        obj = IPWhois(ip)
-        res = obj.lookup_rdap()
-        asn_desc = res.get('asn_description', '').lower()
-        org_name = res.get('network', {}).get('name', '').lower()
-        provider_name = provider_name.lower()
-        return provider_name in asn_desc or provider_name in org_name
-    except Exception:
-        return False
+    return await check_ownership(ip, provider_name, rdap_fallback=rdap_fallback)
 
 
-def check_tcp_port(ip: str, port=443, timeout=2) -> bool:
+async def check_tcp_port(ip: str, port=443, timeout=2) -> bool:
     """
     بررسی باز بودن پورت TCP
     Check if given TCP port is open
     """
-    try:
-        with socket.create_connection((ip, port), timeout=timeout):
-            return True
-    except Exception:
-        return False
+    return await tcp_connect(ip, port, timeout) is not None
 
 
-async def check_tls_sni(ip: str, domain_list: list, timeout=3) -> bool:
+async def check_tls_sni(
+    ip: str,
+    domain_list: list,
+    timeout=3,
+    deadline: float = 5,
+    port: int = 443,
+) -> Optional[Dict]:
     """
-    بررسی TLS handshake با SNI برای یک لیست دامنه
-    Check TLS handshake using SNI for list of domains
+    بررسی TLS handshake با SNI برای یک لیست دامنه (به صورت موازی)
+    Race TLS handshakes for every SNI candidate in parallel and return the
+    first success (SNI, timings, TLS version, ALPN), or None once all
+    candidates failed or the overall deadline passed.
     """
-    for domain in domain_list:
-        try:
-            context = ssl.create_default_context()
-            with socket.create_connection((ip, 443), timeout=timeout) as sock:
-                with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                    if ssock.getpeercert():
-                        print(f"{GREEN}[✓] TLS success for {ip} with {domain}")
-                        return True
-        except Exception as e:
-            print(f"{RED}[✗] TLS failed for {ip} with {domain}: {e}")
-    return False
-
-
-async def is_ip_clean(ip: str, provider: str, use_tls_check: bool = True) -> bool:
+    loop = asyncio.get_running_loop()
+    tasks = {
+        asyncio.create_task(tls_handshake(ip, domain, port=port, timeout=timeout)): domain
+        for domain in domain_list
+    }
+    pending = set(tasks)
+    end = loop.time() + deadline
+    try:
+        while pending:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                tls_log.info("TLS deadline exceeded for %s", ip, extra={"event": "tls_deadline", "target": ip})
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is not None:
+                    tls_log.info(
+                        "TLS failed for %s with %s: %r", ip, tasks[task], error,
+                        extra={
+                            "event": "tls_failed", "target": ip, "sni": tasks[task],
+                            "reason": type(error).__name__,
+                        },
+                    )
+                    continue
+                result = task.result()
+                tls_log.debug(
+                    "TLS success for %s with %s (%s, %.0f ms)",
+                    ip, result["sni"], result["tls_version"], result["handshake_ms"],
+                    extra={"target": ip, "sni": result["sni"]},
+                )
+                return result
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def build_ip_pipeline(
+    provider: str,
+    use_tls_check: bool = True,
+    check_port: bool = True,
+    ping_mode: str = "required",
+    ping_count: int = 3,
+    rdap_fallback: bool = True,
+    controller: Optional[AdaptiveController] = None,
+) -> CheckPipeline:
     """
-    بررسی کامل پاک بودن IP (مالکیت، پینگ، پورت، TLS)
-    Full check for IP cleanliness
+    زنجیره مراحل بررسی پاک بودن IP
+    The stages of the IP cleanliness check. Ownership is looked up in the
+    local index first; RDAP only runs for IPs outside every known range.
+    The TCP connect is skipped when a TLS handshake (which connects anyway)
+    follows or the caller already connected. Ping is "required", "info"
+    (measured for latency only) or "off". Stage timeouts come from
+    `controller`, which also receives every outcome.
     """
     domains = FASTLY_DOMAINS if provider == "fastly" else CLOUDFLARE_DOMAINS
+    provider = provider.lower()
+    controller = controller or FIXED_CONTROLLER
 
-    if not check_whois(ip, provider):
-        print(f"{RED}[-] {ip} rejected: WHOIS mismatch")
-        return False
-    print(f"{GREEN}[✓] WHOIS OK for {ip}")
+    async def owner(ip: str, context: Dict) -> Optional[bool]:
+        start = time.perf_counter()
+        found = get_ownership_index().lookup(ip)
+        context["owner"] = found
+        if found is None and rdap_fallback:
+            # مالک نامشخص: تصمیم به مرحله RDAP سپرده می‌شود
+            # Unknown owner: left to the RDAP stage
+            return None
+        observe_stage("ip", "owner", outcome(found == provider), start)
+        return found == provider
 
-    if not await ping_ip(ip):
-        print(f"{RED}[-] {ip} rejected: ping failed")
-        return False
-    print(f"{GREEN}[✓] Ping OK for {ip}")
+    async def rdap(ip: str, context: Dict) -> Optional[bool]:
+        if context.get("owner") is not None:
+            return None
+        start = time.perf_counter()
+        owned = await check_rdap_ownership(ip, provider)
+        observe_stage("ip", "rdap", outcome(owned), start)
+        return owned
 
-    if not check_tcp_port(ip):
-        print(f"{RED}[-] {ip} rejected: TCP port closed")
-        return False
-    print(f"{GREEN}[✓] TCP port OK for {ip}")
+    async def ping(ip: str, context: Dict) -> Optional[bool]:
+        start = time.perf_counter()
+        samples, timed_out = await get_ping_engine().ping_outcome(
+            ip, count=ping_count, timeout=controller.timeout("ping")
+        )
+        observe_stage("ip", "ping", outcome(bool(samples), timed_out), start)
+        if not samples:
+            controller.record("ping", timed_out=timed_out)
+            return False
+        controller.record("ping", min(samples))
+        context["details"]["ping_ms"] = samples
+        return True
+
+    async def tcp(ip: str, context: Dict) -> Optional[bool]:
+        if "tcp_ms" in context["details"]:
+            return None
+        timeout = controller.timeout("tcp")
+        start = time.perf_counter()
+        rtt = await tcp_connect(ip, 443, timeout=timeout)
+        timed_out = rtt is None and time.perf_counter() - start >= timeout
+        controller.record("tcp", rtt, timed_out=timed_out)
+        observe_stage("ip", "tcp", outcome(rtt is not None, timed_out), start)
+        if rtt is None:
+            return False
+        context["details"]["tcp_ms"] = rtt
+        return True
 
-    if use_tls_check:
-        if not await check_tls_sni(ip, domains):
-            print(f"{RED}[-] {ip} rejected: TLS SNI failed")
+    async def tls(ip: str, context: Dict) -> Optional[bool]:
+        timeout = controller.timeout("tls")
+        deadline = timeout + 2
+        start = time.perf_counter()
+        result = await check_tls_sni(ip, domains, timeout=timeout, deadline=deadline)
+        timed_out = not result and time.perf_counter() - start >= deadline
+        controller.record("tls", result["handshake_ms"] if result else None, timed_out=timed_out)
+        observe_stage("ip", "tls", outcome(bool(result), timed_out), start)
+        if not result:
             return False
-        print(f"{GREEN}[✓] TLS OK for {ip}")
+        context["details"]["tls"] = result
+        return True
+
+    # برآورد اولیه هزینه (ثانیه) و نرخ قبولی؛ با نتایج اسکن به‌روز می‌شوند
+    # Initial cost (seconds) and pass-rate estimates, refined as the scan runs
+    return CheckPipeline([
+        Stage("owner", owner, cost=0.00001, pass_rate=0.95),
+        Stage("rdap", rdap, cost=2.0, pass_rate=0.5, after=("owner",),
+              mode="required" if rdap_fallback else "off"),
+        Stage("tcp", tcp, cost=0.1, pass_rate=0.5,
+              mode="required" if check_port and not use_tls_check else "off"),
+        Stage("ping", ping, cost=0.1, pass_rate=0.7, mode=ping_mode),
+        Stage("tls", tls, cost=0.3, pass_rate=0.5, mode="required" if use_tls_check else "off"),
+    ])
+
+
+async def is_ip_clean(
+    ip: str,
+    provider: str,
+    use_tls_check: bool = True,
+    check_port: bool = True,
+    details: Optional[Dict] = None,
+    ping_count: int = 3,
+    controller: Optional[AdaptiveController] = None,
+    ping_mode: str = "required",
+    pipeline: Optional[CheckPipeline] = None,
+) -> bool:
+    """
+    بررسی کامل پاک بودن IP (مالکیت، پینگ، پورت، TLS)
+    Full check for IP cleanliness through the stages of
+    build_ip_pipeline(), cheapest-per-rejection first. Pass check_port=False
+    when the caller has already verified port 443 (e.g. via
+    IPCleanScanner.check_ip_async). A scan should build one pipeline and
+    pass it for every IP, so the stage order follows the measured costs
+    and pass rates. If `details` is given, the RTT of every stage (ping
+    samples, TCP connect, TLS handshake) is recorded in it, and the
+    latency stats of the ping samples (or, without them, of the TCP or
+    TLS connect) under "latency".
+    """
+    details = details if details is not None else {}
+    pipeline = pipeline or build_ip_pipeline(
+        provider, use_tls_check=use_tls_check, check_port=check_port,
+        ping_mode=ping_mode, ping_count=ping_count, controller=controller,
+    )
+
+    rejected = await pipeline.run(ip, {"details": details})
+    if rejected is not None:
+        ip_log.info(
+            "%s rejected: %s check failed", ip, rejected,
+            extra={"event": "rejected", "target": ip, "reason": rejected},
+        )
+        return False
+
+    # آمار تأخیر فقط از یک نوع نمونه (ترجیحاً پینگ)
+    # The latency stats come from one kind of sample only, so median and
+    # jitter compare like with like: the ping samples, else the TCP
+    # connect, else the connect of the TLS handshake
+    if details.get("ping_ms"):
+        source, rtts = "ping", details["ping_ms"]
+    elif "tcp_ms" in details:
+        source, rtts = "tcp", [details["tcp_ms"]]
+    elif "tls" in details:
+        source, rtts = "tls", [details["tls"]["connect_ms"]]
+    else:
+        source, rtts = None, []
+    details["latency"] = dict(latency_stats(rtts), source=source)
 
-    print(f"{PURPLE}[✔] {ip} is clean and usable")
+    ip_log.info("%s is clean and usable", ip, extra={"event": "clean", "target": ip})
     return True
 
-def ping_latency(ip: str, count: int = 1, timeout: int = 1) -> float:
+async def ping_latency(ip: str, count: int = 1, timeout: int = 1) -> float:
     """
     اندازه‌گیری latency پینگ برای مرتب‌سازی
     Measure ping latency for an IP (used for sorting clean IPs)
     """
-    system = platform.system()
-    try:
-        if system == "Darwin":  # macOS
-            output = subprocess.check_output(
-                ["ping", "-c", str(count), "-t", str(timeout), ip],
-                stderr=subprocess.DEVNULL
-            ).decode()
-        elif system == "Windows":
-            output = subprocess.check_output(
-                ["ping", "-n", str(count), "-w", str(timeout * 1000), ip],
-                stderr=subprocess.DEVNULL
-            ).decode()
-        else:  # Linux
-            output = subprocess.check_output(
-                ["ping", "-c", str(count), "-W", str(timeout), ip],
-                stderr=subprocess.DEVNULL
-            ).decode()
-
-        for line in output.splitlines():
-            if "time=" in line.lower():
-                part = line.lower().split("time=")[1]
-                time_str = "".join(c for c in part if (c.isdigit() or c == "."))
-                return float(time_str)
-        return float("inf")
-    except Exception as e:
-        print(f"[!] ping latency failed for {ip} on {system}: {e}")
-        return float("inf")
+    samples = await get_ping_engine().ping(ip, count=count, timeout=timeout)
+    return min(samples) if samples else float("inf")
 
 
 async def get_clean_ips_with_lowest_ping(
@@ -373,121 +790,274 @@ async def get_clean_ips_with_lowest_ping(
     progress: Optional[Dict] = None,
     concurrency: int = 20,
     use_tls_check: bool = True,
+    shuffle: bool = True,
+    verdict_ttl: float = DEFAULT_VERDICT_TTL,
+    adaptive: bool = True,
+    sampling: bool = True,
+    include_ipv6: bool = False,
+    ping_mode: str = "required",
 ) -> List[str]:
     """
     دریافت IPهای تمیز با کمترین پینگ
-    Get clean IPs with lowest latency from Fastly/Cloudflare sources
+    Get clean IPs with lowest latency from Fastly/Cloudflare sources:
+    fetch the provider's ranges, then scan them with scan_ip_ranges().
     """
-    progress = progress or {}
+    progress = progress if progress is not None else {}
+    ranges = await fetch_ip_ranges(provider, progress=progress, concurrency=concurrency)
+    if ranges is None:
+        return []
+    return await scan_ip_ranges(
+        provider,
+        ranges,
+        required_count=required_count,
+        overfetch_factor=overfetch_factor,
+        progress=progress,
+        concurrency=concurrency,
+        use_tls_check=use_tls_check,
+        shuffle=shuffle,
+        verdict_ttl=verdict_ttl,
+        adaptive=adaptive,
+        sampling=sampling,
+        include_ipv6=include_ipv6,
+        ping_mode=ping_mode,
+    )
+
+
+async def fetch_ip_ranges(
+    provider: str,
+    progress: Optional[Dict] = None,
+    concurrency: int = 20,
+) -> Optional[IntervalSet]:
+    """
+    رنج‌های استاتیک و آنلاین یک provider در یک مجموعه بازه
+    Static and online ranges of a provider merged into one interval set;
+    None when the scan was canceled while fetching
+    """
+    # مرحله ➊: رنج‌های CIDR استاتیک
+    # Step 1: static CIDR ranges
+    ranges = IntervalSet(get_static_ip_ranges(provider))
+
+    # مرحله ➋: دریافت رنج/IP از منابع آنلاین
+    # Step 2: ranges / IPs from online sources, merged into the same interval set
+    scanner = IPCleanScanner(concurrency)
+    sources = get_ip_source_entries(provider)
+    fetched = await scanner.fetch_items(sources, progress=progress)
+    if progress and progress.get("cancel"):
+        scan_log.info("Scan canceled during fetching sources")
+        return None
+    ranges.update(fetched)
+    register_networks(provider, fetched)
+    for item in ranges.invalid:
+        source_log.warning("Invalid CIDR %s", item)
+    return ranges
+
+
+async def scan_ip_ranges(
+    provider: str,
+    ranges: IntervalSet,
+    required_count: int = 2,
+    overfetch_factor: float = 2.5,
+    progress: Optional[Dict] = None,
+    concurrency: int = 20,
+    use_tls_check: bool = True,
+    shuffle: bool = True,
+    verdict_ttl: float = DEFAULT_VERDICT_TTL,
+    adaptive: bool = True,
+    sampling: bool = True,
+    include_ipv6: bool = False,
+    ping_mode: str = "required",
+    ceiling: Optional[int] = None,
+) -> List[str]:
+    """
+    اسکن یک مجموعه بازه و رتبه‌بندی IPهای تمیز بر اساس تأخیر
+    Scan an interval set and return the clean IPs with the lowest latency.
+    IPs checked within verdict_ttl are not probed again: known-clean ones
+    inside the ranges are offered first and answered from the verdict
+    store (a zero verdict_ttl bypasses the store). With adaptive, concurrency and stage timeouts start from
+    `concurrency` and the default timeouts and follow the link's timeout
+    rate and RTTs. With sampling, every /24 is probed with a few hosts
+    first and blocks with hits are drilled into; otherwise every address
+    is walked in random order. With include_ipv6 the IPv6 ranges are
+    scanned alongside, sampled per /48 (and interleaved with IPv4 when
+    sampling is off). ping_mode sets the ping stage of the check pipeline
+    ("required", "info" or "off"). `ceiling` caps the controller's limit
+    (a shard's part of the job budget).
+    """
+    progress = progress if progress is not None else {}
     progress.setdefault("results", [])
     progress.setdefault("done", 0)
     progress.setdefault("cancel", False)
     progress.setdefault("total", 0)
+    progress.setdefault("details", {})
+    progress.setdefault("skipped", 0)
+    store = get_verdict_store()
+    controller = AdaptiveController(concurrency, adaptive=adaptive, ceiling=ceiling)
+    scanner = IPCleanScanner(concurrency, controller=controller)
+    pipeline = build_ip_pipeline(
+        provider, use_tls_check=use_tls_check, check_port=False, ping_mode=ping_mode, controller=controller
+    )
+    progress["pipeline"] = pipeline
+    # پورت توسط check_ip_async (یا handshake TLS) بررسی می‌شود
+    # The port is checked by check_ip_async (or the TLS handshake)
+    profile = pipeline.profile(implied=("tcp",))
+
+    # آدرس‌ها به صورت تنبل تولید می‌شوند: نمونه‌برداری از بلوک‌ها یا جایگشت تصادفی
+    # Addresses are generated lazily, by subnet sampling or in randomized
+    # order, never held in memory
+    max_needed = int(required_count * overfetch_factor)
+    known = set(itertools.islice(
+        (k["target"] for k in store.known_clean(provider, verdict_ttl, profile=profile) if k["target"] in ranges),
+        max_needed,
+    )) if verdict_ttl else set()
+    versions = (4, 6) if include_ipv6 else (4,)
+    sampler = None
+    if sampling:
+        priors = store.best_subnets(provider)
+        sampler = SamplerGroup([
+            SubnetSampler(ranges.intervals(v), version=v, priors=priors, exclude=known)
+            for v in versions
+        ])
+        progress["sampler"] = sampler
+    progress["total"] = sum(ranges.count(v) for v in versions)
 
-    ips = set()
+    async def candidates() -> AsyncIterator[str]:
+        for ip in known:
+            yield ip
+        if sampler is not None:
+            async for ip in sampler:
+                yield ip
+        else:
+            # پیمایش نوبتی خانواده‌های آدرس
+            # Round-robin over the address families
+            streams = [iter_addresses(ranges.intervals(v), version=v, shuffle=shuffle) for v in versions]
+            while streams:
+                for stream in list(streams):
+                    ip = next(stream, None)
+                    if ip is None:
+                        streams.remove(stream)
+                    elif ip not in known:
+                        yield ip
 
-    # مرحله ➊: دریافت IPها از CIDR استاتیک
-    for cidr in get_static_ip_ranges(provider):
-        try:
-            net = ipaddress.IPv4Network(cidr, strict=False)
-            ips.update(str(ip) for ip in net)
-        except Exception as e:
-            print(f"[!] Invalid CIDR {cidr}: {e}")
+    # نگهداری k بهترین IP در یک heap (بر اساس میانه تأخیر)
+    # Running top-k heap of the best candidates, keyed on median latency
+    best: List = []
 
-    # مرحله ➋: دریافت IP از منابع آنلاین
-    scanner = IPCleanScanner(concurrency)
-    sources = get_ip_sources(provider)
-    async with httpx.AsyncClient() as client:
-        for url in sources:
-            if progress.get("cancel"):
-                print("[!] Scan canceled during fetching sources.")
-                return []
-            fetched = await scanner.fetch_list_from_url(client, url)
-            ips.update(fetched)
-
-    ip_list = list(ips)
-    max_needed = int(required_count * overfetch_factor)
-    progress["total"] = len(ip_list)
+    def keep(ip: str, details: Dict):
+        progress["details"][ip] = details
+        median = details.get("latency", {}).get("median_ms")
+        item = (-(median if median is not None else float("inf")), ip)
+        if len(best) < required_count:
+            heapq.heappush(best, item)
+        elif item > best[0]:
+            heapq.heapreplace(best, item)
 
-    clean_ips = []
-    sem = asyncio.Semaphore(concurrency)
-    should_stop = False
+    async def verdict(ip: str) -> Optional[Dict]:
+        # جزئیات IP در صورت تمیز بودن (از ذخیره‌ساز یا بررسی جدید)، وگرنه None
+        # Details of the IP if it is clean (stored or freshly probed), else None
+        if verdict_ttl:
+            cached = store.get(provider, ip, verdict_ttl, profile=profile)
+            if cached is not None:
+                progress["skipped"] += 1
+                return cached["details"] if cached["clean"] else None
+        details = {}
+        alive = await scanner.check_ip_async(ip, details=details)
+        clean = bool(alive) and await is_ip_clean(ip, provider, details=details, pipeline=pipeline)
+        if verdict_ttl:
+            store.record(provider, ip, clean, details, profile=profile)
+        return details if clean else None
 
     # تابع داخلی برای بررسی هر IP
-    async def check_ip(ip: str):
-        async with sem:
-            if progress.get("cancel") or should_stop:
-                return None
-            try:
-                alive = await scanner.check_ip_async(ip)
-                if not alive:
-                    return None
-                clean = await is_ip_clean(ip, provider, use_tls_check=use_tls_check)
-                if clean:
-                    return ip
-            except Exception:
-                return None
+    async def check_ip(ip: str) -> Optional[str]:
+        details = None
+        try:
+            details = await verdict(ip)
+        finally:
+            if sampler is not None:
+                latency = (details or {}).get("latency", {}).get("median_ms")
+                sampler.record(ip, details is not None, latency)
+        if details is None:
             return None
-
-    tasks = [asyncio.create_task(check_ip(ip)) for ip in ip_list]
+        keep(ip, details)
+        return ip
 
     try:
-        for task in asyncio.as_completed(tasks):
-            if progress.get("cancel"):
-                should_stop = True
-                print("[!] Cancel requested. Stopping early...")
-                break
-
-            ip = await task
-            progress["done"] += 1
-
-            if ip:
-                clean_ips.append(ip)
-                progress["results"].append(ip)
-                if len(clean_ips) >= max_needed:
-                    should_stop = True
-                    print("[√] Enough clean IPs found. Stopping early.")
-                    break
+        await run_worker_pool(
+            candidates(),
+            check_ip,
+            concurrency=concurrency,
+            progress=progress,
+            max_results=max_needed,
+            controller=controller,
+        )
     finally:
-        # اطمینان از اینکه همه taskهای باقی‌مانده کنسل شوند
-        for t in tasks:
-            if not t.done():
-                t.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
-
-    # مرتب‌سازی بر اساس latency
-    clean_ips = sorted(clean_ips, key=lambda ip: ping_latency(ip))[:required_count]
+        store.flush()
+        if sampler is not None:
+            store.record_subnets(provider, sampler.stats())
 
-    return clean_ips
+    # رتبه‌بندی نهایی بدون پینگ اضافه (داده‌ها حین اسکن جمع شده‌اند)
+    # Final ranking is an in-memory sort; latency was captured during the scan
+    return [ip for _, ip in sorted(best, reverse=True)]
 
 
 async def scan_manual_ips(
     ips: List[str],
     provider: str,
     use_tls_check: bool = True,
-    concurrency: int = 20
+    concurrency: int = 20,
+    verdict_ttl: float = DEFAULT_VERDICT_TTL,
+    adaptive: bool = True,
+    ping_mode: str = "required",
+    rejected: Optional[List[str]] = None,
 ) -> List[str]:
     """
     اسکن دستی لیست IP برای تعیین تمیز بودن
-    Manual scan of IP list for validity
+    Manual scan of IP list for validity. Items may be single IPs or CIDRs;
+    they are merged into one interval set, so duplicates are checked once.
+    Items are taken in order up to MANUAL_MAX_ADDRESSES addresses in
+    total; the ones that would exceed it are skipped and appended to
+    `rejected` when a list is given.
     """
-    clean = []
-    sem = asyncio.Semaphore(concurrency)
-    scanner = IPCleanScanner(concurrency)
+    controller = AdaptiveController(concurrency, adaptive=adaptive)
+    scanner = IPCleanScanner(concurrency, controller=controller)
+    pipeline = build_ip_pipeline(
+        provider, use_tls_check=use_tls_check, check_port=False, ping_mode=ping_mode, controller=controller
+    )
+    profile = pipeline.profile(implied=("tcp",))
+    targets = IntervalSet()
+    room = MANUAL_MAX_ADDRESSES
+    for item in ips:
+        size = IntervalSet([item]).count()
+        if size > room:
+            scan_log.warning("Skipping %s: over the %d-address manual scan limit", item, MANUAL_MAX_ADDRESSES)
+            if rejected is not None:
+                rejected.append(item)
+            continue
+        targets.add(item)
+        room -= size
+    for item in targets.invalid:
+        scan_log.warning("Invalid IP %s", item)
+
+    store = get_verdict_store()
 
     async def check_ip(ip: str) -> Optional[str]:
-        async with sem:
-            alive = await scanner.check_ip_async(ip)
-            if not alive:
-                return None
-            clean_ip = await is_ip_clean(ip, provider, use_tls_check=use_tls_check)
-            if clean_ip:
-                return ip
-            return None
+        if verdict_ttl:
+            cached = store.get(provider, ip, verdict_ttl, profile=profile)
+            if cached is not None:
+                return ip if cached["clean"] else None
+        details = {}
+        alive = await scanner.check_ip_async(ip, details=details)
+        clean = bool(alive) and await is_ip_clean(ip, provider, details=details, pipeline=pipeline)
+        if verdict_ttl:
+            store.record(provider, ip, clean, details, profile=profile)
+        return ip if clean else None
 
-    tasks = [asyncio.create_task(check_ip(ip)) for ip in ips]
-    for task in asyncio.as_completed(tasks):
-        result = await task
-        if result:
-            clean.append(result)
-    return clean
+    addresses = itertools.chain.from_iterable(
+        iter_addresses(targets.intervals(version), version=version, shuffle=False)
+        for version in (4, 6)
+    )
+    try:
+        return await run_worker_pool(
+            addresses, check_ip, concurrency=concurrency, controller=controller
+        )
+    finally:
+        store.flush()
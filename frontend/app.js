@@ -28,8 +28,14 @@ const progressPercent = document.getElementById("progress-percent");
 // انتخاب‌کننده تعداد IP تمیز لازم (اگر دارید، مقدار پیش‌فرض 2)
 const requiredIpCountInput = document.getElementById("required-ip-count");
 
-let autoScanInterval = null;
-let ipScanInterval = null;
+// جریان رویداد (SSE) پیشرفت اسکن‌ها به جای polling
+let autoScanSource = null;
+let ipScanSource = null;
+// شناسه اسکن جاری هر بخش (برای دریافت پیشرفت و لغو همان اسکن)
+let autoJobId = null;
+let ipJobId = null;
+let autoResults = [];
+let ipResults = [];
 
 // دریافت موقعیت کاربر و هشدار غیر ایران
 async function detectUserLocation() {
@@ -97,9 +103,11 @@ async function startAutoScan() {
     const data = await res.json();
     if (data.status === "started") {
       autoStatus.textContent = "وضعیت: در حال اسکن...";
-      autoScanInterval = setInterval(fetchAutoScanProgress, 2000);
+      autoResults = [];
+      autoJobId = data.job_id;
+      autoScanSource = openProgressStream(autoJobId, onAutoScanProgress, onAutoScanEnd, onAutoScanError);
     } else {
-      throw new Error("اسکن قبلاً در حال انجام است");
+      throw new Error("پاسخ نامعتبر از سرور");
     }
   } catch (e) {
     alert("خطا در شروع اسکن: " + e.message);
@@ -109,58 +117,46 @@ async function startAutoScan() {
   }
 }
 
-async function fetchAutoScanProgress() {
-  try {
-    const res = await fetch(`${BASE_URL}/clean-items/auto/progress?type=reality`);
-    if (!res.ok) throw new Error("دریافت وضعیت اسکن ناموفق بود");
-    const data = await res.json();
+function onAutoScanProgress(data, newResults, reset) {
+  let percent = 0;
+  if (data.total && data.total > 0) {
+    percent = Math.min(100, Math.round((data.done / data.total) * 100));
+  }
 
-    let percent = 0;
-    if (data.total && data.total > 0) {
-      percent = Math.min(100, Math.round((data.done / data.total) * 100));
-    }
+  showProgress(percent);
 
-    showProgress(percent);
+  // فقط دامنه‌های جدید به لیست اضافه می‌شوند
+  if (reset) autoResults = [];
+  appendResults(domainList, autoResults, newResults, "<li>هنوز دامنه‌ای پاک یافته نشده است.</li>");
 
-    autoStatus.textContent = `وضعیت: ${data.running ? "در حال اسکن" : "پایان یافته"} - دامنه‌های پاک: ${data.results_count} از ${data.total}`;
+  autoStatus.textContent = `وضعیت: ${data.running ? "در حال اسکن" : "پایان یافته"} - دامنه‌های پاک: ${autoResults.length} از ${data.total}${adaptiveLabel(data)}`;
+}
 
-    // نمایش دامنه‌ها
-    domainList.innerHTML = "";
-    if (data.results && data.results.length > 0) {
-      data.results.forEach(domain => {
-        const li = document.createElement("li");
-        li.textContent = domain;
-        domainList.appendChild(li);
-      });
-    } else {
-      domainList.innerHTML = "<li>هنوز دامنه‌ای پاک یافته نشده است.</li>";
-    }
-    updateDownloadBtnState();
+function onAutoScanEnd(data, results) {
+  autoResults = [];
+  appendResults(domainList, autoResults, results, "<li>هنوز دامنه‌ای پاک یافته نشده است.</li>");
 
-    if (!data.running) {
-      clearInterval(autoScanInterval);
-      autoBtn.disabled = false;
-      cancelBtn.disabled = true;
-      showProgress(100);
+  autoBtn.disabled = false;
+  cancelBtn.disabled = true;
+  showProgress(100);
 
-      autoStatus.textContent = data.cancel
-        ? `وضعیت: اسکن اتوماتیک لغو شد - دامنه‌های پاک: ${data.results_count}`
-        : `وضعیت: اسکن اتوماتیک پایان یافت - دامنه‌های پاک: ${data.results_count}`;
-    }
-  } catch (e) {
-    clearInterval(autoScanInterval);
-    alert("خطا در دریافت وضعیت اسکن: " + e.message);
-    autoStatus.textContent = "وضعیت: خطا در دریافت وضعیت اسکن";
-    autoBtn.disabled = false;
-    cancelBtn.disabled = true;
-    resetProgress();
-  }
+  autoStatus.textContent = data.cancel
+    ? `وضعیت: اسکن اتوماتیک لغو شد - دامنه‌های پاک: ${autoResults.length}`
+    : `وضعیت: اسکن اتوماتیک پایان یافت - دامنه‌های پاک: ${autoResults.length}`;
+}
+
+function onAutoScanError() {
+  alert("خطا در دریافت وضعیت اسکن");
+  autoStatus.textContent = "وضعیت: خطا در دریافت وضعیت اسکن";
+  autoBtn.disabled = false;
+  cancelBtn.disabled = true;
+  resetProgress();
 }
 
 async function cancelAutoScan() {
   cancelBtn.disabled = true;
   try {
-    await fetch(`${BASE_URL}/clean-items/auto/cancel?type=reality`, { method: "POST" });
+    await fetch(`${BASE_URL}/jobs/${autoJobId}/cancel`, { method: "POST" });
     resetProgress();
   } catch (e) {
     alert("خطا در لغو اسکن: " + e.message);
@@ -211,11 +207,13 @@ async function startIPAutoScan() {
   const provider = ipTypeSelect.value;
   const ipCountInput = document.getElementById("ip-count-input");
   const useTLSCheckbox = document.getElementById("use-tls-check");  // 👈 اضافه شد
+  const includeIPv6Checkbox = document.getElementById("include-ipv6");
 
   let requiredCount = parseInt(ipCountInput?.value);
   if (isNaN(requiredCount) || requiredCount <= 0) requiredCount = 2;
 
   const useTLSCheck = useTLSCheckbox?.checked ? "true" : "false";  // 👈 مقدار واقعی
+  const includeIPv6 = includeIPv6Checkbox?.checked ? "true" : "false";
 
   autoStatus.style.display = "none";
   ipStatus.style.display = "block";
@@ -229,13 +227,20 @@ async function startIPAutoScan() {
   try {
     // ارسال پارامتر تعداد IP تمیز مورد نیاز به API (مثلا به صورت کوئری‌استرینگ)
     const res = await fetch(
-      `${BASE_URL}/clean-items/auto/start?type=${provider}&required_count=${requiredCount}&use_tls_check=${useTLSCheck}`
+      `${BASE_URL}/clean-items/auto/start?type=${provider}&required_count=${requiredCount}&use_tls_check=${useTLSCheck}&include_ipv6=${includeIPv6}`
     );  // 👈 استفاده از مقدار درست
     const data = await res.json();
     if (data.status === "started") {
-      ipScanInterval = setInterval(() => fetchIPAutoProgress(provider), 2000);
+      ipResults = [];
+      ipJobId = data.job_id;
+      ipScanSource = openProgressStream(
+        ipJobId,
+        (progress, newResults, reset) => onIPAutoProgress(provider, progress, newResults, reset),
+        onIPAutoEnd,
+        onIPAutoError
+      );
     } else {
-      throw new Error("اسکن قبلاً در حال انجام است");
+      throw new Error("پاسخ نامعتبر از سرور");
     }
   } catch (e) {
     alert("خطا در شروع اسکن IP: " + e.message);
@@ -246,52 +251,43 @@ async function startIPAutoScan() {
 }
 
 
-async function fetchIPAutoProgress(provider) {
-  try {
-    const res = await fetch(`${BASE_URL}/clean-items/auto/progress?type=${provider}`);
-    const data = await res.json();
+function onIPAutoProgress(provider, data, newResults, reset) {
+  let percent = 0;
+  if (data.total && data.total > 0) {
+    percent = Math.min(100, Math.round((data.done / data.total) * 100));
+  }
 
-    let percent = 0;
-    if (data.total && data.total > 0) {
-      percent = Math.min(100, Math.round((data.done / data.total) * 100));
-    }
+  showProgress(percent);
 
-    showProgress(percent);
+  if (reset) ipResults = [];
+  appendResults(ipList, ipResults, newResults, "<li>هنوز IP پاک یافته نشده است .</li>");
 
-    const providerLabel = provider === "fastly" ? "فستلی" : provider === "cloudflare" ? "کلودفلر" : "نامشخص";
-    ipStatus.textContent = `وضعیت: ${data.running ? "در حال اسکن" : "پایان یافته"} - IPهای پاک ${providerLabel}: ${data.results_count} از ${data.total}`;
+  const providerLabel = provider === "fastly" ? "فستلی" : provider === "cloudflare" ? "کلودفلر" : "نامشخص";
+  ipStatus.textContent = `وضعیت: ${data.running ? "در حال اسکن" : "پایان یافته"} - IPهای پاک ${providerLabel}: ${ipResults.length} از ${data.total}${adaptiveLabel(data)}`;
+}
 
-    ipList.innerHTML = "";
-    if (data.results?.length > 0) {
-      data.results.forEach(ip => {
-        const li = document.createElement("li");
-        li.textContent = ip;
-        ipList.appendChild(li);
-      });
-    } else {
-      ipList.innerHTML = "<li>هنوز IP پاک یافته نشده است .</li>";
-    }
-    updateDownloadBtnState();
+function onIPAutoEnd(data, results) {
+  // در پایان، لیست رتبه‌بندی‌شده (کمترین تأخیر) جایگزین نتایج موقت می‌شود
+  ipResults = [];
+  appendResults(ipList, ipResults, results, "<li>هنوز IP پاک یافته نشده است .</li>");
 
-    if (!data.running) {
-      clearInterval(ipScanInterval);
-      ipAutoBtn.disabled = false;
-      ipCancelBtn.disabled = true;
-      showProgress(100);
-    }
-  } catch (e) {
-    alert("خطا در دریافت وضعیت IP: " + e.message);
-    clearInterval(ipScanInterval);
-    resetProgress();
-  }
+  ipAutoBtn.disabled = false;
+  ipCancelBtn.disabled = true;
+  showProgress(100);
+}
+
+function onIPAutoError() {
+  alert("خطا در دریافت وضعیت IP");
+  ipAutoBtn.disabled = false;
+  ipCancelBtn.disabled = true;
+  resetProgress();
 }
 
 
 async function cancelIPScan() {
   ipCancelBtn.disabled = true;
-  const provider = ipTypeSelect.value;
   try {
-    await fetch(`${BASE_URL}/clean-items/auto/cancel?type=${provider}`, { method: "POST" });
+    await fetch(`${BASE_URL}/jobs/${ipJobId}/cancel`, { method: "POST" });
   } catch (e) {
     alert("خطا در لغو اسکن IP: " + e.message);
   }
@@ -343,6 +339,57 @@ async function manualIPScan() {
 
 // --- ابزارهای مشترک ---
 
+// اتصال به جریان SSE پیشرفت: فقط نتایج جدید و شمارنده‌های تغییرکرده دریافت می‌شوند
+function openProgressStream(jobId, onProgress, onEnd, onError) {
+  const source = new EventSource(`${BASE_URL}/clean-items/auto/stream?job_id=${jobId}`);
+  const counters = { total: 0, done: 0, skipped: 0, cancel: false, running: true };
+
+  source.addEventListener("progress", (event) => {
+    const { results, cursor, reset, ...changed } = JSON.parse(event.data);
+    Object.assign(counters, changed);
+    onProgress(counters, results || [], Boolean(reset));
+  });
+
+  source.addEventListener("end", (event) => {
+    source.close();
+    onEnd(counters, JSON.parse(event.data).results || []);
+  });
+
+  // EventSource خودش دوباره وصل می‌شود؛ فقط قطع دائمی خطا است
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) onError();
+  };
+
+  return source;
+}
+
+// نمایش تصمیم فعلی کنترل‌کننده تطبیقی (همزمانی و timeout اتصال)
+function adaptiveLabel(data) {
+  const adaptive = data.adaptive;
+  if (!adaptive) return "";
+  return ` - همزمانی: ${adaptive.limit} (timeout اتصال: ${adaptive.timeouts.tcp}s)`;
+}
+
+function closeProgressStreams() {
+  if (autoScanSource) autoScanSource.close();
+  if (ipScanSource) ipScanSource.close();
+  autoScanSource = null;
+  ipScanSource = null;
+}
+
+// افزودن نتایج جدید به انتهای لیست (بدون رسم دوباره کل لیست)
+function appendResults(listElement, allResults, newResults, emptyHTML) {
+  if (allResults.length === 0) listElement.innerHTML = "";
+  newResults.forEach(item => {
+    const li = document.createElement("li");
+    li.textContent = item;
+    listElement.appendChild(li);
+  });
+  allResults.push(...newResults);
+  if (allResults.length === 0) listElement.innerHTML = emptyHTML;
+  updateDownloadBtnState();
+}
+
 function showProgress(percent) {
   progressContainer.style.display = "block";
   progressPercent.style.display = "block";
@@ -351,8 +398,7 @@ function showProgress(percent) {
 }
 
 function resetProgress() {
-  clearInterval(autoScanInterval);
-  clearInterval(ipScanInterval);
+  closeProgressStreams();
   progressBar.style.width = "0%";
   progressContainer.style.display = "none";
   progressPercent.style.display = "none";
@@ -0,0 +1,24 @@
+import asyncio
+
+from backend.pipeline import CheckPipeline
+from backend.utils import is_ip_clean
+
+
+def latency(details):
+    assert asyncio.run(is_ip_clean("192.0.2.1", "fastly", details=details, pipeline=CheckPipeline([])))
+    return details["latency"]
+
+
+def test_latency_stats_use_ping_samples_only():
+    stats = latency({"ping_ms": [10.0, 12.0, 11.0], "tcp_ms": 50.0, "tls": {"connect_ms": 60.0}})
+    assert stats["source"] == "ping"
+    assert stats["samples"] == 3
+    assert stats["median_ms"] == 11.0
+    assert stats["jitter_ms"] == 1.5
+
+
+def test_latency_stats_fall_back_to_tcp_connect():
+    stats = latency({"tcp_ms": 50.0, "tls": {"connect_ms": 60.0}})
+    assert stats["source"] == "tcp"
+    assert stats["median_ms"] == 50.0
+    assert stats["jitter_ms"] == 0.0
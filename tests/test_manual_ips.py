@@ -0,0 +1,41 @@
+import asyncio
+
+from backend import store as store_module
+from backend import utils
+from backend.store import VerdictStore
+
+
+def test_oversized_manual_prefixes_are_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "_store", VerdictStore(str(tmp_path / "verdicts.sqlite3")))
+    checked = []
+
+    async def check_ip_async(self, ip, details=None):
+        checked.append(ip)
+        return None
+
+    monkeypatch.setattr(utils.IPCleanScanner, "check_ip_async", check_ip_async)
+    monkeypatch.setattr(utils, "MANUAL_MAX_ADDRESSES", 8)
+    rejected = []
+    items = ["2606:4700::/32", "192.0.2.0/30", "10.0.0.0/8", "192.0.2.8/30", "192.0.2.16/30"]
+    results = asyncio.run(utils.scan_manual_ips(items, "fastly", ping_mode="off", rejected=rejected))
+    assert results == []
+    assert rejected == ["2606:4700::/32", "10.0.0.0/8", "192.0.2.16/30"]
+    assert len(checked) == 8
+
+
+def test_zero_verdict_ttl_bypasses_the_store(tmp_path, monkeypatch):
+    verdicts = VerdictStore(str(tmp_path / "verdicts.sqlite3"))
+    monkeypatch.setattr(store_module, "_store", verdicts)
+
+    async def check_ip_async(self, ip, details=None):
+        return None
+
+    monkeypatch.setattr(utils.IPCleanScanner, "check_ip_async", check_ip_async)
+
+    def stored() -> int:
+        return verdicts._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    asyncio.run(utils.scan_manual_ips(["192.0.2.1"], "fastly", ping_mode="off", verdict_ttl=0))
+    assert stored() == 0
+    asyncio.run(utils.scan_manual_ips(["192.0.2.1"], "fastly", ping_mode="off"))
+    assert stored() == 1
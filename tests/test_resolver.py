@@ -0,0 +1,25 @@
+import asyncio
+
+from backend.resolver import DNSCache
+
+
+def test_canceled_caller_does_not_cancel_shared_lookup():
+    async def main():
+        resolver = DNSCache()
+
+        async def lookup(host):
+            await asyncio.sleep(0.1)
+            return ["192.0.2.1"]
+
+        resolver._lookup = lookup
+        first = asyncio.ensure_future(resolver.resolve("example.com"))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(resolver.resolve("example.com"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == ["192.0.2.1"]
+        assert first.cancelled()
+        assert await resolver.resolve("example.com") == ["192.0.2.1"]
+        assert resolver.misses == 1
+
+    asyncio.run(main())
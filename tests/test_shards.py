@@ -0,0 +1,20 @@
+import asyncio
+
+from backend.shards import run_sharded_scan, scan_domains_sharded, scan_ips_sharded
+from backend.targets import IntervalSet
+
+
+class FixedLimiter:
+    def share(self) -> int:
+        return 10
+
+
+def test_empty_targets_spawn_no_shards():
+    async def main():
+        state = {"limiter": FixedLimiter()}
+        assert await scan_domains_sharded([], 2, state) == []
+        assert await scan_ips_sharded("fastly", IntervalSet(), 2, state) == []
+        assert await run_sharded_scan("reality", [], state, {}) == []
+        assert "shards" not in state
+
+    asyncio.run(main())
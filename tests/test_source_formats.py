@@ -0,0 +1,28 @@
+import pytest
+
+from backend.source_formats import is_valid_hostname
+
+
+@pytest.mark.parametrize("name", [
+    "example.com",
+    "www.example.co.uk",
+    "example.com.",
+    "xn--80aswg.xn--p1ai",
+    "sub.example.xn--90ais",
+])
+def test_valid_hostnames(name):
+    assert is_valid_hostname(name)
+
+
+@pytest.mark.parametrize("name", [
+    "",
+    "localhost",
+    "example.123",
+    "-bad.com",
+    "bad-.com",
+    "example.xn--",
+    "1.2.3.4",
+    "a" * 64 + ".com",
+])
+def test_invalid_hostnames(name):
+    assert not is_valid_hostname(name)
@@ -0,0 +1,80 @@
+import socket
+import asyncio
+
+import pytest
+
+from backend import store as store_module
+from backend import ownership
+from backend.ownership import PrefixIndex, register_networks
+from backend.store import VerdictStore, profile_covers
+from backend.utils import scan_manual_ips
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    verdicts = VerdictStore(str(tmp_path / "verdicts.sqlite3"))
+    monkeypatch.setattr(store_module, "_store", verdicts)
+    # ایندکس مالکیت جدا تا رنج‌های ثبت‌شده در تست به بیرون نشت نکنند
+    # A private ownership index, so ranges registered by a test don't leak
+    monkeypatch.setattr(ownership, "_index", PrefixIndex())
+    return verdicts
+
+
+def test_profile_covers():
+    assert profile_covers("owner,tcp,tls", "owner,tcp")
+    assert profile_covers("owner,tcp", "owner,tcp")
+    assert not profile_covers("owner,tcp", "owner,tcp,tls")
+    assert profile_covers("owner", "")
+
+
+def test_clean_verdict_reused_only_by_relaxed_profiles(store):
+    store.record("fastly", "10.0.0.1", True, {"tcp_ms": 1.0}, profile="owner,tcp")
+    store.flush()
+    assert store.get("fastly", "10.0.0.1", profile="owner,tcp")["clean"]
+    assert store.get("fastly", "10.0.0.1", profile="owner") is not None
+    assert store.get("fastly", "10.0.0.1", profile="owner,tcp,tls") is None
+    assert [k["target"] for k in store.known_clean("fastly", profile="owner,tcp")] == ["10.0.0.1"]
+    assert store.known_clean("fastly", profile="owner,tcp,tls") == []
+
+
+def test_failed_verdict_reused_only_by_strict_profiles(store):
+    store.record("fastly", "10.0.0.2", False, profile="owner,tcp")
+    store.flush()
+    assert not store.get("fastly", "10.0.0.2", profile="owner,tcp,tls")["clean"]
+    assert store.get("fastly", "10.0.0.2", profile="owner") is None
+
+
+def test_failed_verdict_expires_before_clean_one(store):
+    store.record("fastly", "10.0.0.3", False, profile="owner,tcp")
+    store.record("fastly", "10.0.0.4", True, profile="owner,tcp")
+    store.flush()
+    assert store.get("fastly", "10.0.0.3", profile="owner,tcp") is not None
+    # هر دو نتیجه ۲۰ دقیقه قبل ثبت شده‌اند
+    # Both verdicts recorded 20 minutes ago
+    store._db.execute("UPDATE verdicts SET checked_at = checked_at - 1200")
+    assert store.get("fastly", "10.0.0.3", profile="owner,tcp") is None
+    assert store.get("fastly", "10.0.0.4", profile="owner,tcp")["clean"]
+
+
+def test_relaxed_scan_verdict_not_reused_by_strict_scan(store):
+    # شنونده TCP ساده روی 443: بدون TLS تمیز، با TLS رد می‌شود
+    # A plain TCP listener on 443: clean without TLS, rejected with it
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        listener.bind(("127.0.0.1", 443))
+    except OSError:
+        pytest.skip("port 443 is not bindable")
+    listener.listen(16)
+    register_networks("fastly", ["127.0.0.0/24"])
+    try:
+        relaxed = asyncio.run(scan_manual_ips(
+            ["127.0.0.1"], "fastly", use_tls_check=False, ping_mode="off", adaptive=False,
+        ))
+        strict = asyncio.run(scan_manual_ips(
+            ["127.0.0.1"], "fastly", use_tls_check=True, ping_mode="off", adaptive=False,
+        ))
+    finally:
+        listener.close()
+    assert relaxed == ["127.0.0.1"]
+    assert strict == []
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from backend.utils import run_worker_pool
+
+
+async def passthrough(target):
+    return target
+
+
+def test_worker_pool_collects_results():
+    results = asyncio.run(run_worker_pool([str(i) for i in range(10)], passthrough, concurrency=3))
+    assert sorted(results, key=int) == [str(i) for i in range(10)]
+
+
+def test_failing_targets_raise_instead_of_hanging():
+    def targets():
+        yield "a"
+        raise RuntimeError("source broke")
+
+    async def main():
+        await asyncio.wait_for(run_worker_pool(targets(), passthrough, concurrency=3), 3)
+
+    with pytest.raises(RuntimeError, match="source broke"):
+        asyncio.run(main())